@@ -0,0 +1,199 @@
+"""
+End-to-end benchmark of the alert pipeline run by check_aurora_alerts, stage by stage, on synthetic data.
+Each run is a real alerts.sweep_subscriptions against a stub sender; the stages are its own metric timers.
+
+For every population size a SQLite database of synthetic subscribers is built once (and kept in --data-dir);
+every scenario then runs against a fresh copy of it, so alerts written back by one run do not suppress the next.
+Results are printed (or written to --output) as JSON, one entry per scenario and population, with the best time
+of each stage over --repeat runs.
+
+    python -m benchmarks.alert_pipeline --subscribers 10000 100000 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence, Tuple
+from unittest import mock
+
+import numpy as np
+from loguru import logger
+from src.backend import alerts, db
+from src.backend.metrics import DB_WRITE_SECONDS, SWEEP_STAGE_SECONDS
+from src.backend.notifier import build_digest_message
+from src.backend.ovation_grid import OvationGrid
+from src.backend.storage import SweepState
+
+from .synthetic import SCENARIOS, iter_subscription_rows, make_grid, make_payload
+
+POPULATIONS = (10_000, 100_000, 1_000_000)
+SWEEP_STAGES = ("load", "evaluate", "alert_load", "dispatch")  # SWEEP_STAGE_SECONDS labels
+WRITEBACK_OPERATIONS = ("mark_pending", "update_last_alert_sent", "save_sweep_state", "clear_pending")
+STAGES = ("fetch_parse",) + SWEEP_STAGES + ("writeback",)
+STUB_SENDER = "alerts@aurora-pulse.test"
+
+
+def stub_send_digests(digests: Sequence[Tuple[str, str, Sequence[Tuple[str, float]]]]) -> List[bool]:
+    """
+    notifier.send_digests without SMTP: every message is rendered to wire bytes, then dropped.
+    """
+    for email, name, locations in digests:
+        build_digest_message(STUB_SENDER, email, name, locations)
+    return [True] * len(digests)
+
+
+def stage_seconds() -> Dict[str, float]:
+    """
+    Seconds recorded so far by the stage timers inside the sweep, the DB writes summed up as writeback.
+    """
+    seconds = {stage: SWEEP_STAGE_SECONDS.total(stage=stage) for stage in SWEEP_STAGES}
+    seconds["writeback"] = sum(DB_WRITE_SECONDS.total(operation=operation) for operation in WRITEBACK_OPERATIONS)
+    return seconds
+
+
+def build_population(count: int, data_dir: str, seed: int = 0) -> str:
+    """
+    Path of a SQLite database holding count synthetic subscribers, created on first use.
+    """
+    path = os.path.join(data_dir, f"subscribers_{count}_{seed}.db")
+    if os.path.exists(path):
+        return path
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db.DB_PATH = tmp_path
+    start = time.perf_counter()
+    db.bulk_load_subscriptions(iter_subscription_rows(count, seed=seed))
+    # Closing checkpoints the WAL into the database file, so the file alone can be copied
+    db.close_connections()
+    os.replace(tmp_path, path)
+    print(f"Built {count} synthetic subscribers in {time.perf_counter() - start:.1f}s ({path})", file=sys.stderr)
+    return path
+
+
+def run_pipeline(payload: bytes) -> Tuple[Dict[str, float], Dict[str, int]]:
+    """
+    One first sweep of every subscription in the current database against payload, through the
+    alerts.sweep_subscriptions run by check_aurora_alerts with send_digests replaced by stub_send_digests.
+    The stages are read from the timers inside it. Returns (seconds per stage, counts).
+    """
+    start = time.perf_counter()
+    grid = OvationGrid.from_payload(json.loads(payload), resample=True)
+    seconds = {"fetch_parse": time.perf_counter() - start}
+
+    emails = []
+
+    def send_digests(digests):
+        emails.append(len(digests))
+        return stub_send_digests(digests)
+
+    before = stage_seconds()
+    # A first sweep (no previous grid): every subscription in an active tile is a candidate
+    with mock.patch.object(alerts, "send_digests", send_digests):
+        result = alerts.sweep_subscriptions(grid, SweepState(), max_id=db.get_max_subscription_id(), checkpoint=True)
+    seconds.update({stage: elapsed - before[stage] for stage, elapsed in stage_seconds().items()})
+
+    counts = {
+        "candidates": result.scanned,
+        "alerted": result.alerted,
+        "delivered": result.delivered,
+        "emails": sum(emails),
+    }
+    return seconds, counts
+
+
+def benchmark(
+    populations: Sequence[int] = POPULATIONS,
+    scenarios: Sequence[str] = tuple(SCENARIOS),
+    repeat: int = 3,
+    data_dir: str = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Run the pipeline for every population and scenario and return the JSON-serialisable report.
+    """
+    data_dir = data_dir or tempfile.mkdtemp(prefix="aurora-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    payloads = {scenario: make_payload(make_grid(scenario, seed=seed)) for scenario in scenarios}
+    original_db_path = db.DB_PATH
+
+    results = []
+    try:
+        for count in populations:
+            template = build_population(count, data_dir, seed=seed)
+            for scenario in scenarios:
+                runs = []
+                for _ in range(repeat):
+                    work_path = os.path.join(data_dir, "run.db")
+                    shutil.copyfile(template, work_path)
+                    db.DB_PATH = work_path
+                    runs.append(run_pipeline(payloads[scenario]))
+                    db.close_connections()
+                    os.remove(work_path)
+
+                stages = {stage: min(seconds[stage] for seconds, _ in runs) for stage in STAGES}
+                result = {
+                    "scenario": scenario,
+                    "subscribers": count,
+                    "runs": repeat,
+                    "stages": stages,
+                    "total": min(sum(seconds.values()) for seconds, _ in runs),
+                    "counts": runs[0][1],
+                }
+                print(f"{scenario} x {count}: {result['total'] * 1000:.1f} ms {result['counts']}", file=sys.stderr)
+                results.append(result)
+    finally:
+        db.close_connections()
+        db.DB_PATH = original_db_path
+
+    return {"metadata": _metadata(seed), "results": results}
+
+
+def _metadata(seed: int) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "seed": seed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--subscribers", type=int, nargs="+", default=list(POPULATIONS))
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario; the best time of each stage is kept")
+    parser.add_argument("--data-dir", help="where synthetic databases are kept between invocations (default: temp)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    # Per-subscription log lines would dominate the timings
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    report = benchmark(args.subscribers, args.scenarios, args.repeat, args.data_dir, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Per-message CPU time and allocations of rendering alert emails: the email package's MIME objects against the
+compiled templates the notifier sends.
+
+Recipients are drawn from the synthetic subscriber population, so names vary per message while cities repeat the
+way they do in a real sweep. Results are printed (or written to --output) as JSON.
+
+    python -m benchmarks.notifier_render --messages 10000
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from src.backend import email_template
+from src.backend.notifier import build_alert_email, build_alert_message, build_email_message
+
+from .alert_pipeline import STUB_SENDER, _metadata
+from .synthetic import iter_subscription_rows
+
+Notification = Tuple[str, str, str, float]
+
+
+def _render_mime(notification: Notification) -> bytes:
+    email, name, city, aurora_value = notification
+    return build_email_message(STUB_SENDER, email, *build_alert_email(name, city, aurora_value)).as_bytes()
+
+
+def _render_compiled(notification: Notification) -> bytes:
+    return build_alert_message(STUB_SENDER, *notification).data
+
+
+RENDERERS: Dict[str, Callable[[Notification], bytes]] = {"mime": _render_mime, "compiled": _render_compiled}
+
+
+def make_notifications(count: int, seed: int = 0) -> List[Notification]:
+    """
+    Alerts for `count` synthetic subscribers, each at a random intensity between its threshold and 9.
+    """
+    rng = random.Random(seed)
+    return [
+        (email, name, city, rng.randint(threshold, 9))
+        for email, name, _, _, city, threshold in iter_subscription_rows(count, seed=seed)
+    ]
+
+
+def _clear_caches():
+    email_template._render_line.cache_clear()
+    email_template._encode_header.cache_clear()
+
+
+def measure(render: Callable[[Notification], bytes], notifications: List[Notification], repeat: int) -> dict:
+    """
+    Best time per message over `repeat` cold-cache runs, then allocations per message (traced separately, as
+    tracing slows rendering down).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        _clear_caches()
+        start = time.perf_counter()
+        for notification in notifications:
+            render(notification)
+        best = min(best, time.perf_counter() - start)
+
+    _clear_caches()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        sizes = [len(render(notification)) for notification in notifications]
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Memory still held after the run (for the compiled templates, mostly their memoized lines) and at its peak
+    stats = after.compare_to(before, "filename")
+    return {
+        "seconds_per_message": best / len(notifications),
+        "messages_per_second": len(notifications) / best,
+        "retained_bytes": sum(stat.size_diff for stat in stats),
+        "peak_traced_bytes": peak,
+        "message_bytes": sum(sizes) / len(sizes),
+    }
+
+
+def benchmark(messages: int, repeat: int = 3, seed: int = 0) -> dict:
+    notifications = make_notifications(messages, seed)
+    results = {name: measure(render, notifications, repeat) for name, render in RENDERERS.items()}
+    results["speedup"] = results["mime"]["seconds_per_message"] / results["compiled"]["seconds_per_message"]
+    return {"metadata": {**_metadata(seed), "messages": messages}, "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per renderer; the best time is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    text = json.dumps(benchmark(args.messages, args.repeat, args.seed), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark of the single-node parallel sweep: alert evaluation in-process against ParallelEvaluator pools.
+
+Synthetic subscribers are evaluated against an extreme-storm snapshot, as a full sweep would after a storm onset.
+"startup" is the first evaluation of a new pool, which starts it, and "seconds" the best time of an evaluation on
+the running pool, as a worker keeps it (see parallel_sweep.get_evaluator). "speedup" counts the startup, spread
+over the first `sweeps` sweeps of a worker: single * sweeps / (startup + seconds * (sweeps - 1)); "warm_speedup"
+leaves it out. Speedups depend on the cores of the machine, reported as cpu_count in the metadata.
+
+    python -m benchmarks.parallel_sweep --subscribers 1000000 --processes 2 4 8
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from src.backend.alerts import evaluate_alerts
+from src.backend.parallel_sweep import ParallelEvaluator
+
+from .alert_pipeline import _metadata
+from .replay import make_subscriptions
+from .synthetic import make_grid
+
+NOW = 1735693200  # 2025-01-01T01:00:00Z, after every synthetic last alert
+
+
+def measure(evaluate, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        evaluate()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(subscribers: int, processes=(2, 4, 8), repeat: int = 5, seed: int = 0, sweeps: int = 1) -> dict:
+    subs = make_subscriptions(subscribers, seed)
+    grid = make_grid("extreme", seed=seed)
+    expected = evaluate_alerts(grid.intensity_at_cells(subs["cell"]), subs, NOW)
+
+    single = measure(lambda: evaluate_alerts(grid.intensity_at_cells(subs["cell"]), subs, NOW), repeat)
+    results = {"single": {"seconds": single, "alerts": len(expected)}}
+    for count in processes:
+        with ParallelEvaluator(count, min_slice=1) as evaluator:
+            loaded = evaluator.load([subs])  # as sweep_parallel loads candidates, not timed in either case
+            start = time.perf_counter()
+            alert_ids, _ = evaluator.evaluate(grid, loaded, NOW)
+            startup = time.perf_counter() - start
+            seconds = measure(lambda: evaluator.evaluate(grid, loaded, NOW), repeat)
+            del loaded
+        assert np.array_equal(alert_ids, expected)
+        results[f"processes_{count}"] = {
+            "seconds": seconds,
+            "startup": startup,
+            "speedup": single * sweeps / (startup + seconds * (sweeps - 1)),
+            "warm_speedup": single / seconds,
+        }
+
+    metadata = {**_metadata(seed), "cpu_count": os.cpu_count(), "subscribers": subscribers, "sweeps": sweeps}
+    return {"metadata": metadata, "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=1_000_000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sweeps", type=int, default=1, help="sweeps the pool startup is spread over in speedup")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    text = json.dumps(benchmark(args.subscribers, args.processes, args.repeat, args.seed, args.sweeps), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
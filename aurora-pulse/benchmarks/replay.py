@@ -0,0 +1,99 @@
+"""
+Benchmark of the alert replay engine: a synthetic month of 5-minute OVATION snapshots against synthetic subscribers.
+
+The month is quiet except for a moderate storm around day 10 and an extreme one around day 15. Snapshots are
+generated a day at a time, outside the timings, and fed to AlertReplay as they would be read from the archive.
+
+    python -m benchmarks.replay --days 30 --subscribers 100000
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from src.backend.ovation_grid import cell_id
+from src.backend.replay import AlertReplay
+from src.backend.storage import SUBSCRIPTION_DTYPE
+
+from .alert_pipeline import _metadata
+from .synthetic import iter_subscription_rows, make_grid
+
+STEP_SECONDS = 5 * 60
+DAY_STEPS = 24 * 60 * 60 // STEP_SECONDS
+START = 1735689600  # 2025-01-01T00:00:00Z
+VARIANTS = 12  # noisy grids per scenario the snapshots are drawn from, so cells flicker across levels
+
+# Scenario of each day of the month not listed here: quiet
+STORM_DAYS = {9: "moderate", 10: "moderate", 14: "moderate", 15: "extreme", 16: "moderate"}
+
+
+def make_subscriptions(count: int, seed: int = 0) -> np.ndarray:
+    subs = np.zeros(count, dtype=SUBSCRIPTION_DTYPE)
+    for i, (_, _, lat, lon, _, threshold) in enumerate(iter_subscription_rows(count, seed=seed)):
+        subs[i] = (i + 1, cell_id(lat, lon), threshold, 0)
+    return subs
+
+
+def make_day(day: int, variants: dict, rng: np.random.Generator):
+    """
+    (times, grids) of one day's snapshots.
+    """
+    scenario = STORM_DAYS.get(day % 30, "quiet")
+    choice = rng.integers(0, VARIANTS, DAY_STEPS)
+    times = START + (day * DAY_STEPS + np.arange(DAY_STEPS)) * STEP_SECONDS
+    return times, variants[scenario][choice]
+
+
+def benchmark(days: int, subscribers: int, seed: int = 0) -> dict:
+    subs = make_subscriptions(subscribers, seed)
+    variants = {
+        scenario: np.stack([make_grid(scenario, seed=seed + i).intensity for i in range(VARIANTS)])
+        for scenario in {"quiet", *STORM_DAYS.values()}
+    }
+    rng = np.random.default_rng(seed)
+
+    start = time.perf_counter()
+    replay = AlertReplay(subs)
+    setup = time.perf_counter() - start
+    feed = 0.0
+    for day in range(days):
+        times, grids = make_day(day, variants, rng)
+        start = time.perf_counter()
+        replay.feed(times, grids)
+        feed += time.perf_counter() - start
+        print(f"day {day + 1}/{days}", file=sys.stderr)
+    start = time.perf_counter()
+    result = replay.result()
+    finish = time.perf_counter() - start
+
+    return {
+        "metadata": {**_metadata(seed), "days": days, "subscribers": subscribers},
+        "results": {
+            "snapshots": len(result.times),
+            "alerts": result.total,
+            "subscriptions_alerted": int(np.count_nonzero(result.alert_counts())),
+            "seconds": {"setup": setup, "feed": feed, "result": finish, "total": setup + feed + finish},
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--subscribers", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    text = json.dumps(benchmark(args.days, args.subscribers, args.seed), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import json
+from typing import Iterator
+
+import numpy as np
+from src.backend.ovation_grid import GRID_LONS, GRID_SHAPE, OvationGrid
+
+# Auroral oval of each scenario: peak OVATION intensity, magnetic latitude of the oval's center and its width
+SCENARIOS = {
+    "quiet": {"peak": 5, "center": 70, "width": 3},  # Kp 2: a thin oval over the polar regions
+    "moderate": {"peak": 12, "center": 64, "width": 5},  # Kp 5: over Iceland, Tromsø, Fairbanks
+    "extreme": {"peak": 30, "center": 52, "width": 10},  # Kp 9: reaching mid-latitude Europe and the US
+}
+
+FORECAST_TIME = "2025-01-01T00:30:00Z"
+
+
+def make_grid(scenario: str, seed: int = 0) -> OvationGrid:
+    """
+    Synthetic OVATION snapshot: a Gaussian oval in each hemisphere, brighter on the night side, with noise.
+    """
+    params = SCENARIOS[scenario]
+    rng = np.random.default_rng(seed)
+    lat = np.arange(-90, 91, dtype=np.float64)[:, None]
+    lon = np.arange(GRID_LONS, dtype=np.float64)[None, :]
+
+    oval = np.exp(-(((np.abs(lat) - params["center"]) / params["width"]) ** 2))
+    night_side = 0.65 + 0.35 * np.cos(np.radians(lon - 180))
+    noise = rng.normal(1, 0.1, GRID_SHAPE)
+    intensity = params["peak"] * oval * night_side * noise
+    return OvationGrid(np.clip(np.rint(intensity), 0, 255).astype(np.uint8), forecast_time=FORECAST_TIME)
+
+
+def make_payload(grid: OvationGrid) -> bytes:
+    """
+    The NOAA OVATION JSON response the grid would have come from ([lon, lat, intensity] rows, longitude-major).
+    """
+    lons, lats = np.meshgrid(np.arange(GRID_LONS), np.arange(-90, 91), indexing="ij")
+    values = grid.intensity[lats + 90, lons]
+    coordinates = np.column_stack([lons.ravel(), lats.ravel(), values.ravel()]).tolist()
+    return json.dumps(
+        {"Observation Time": grid.forecast_time, "Forecast Time": grid.forecast_time, "coordinates": coordinates}
+    ).encode()
+
+
+def iter_subscription_rows(count: int, seed: int = 0, chunk_size: int = 100_000) -> Iterator[tuple]:
+    """
+    (user_email, user_name, latitude, longitude, city, threshold) rows of count synthetic subscribers, spread
+    uniformly over the inhabited latitudes (-55..72) by area, with uniformly distributed Kp thresholds.
+    """
+    rng = np.random.default_rng(seed)
+    low, high = np.sin(np.radians(-55)), np.sin(np.radians(72))
+    for start in range(0, count, chunk_size):
+        n = min(chunk_size, count - start)
+        lat = np.degrees(np.arcsin(rng.uniform(low, high, n)))
+        lon = rng.uniform(-180, 180, n)
+        threshold = rng.integers(0, 10, n)
+        for i in range(n):
+            yield (
+                f"user{start + i}@example.com",
+                f"User {start + i}",
+                float(lat[i]),
+                float(lon[i]),
+                f"City {(start + i) % 5000}",
+                int(threshold[i]),
+            )
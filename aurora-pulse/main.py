@@ -1,18 +1,18 @@
 import folium
 import streamlit as st
-from geopy.extra.rate_limiter import RateLimiter
-from geopy.geocoders import Nominatim
-from loguru import logger
-from rq import Queue
 from src.backend.config import KP_TO_OVATION
-from src.backend.db import get_all_subscriptions, remove_subscription, save_subscription
-from src.backend.fetch_data import load_aurora_points
-from src.backend.nearest_neighbour import find_nearest_coord
-from src.backend.notifier import send_notification
-from src.backend.redis_handler.redis_conn import redis_conn
-from src.backend.redis_handler.rq_tasks import check_aurora_alerts
+from src.backend.gazetteer import UNKNOWN_LOCATION, reverse_geocode_city
+from src.backend.geocode_cache import get_geocode_cache
+from src.backend.redis_handler.rq_tasks import enqueue_subscription_check
+from src.frontend.resources import (
+    get_queue,
+    get_reverse_geocoder,
+    get_user_subscriptions,
+    remove_subscription,
+    render_map,
+    save_subscription,
+)
 from src.frontend.style import set_background
-from streamlit_folium import st_folium
 
 st.set_page_config(page_title="Aurora Pulse", page_icon="🌌", layout="centered")
 st.title("Aurora Pulse 🌌")
@@ -25,7 +25,7 @@ if not st.user.is_logged_in:
         st.login()
     st.stop()
 
-q = Queue("aurora", connection=redis_conn)
+q = get_queue()
 
 user_name = st.user.name or "Aurora Chaser"
 first_name = user_name.split()[0] if user_name else "Aurora Chaser"
@@ -33,7 +33,7 @@ email = st.user.email
 
 st.markdown(f"Welcome, {first_name}!")
 
-user_subs = [sub for sub in get_all_subscriptions() if sub.user_email == st.user.email]
+user_subs = get_user_subscriptions(st.user.email)
 
 # Show user info + logout
 with st.sidebar:
@@ -49,14 +49,13 @@ with st.sidebar:
                 st.write(f"⏱ Last Alert Sent: {sub.last_alert_sent or 'Never'}")
                 # Delete subscription
                 if st.button(f"❌ Remove {sub.city}", key=sub.id):
-                    remove_subscription(sub.id)
+                    remove_subscription(sub)
                     st.success(f"{sub.city} removed!")
     else:
         st.info("No subscriptions yet. Select a location to start receiving alerts.")
 
 # Reverse geocoder
-geolocator = Nominatim(user_agent="aurora_pulse_app")
-reverse = RateLimiter(geolocator.reverse, min_delay_seconds=1)
+reverse = get_reverse_geocoder()
 
 # Session state for user inputs
 if "coords" not in st.session_state:
@@ -84,7 +83,8 @@ if st.session_state.coords:
     ]
     zoom = 10
 
-m = folium.Map(location=center, zoom_start=zoom)
+# The base map is shared and cached; the selection marker is added on top of it
+selection = folium.FeatureGroup(name="Selection")
 
 # Add marker on click
 if st.session_state.coords:
@@ -94,35 +94,35 @@ if st.session_state.coords:
     #     location=center, popup=popup_text, icon=folium.CustomIcon("assets/aurora_icon.png", icon_size=(30, 30))
     # ).add_to(m)  # looks a little out of place
 
-    folium.Marker(location=center, popup=popup_text, icon=folium.Icon(color="darkblue", icon="info-sign")).add_to(m)
+    folium.Marker(location=center, popup=popup_text, icon=folium.Icon(color="darkblue", icon="info-sign")).add_to(
+        selection
+    )
 
-# Render map
-map_data = st_folium(m, width=725, height=400)
+# Render map; only clicks trigger a rerun, not panning or zooming
+map_data = render_map(
+    center=center,
+    zoom=zoom,
+    feature_group_to_add=selection,
+    returned_objects=["last_clicked"],
+    width=725,
+    height=400,
+)
 
-# Handle map click
-if map_data and map_data["last_clicked"]:
+# Handle map click (the cached map keeps reporting its last click, so only a new one is handled)
+if map_data and map_data["last_clicked"] and map_data["last_clicked"] != st.session_state.coords:
     clicked_lat = map_data["last_clicked"]["lat"]
     clicked_lng = map_data["last_clicked"]["lng"]
     st.session_state.coords = {"lat": clicked_lat, "lng": clicked_lng}
 
-    location = reverse((clicked_lat, clicked_lng), exactly_one=True, language="en")
-    address = location.raw.get("address", {}) if location else {}
-
-    # City fallbacks
-    city = (
-        address.get("city")
-        or address.get("town")
-        or address.get("village")
-        or address.get("hamlet")
-        or address.get("county")
-        or "Unknown location"
-    )
+    # Offline lookup in the bundled gazetteer; Nominatim is only asked far from any known city, and only once per
+    # rounded location
+    city = reverse_geocode_city(clicked_lat, clicked_lng, fallback=reverse, cache=get_geocode_cache())
     st.session_state.city = city
     st.session_state.toast_shown = False  # Reset toast for new selection
     st.rerun()
 
 if st.session_state.coords:
-    if st.session_state.city != "Unknown location":
+    if st.session_state.city != UNKNOWN_LOCATION:
         st.success(f"Selected Location: {st.session_state.city}")
     else:
         st.warning("Unknown Location selected!")
@@ -163,7 +163,7 @@ threshold = KP_TO_OVATION[kp_index]
 
 if st.button("Check Aurora", disabled=not st.session_state.coords):
     if st.session_state.city and email:
-        save_subscription(
+        sub_id = save_subscription(
             user_email=email,
             user_name=first_name,
             latitude=st.session_state.coords["lat"],
@@ -172,12 +172,9 @@ if st.button("Check Aurora", disabled=not st.session_state.coords):
             threshold=kp_index,
         )
 
-        # Enqueue background job for redis worker
-        q.enqueue(
-            check_aurora_alerts,
-            job_timeout=300,
-            result_ttl=0,
-        )
+        # Check just this subscription in the background; full sweeps are enqueued every SWEEP_WINDOW by the
+        # sweep scheduler (redis_handler.sweep_scheduler)
+        enqueue_subscription_check(q, sub_id)
 
         st.toast("✅ Subscription saved! We'll monitor auroras for you 🌌")
         st.success("You're subscribed, alerts will be sent automatically!")
@@ -0,0 +1,301 @@
+from dataclasses import astuple, dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from src.backend.config import KP_TO_OVATION, MIN_ALERT_GAP
+from src.backend.db import (
+    Subscription,
+    SweepState,
+    bulk_update_last_alert_sent,
+    clear_pending,
+    get_max_subscription_id,
+    get_subscription_columns,
+    get_subscriptions_by_ids,
+    iter_subscriptions,
+    load_sweep_state,
+    mark_pending,
+    save_sweep_state,
+    to_epoch,
+)
+from src.backend.metrics import ALERTS, ALERTS_DELIVERED, SUBSCRIPTIONS_SCANNED, SWEEP_STAGE_SECONDS
+from src.backend.notifier import send_digests
+from src.backend.ovation_grid import OvationGrid, tile_max
+
+# OVATION intensity required by each Kp threshold, indexed by Kp
+KP_OVATION_TABLE = np.array([KP_TO_OVATION[kp] for kp in range(len(KP_TO_OVATION))])
+ALERT_CHECKPOINT = 100  # alerts delivered as one batch between two persisted sweep cursors
+
+
+def evaluate_alerts(intensity, subs: np.ndarray, now_epoch: int, min_gap: int = MIN_ALERT_GAP) -> np.ndarray:
+    """
+    Decide which subscriptions should be alerted, for all of them at once.
+
+    Parameters:
+        intensity -- OVATION intensity nearest to each subscription (aligned with subs)
+        subs -- structured array of db.SUBSCRIPTION_DTYPE
+        now_epoch -- current time in epoch seconds (see db.to_epoch)
+        min_gap -- minimum seconds between two alerts for the same subscription
+    Returns:
+        IDs of the subscriptions to notify
+    """
+    return evaluate_due(intensity, subs, now_epoch, min_gap)[0]
+
+
+def evaluate_due(
+    intensity, subs: np.ndarray, now_epoch: int, min_gap: int = MIN_ALERT_GAP
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Same as evaluate_alerts, but also returns the IDs of the subscriptions over their threshold that are held back
+    by min_gap: (IDs to notify, IDs held back).
+    """
+    fire, hits, invalid = _alert_mask(intensity, subs, now_epoch, min_gap)
+    _record_evaluation(int(np.count_nonzero(fire)), int(np.count_nonzero(hits)), invalid)
+    return subs["id"][fire], subs["id"][hits & ~fire]
+
+
+def _alert_mask(intensity, subs: np.ndarray, now_epoch: int, min_gap: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    # The rules of evaluate_alerts without its logging and metrics, so they can also run in pool processes:
+    # (mask of the subscriptions to notify, mask of those over their threshold, invalid thresholds)
+    kp = subs["threshold"]
+    valid = (kp >= 0) & (kp < len(KP_OVATION_TABLE))
+    ovation_threshold = KP_OVATION_TABLE[np.where(valid, kp, 0)]
+    hits = valid & (np.asarray(intensity) >= ovation_threshold)
+    due = now_epoch - subs["last_alert"] >= min_gap
+    return hits & due, hits, int(np.count_nonzero(~valid))
+
+
+def _record_evaluation(fired: int, hits: int, invalid: int):
+    if invalid:
+        logger.warning(f"Skipping {invalid} subscriptions with invalid thresholds")
+    suppressed = hits - fired
+    ALERTS.inc(fired, result="fired")
+    ALERTS.inc(suppressed, result="suppressed")
+    logger.debug("{} subscriptions over threshold, {} suppressed", hits, suppressed)
+
+
+def threshold_levels(intensity) -> np.ndarray:
+    """
+    Number of KP_TO_OVATION levels each intensity reaches (0 where it reaches none).
+    """
+    return np.searchsorted(KP_OVATION_TABLE, intensity, side="right")
+
+
+def max_triggerable_kp(intensity) -> np.ndarray:
+    """
+    Highest Kp threshold each intensity reaches (-1 where it reaches none).
+    """
+    return threshold_levels(intensity) - 1
+
+
+def active_tiles(grid: OvationGrid) -> Dict[int, List[int]]:
+    """
+    Summarise a snapshot as {max Kp threshold: [tile, ...]} over the tiles where any alert could fire.
+    Subscriptions outside these tiles, or with a stricter threshold than their tile allows, cannot fire.
+    """
+    tile_kp = max_triggerable_kp(grid.tile_max())
+    return {int(kp): np.flatnonzero(tile_kp == kp).tolist() for kp in np.unique(tile_kp[tile_kp >= 0])}
+
+
+def changed_cells(previous: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """
+    Boolean grid of the cells whose intensity crossed any KP_TO_OVATION level (in either direction).
+    """
+    return threshold_levels(previous) != threshold_levels(current)
+
+
+def resume_after(grid: OvationGrid, state: SweepState, after_id: int = 0) -> int:
+    """
+    The after_id a sweep of grid actually starts from: a cursor left by an unfinished sweep of the same snapshot
+    skips the subscriptions it already handled.
+    """
+    if state.cursor is not None and state.forecast_time == grid.forecast_time:
+        return max(after_id, state.cursor)
+    return after_id
+
+
+def iter_delta_candidates(
+    grid: OvationGrid, state: SweepState, after_id: int = 0, max_id: Optional[int] = None
+) -> Iterator[np.ndarray]:
+    """
+    Subscriptions (with after_id < ID <= max_id) worth evaluating against grid given the last completed sweep:
+    those in active cells that crossed a threshold level since then, those in active cells marked pending (updated,
+    or due but not alerted yet, see db.mark_pending), plus any subscription added after it.
+    Without a previous sweep every subscription in an active tile is a candidate.
+    A cursor left by an unfinished sweep of the same snapshot skips the subscriptions it already handled.
+    Candidates are yielded in ID order within each of those groups, as chunks of at most SUBSCRIPTION_BATCH_SIZE
+    subscriptions.
+    """
+    tiles = active_tiles(grid)
+    after_id = resume_after(grid, state, after_id)
+    if state.grid is None:
+        yield from iter_subscriptions(active_tiles=tiles, after_id=after_id, max_id=max_id)
+        return
+
+    # Subscriptions covered by the last sweep only need a look if their cell crossed a level
+    changed = changed_cells(state.grid, grid.intensity)
+    changed_tiles = tile_max(changed)
+    delta_tiles = {kp: [t for t in tile_list if changed_tiles[t]] for kp, tile_list in tiles.items()}
+    covered_max = state.high_water if max_id is None else min(max_id, state.high_water)
+    for subs in iter_subscriptions(active_tiles=delta_tiles, after_id=after_id, max_id=covered_max):
+        subs = subs[changed.ravel()[subs["cell"]]]
+        if len(subs):
+            yield subs
+
+    # Pending ones in cells that did not change (those in changed cells were just yielded). A cursor persisted
+    # during the pass above may skip some of them on resume; they stay pending for the next sweep then
+    for subs in iter_subscriptions(active_tiles=tiles, after_id=after_id, max_id=covered_max, pending=True):
+        subs = subs[~changed.ravel()[subs["cell"]]]
+        if len(subs):
+            yield subs
+
+    # Newer subscriptions have never been evaluated against any snapshot
+    yield from iter_subscriptions(active_tiles=tiles, after_id=max(after_id, state.high_water), max_id=max_id)
+
+
+@dataclass
+class SweepResult:
+    scanned: int = 0  # subscriptions evaluated
+    alerted: int = 0  # subscriptions over their threshold and outside MIN_ALERT_GAP
+    delivered: int = 0  # alerts actually delivered
+    queued: int = 0  # alerts handed to the outbox for delivery by the senders
+
+    def __add__(self, other: "SweepResult") -> "SweepResult":
+        return SweepResult(*(a + b for a, b in zip(astuple(self), astuple(other))))
+
+
+# evaluate(grid, subs, now_epoch) -> (IDs of the subscriptions to notify, IDs held back by MIN_ALERT_GAP)
+Evaluator = Callable[[OvationGrid, np.ndarray, int], Tuple[np.ndarray, np.ndarray]]
+
+
+def _evaluate(grid: OvationGrid, subs: np.ndarray, now_epoch: int) -> Tuple[np.ndarray, np.ndarray]:
+    return evaluate_due(grid.intensity_at_cells(subs["cell"]), subs, now_epoch)
+
+
+def notify_due(
+    grid: OvationGrid,
+    subs: np.ndarray,
+    state: Optional[SweepState] = None,
+    outbox=None,
+    evaluate: Evaluator = _evaluate,
+) -> SweepResult:
+    """
+    Evaluate subs against grid and deliver the alerts that are due, in batches of ALERT_CHECKPOINT.
+    With an outbox (redis_handler.outbox.Outbox) the alerts are only queued there, and its senders deliver them
+    and record last_alert_sent; otherwise they are sent and recorded here.
+    If a sweep state is given, a cursor is persisted in it after every batch.
+    evaluate replaces the in-process evaluation (e.g. with parallel_sweep.ParallelEvaluator.evaluate).
+
+    Alerted and held back subscriptions are marked pending first, so delta sweeps look at them again until an
+    alert is confirmed, even if their cell stays as it is.
+    """
+    SUBSCRIPTIONS_SCANNED.inc(len(subs))
+    logger.info("Checking {} subscriptions", len(subs))
+
+    now = datetime.now()
+    with SWEEP_STAGE_SECONDS.time(stage="evaluate"):
+        alert_ids, held_ids = evaluate(grid, subs, to_epoch(now))
+    result = SweepResult(scanned=len(subs), alerted=len(alert_ids))
+    mark_pending(np.concatenate([alert_ids, held_ids]), now)
+
+    with SWEEP_STAGE_SECONDS.time(stage="alert_load"):
+        alert_subs = get_subscriptions_by_ids(alert_ids)
+    for start in range(0, len(alert_subs), ALERT_CHECKPOINT):
+        batch = alert_subs[start : start + ALERT_CHECKPOINT]
+        if outbox is not None:
+            with SWEEP_STAGE_SECONDS.time(stage="dispatch"):
+                intents = [(sub.id, sub.user_email, sub.user_name, sub.city, sub.threshold) for sub in batch]
+                result.queued += outbox.publish(intents, grid.snapshot_id, now)
+        else:
+            result.delivered += _send_and_confirm(batch, now)
+
+        if state is not None:
+            state.forecast_time = grid.forecast_time
+            state.cursor = batch[-1].id
+            save_sweep_state(state)
+
+    return result
+
+
+def _send_and_confirm(batch: List[Subscription], now: datetime) -> int:
+    # One digest per user for all of their subscriptions in the batch, in first-seen order
+    by_email: Dict[str, List[Subscription]] = {}
+    for sub in batch:
+        by_email.setdefault(sub.user_email, []).append(sub)
+    digests = [
+        (email, subs[0].user_name, [(sub.city, sub.threshold) for sub in subs]) for email, subs in by_email.items()
+    ]
+    with SWEEP_STAGE_SECONDS.time(stage="dispatch"):
+        results = send_digests(digests)
+
+    delivered_ids = []
+    for (email, subs), delivered in zip(by_email.items(), results):
+        if delivered:
+            delivered_ids.extend(sub.id for sub in subs)
+            logger.success("Alert for {} locations sent to {}", len(subs), email)
+        else:
+            logger.warning("Alert for subscriptions {} was not delivered", [sub.id for sub in subs])
+    ALERTS_DELIVERED.inc(len(delivered_ids), result="delivered")
+    ALERTS_DELIVERED.inc(len(batch) - len(delivered_ids), result="failed")
+    bulk_update_last_alert_sent(delivered_ids, now)
+    return len(delivered_ids)
+
+
+def sweep_subscriptions(
+    grid: OvationGrid,
+    state: SweepState,
+    after_id: int = 0,
+    max_id: Optional[int] = None,
+    checkpoint: bool = False,
+    outbox=None,
+) -> SweepResult:
+    """
+    Evaluate the delta candidates with after_id < ID <= max_id against grid and notify the ones that fire
+    (through outbox if given, see notify_due).
+    With checkpoint=True a cursor is persisted after every ALERT_CHECKPOINT alerts.
+    """
+    started = datetime.now()
+    resumed_after = resume_after(grid, state, after_id)
+    result = SweepResult()
+    candidates = iter_delta_candidates(grid, state, after_id=after_id, max_id=max_id)
+    while True:
+        with SWEEP_STAGE_SECONDS.time(stage="load"):
+            subs = next(candidates, None)
+        if subs is None:
+            break
+        result += notify_due(grid, subs, state if checkpoint else None, outbox=outbox)
+    # Every subscription of the range was evaluated or cannot fire under grid; those still due were marked again
+    clear_pending(resumed_after, max_id, started)
+    return result
+
+
+def check_subscription(grid: OvationGrid, sub_id: int) -> SweepResult:
+    """
+    Evaluate a single subscription against grid, regardless of what changed since the last sweep.
+    """
+    return notify_due(grid, get_subscription_columns(after_id=sub_id - 1, max_id=sub_id))
+
+
+def complete_sweep(grid: OvationGrid, high_water: int):
+    """
+    Record grid as the baseline for the next incremental sweep, covering subscriptions up to high_water.
+    """
+    save_sweep_state(SweepState(forecast_time=grid.forecast_time, grid=grid.intensity, high_water=high_water))
+
+
+def run_alert_sweep(grid: OvationGrid) -> int:
+    """
+    Evaluate subscriptions against one aurora snapshot and notify the ones that fire.
+
+    Sweeps are incremental: the intensity grid of the last completed sweep is kept in the database and only
+    subscriptions whose cell crossed a threshold level since then, that are pending (updated, or due but not
+    alerted yet) or that are new are re-evaluated.
+    Progress is checkpointed every ALERT_CHECKPOINT alerts so a restarted worker resumes the same snapshot.
+    Returns the number of alerts sent.
+    """
+    state = load_sweep_state()
+    high_water = get_max_subscription_id()
+    result = sweep_subscriptions(grid, state, max_id=high_water, checkpoint=True)
+    complete_sweep(grid, high_water)
+    return result.delivered
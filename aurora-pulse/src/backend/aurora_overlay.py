@@ -0,0 +1,82 @@
+import struct
+import zlib
+
+import numpy as np
+
+from .config import KP_TO_OVATION, OVERLAY_SIZE
+from .ovation_grid import OvationGrid
+
+# Web Mercator only reaches this latitude; the overlay image spans exactly the projected world
+MERCATOR_MAX_LAT = 85.05112878
+OVERLAY_BOUNDS = [[-MERCATOR_MAX_LAT, -180], [MERCATOR_MAX_LAT, 180]]  # [[south, west], [north, east]]
+
+# OVATION intensity at which each Kp threshold is reached, in Kp order
+_LEVEL_THRESHOLDS = np.array([KP_TO_OVATION[kp] for kp in sorted(KP_TO_OVATION)])
+
+# One RGBA color per level: transparent below Kp 0, then green through yellow to red as the aurora strengthens
+OVERLAY_PALETTE = np.array(
+    [
+        (0, 0, 0, 0),
+        (46, 204, 113, 70),
+        (46, 204, 113, 100),
+        (88, 214, 141, 120),
+        (171, 235, 96, 140),
+        (241, 239, 80, 155),
+        (248, 196, 64, 170),
+        (243, 156, 18, 185),
+        (235, 94, 40, 200),
+        (231, 60, 60, 215),
+        (192, 41, 120, 230),
+    ],
+    dtype=np.uint8,
+)
+
+
+def _mercator_rows(height: int) -> np.ndarray:
+    """
+    Latitude at the center of each row of a Web Mercator image of the given height, north first.
+    """
+    y = np.pi * (1 - 2 * (np.arange(height) + 0.5) / height)
+    return np.degrees(np.arctan(np.sinh(y)))
+
+
+def overlay_levels(grid: OvationGrid, size: int = OVERLAY_SIZE) -> np.ndarray:
+    """
+    (size, size) array of Kp levels (0 = below every threshold, k + 1 = Kp k's threshold reached) resampled from
+    the grid onto a Web Mercator image spanning OVERLAY_BOUNDS.
+    """
+    lat = _mercator_rows(size)[:, None]
+    lon = (-180 + 360 * (np.arange(size) + 0.5) / size)[None, :]
+    intensity = grid.intensity_at(lat, lon)
+    return np.searchsorted(_LEVEL_THRESHOLDS, intensity, side="right").astype(np.uint8)
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def encode_indexed_png(indices: np.ndarray, palette: np.ndarray) -> bytes:
+    """
+    Encode a 2-D uint8 array of palette indices as a palette-based PNG with per-entry transparency.
+    """
+    height, width = indices.shape
+    # Every scanline starts with filter type 0 (none)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), indices.astype(np.uint8)]).tobytes()
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)),
+            _png_chunk(b"PLTE", palette[:, :3].tobytes()),
+            _png_chunk(b"tRNS", palette[:, 3].tobytes()),
+            _png_chunk(b"IDAT", zlib.compress(raw, 9)),
+            _png_chunk(b"IEND", b""),
+        ]
+    )
+
+
+def render_overlay(grid: OvationGrid, size: int = OVERLAY_SIZE) -> bytes:
+    """
+    Render a snapshot as a PNG heat map of Kp levels to lay over a Web Mercator map at OVERLAY_BOUNDS.
+    The image has a fixed size, so its payload does not depend on how dense the source grid is.
+    """
+    return encode_indexed_png(overlay_levels(grid, size), OVERLAY_PALETTE)
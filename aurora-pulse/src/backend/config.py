@@ -1,5 +1,36 @@
 API_URL = "https://services.swpc.noaa.gov/json/ovation_aurora_latest.json"  # NOAA Aurora API endpoint
-CACHE_FILE = "aurora_data.json"  # Local cache file for aurora data
-CACHE_TTL = 3 * 60 * 60  # 3 hours in seconds
-DB_PATH = "aurora_subscriptions.db"  # TODO: change to external hosted DB in production
+ARCHIVE_DIR = "aurora_archive"  # Append-only archive of every distinct OVATION snapshot (empty disables archiving)
+CACHE_FILE = "aurora_data.bin"  # Local binary snapshot of the latest aurora data (see OvationGrid.save)
+REVALIDATE_INTERVAL = 60  # Seconds before the in-memory snapshot is revalidated against NOAA
+DB_PATH = "aurora_subscriptions.db"  # SQLite database used when DATABASE_URL is not set
+DB_POOL_SIZE = 10  # Maximum pooled PostgreSQL connections per process
+EMAIL_RENDER_CACHE_SIZE = 4096  # Rendered lines (e.g. per city and intensity) memoized by the compiled alert email
+GAZETTEER_FILE = "data/cities_data/worldcities.xlsx"  # Bundled world cities used for offline geocoding
+GAZETTEER_CACHE = "gazetteer.npz"  # Parsed gazetteer, rebuilt whenever GAZETTEER_FILE is newer
+GAZETTEER_MAX_DISTANCE_KM = 50  # Farthest a clicked point may be from a known city to be named after it
+GEOCODE_CACHE_DB = "geocode_cache.db"  # SQLite geocode cache used when Redis is unavailable
+GEOCODE_CACHE_PRECISION = 2  # Decimal places coordinates are rounded to for cache keys (~1 km)
+GEOCODE_CACHE_TTL = 30 * 24 * 60 * 60  # Seconds a geocoding result is cached
+GEOCODE_CACHE_MAX_ENTRIES = 100_000  # Cached geocoding results kept before least recently used ones are evicted
 KP_TO_OVATION = {0: 1, 1: 2, 2: 4, 3: 6, 4: 9, 5: 12, 6: 14, 7: 17, 8: 19, 9: 20}
+METRICS_PORT = 9108  # Port of the worker's Prometheus /metrics endpoint (0 disables it)
+MIN_ALERT_GAP = 60 * 60  # Minimum seconds between two alerts for the same subscription (avoid spam)
+OUTBOX_CLAIM_IDLE = 5 * 60  # Seconds an unconfirmed alert waits before another sender takes it over (crashed sender)
+OUTBOX_CONFIRM_BATCH = 100  # Delivered alerts confirmed in the database and acknowledged together
+OUTBOX_CONFIRM_INTERVAL = 1  # Seconds a partial batch of delivered alerts waits before it is confirmed anyway
+OUTBOX_KEY_TTL = 24 * 60 * 60  # Seconds an idempotency key keeps a retried sweep from queueing an alert twice
+OUTBOX_MAX_ATTEMPTS = 5  # Delivery attempts before an alert is moved to the dead-letter stream
+OUTBOX_RETRY_BASE = 2  # Seconds before the first retry; the delay doubles (with jitter) on every further attempt
+OUTBOX_SENDERS = 16  # Alerts a sender process delivers concurrently
+OVERLAY_SIZE = 512  # Width and height in pixels of the aurora heat map laid over the app's map
+SMTP_POOL_SIZE = 4  # Concurrent SMTP sessions per server
+SMTP_MESSAGES_PER_SESSION = 100  # Messages sent over one SMTP session before it is recycled
+SMTP_RATE_LIMIT = 10  # Maximum messages per second per SMTP server
+SNAPSHOT_TTL = 2 * 60 * 60  # Seconds a snapshot published for a sharded sweep stays in Redis
+SUBSCRIPTION_BATCH_SIZE = 10_000  # Subscriptions loaded per chunk when streaming through the table
+SWEEP_SHARDS = 8  # Number of shard jobs a sweep is split into
+SWEEP_PROCESSES = 0  # Processes a single-node sweep evaluates on (below 2: split into SWEEP_SHARDS jobs instead)
+SWEEP_MIN_CPUS = 8  # Fewest cores SWEEP_PROCESSES is used on; smaller machines split sweeps into jobs anyway
+SWEEP_WINDOW = 15 * 60  # Seconds per sweep window; at most one sweep is enqueued per window
+SWEEP_TICK = 60  # Seconds between two attempts of the sweep scheduler to enqueue the current window's sweep
+SWEEP_LOCK_TTL = SWEEP_WINDOW  # Seconds before a sweep lock left by a crashed sweep expires, so no window is skipped
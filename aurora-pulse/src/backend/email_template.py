@@ -0,0 +1,110 @@
+import base64
+import uuid
+from email import quoprimime
+from functools import lru_cache
+from string import Formatter
+from typing import Sequence, Tuple, Union
+
+from .config import EMAIL_RENDER_CACHE_SIZE
+
+CRLF = b"\r\n"
+
+
+def _qp_line(line: str) -> bytes:
+    # Same encoding as email.charset's utf-8 quoted-printable bodies; QP encodes every line on its own
+    return quoprimime.body_encode(line.encode("utf-8").decode("latin-1"), eol="\r\n").encode("ascii")
+
+
+def _format_line(line: str, fields: Tuple[str, ...], values: tuple) -> bytes:
+    return _qp_line(line.format(**dict(zip(fields, values))))
+
+
+_render_line = lru_cache(maxsize=EMAIL_RENDER_CACHE_SIZE)(_format_line)
+
+
+@lru_cache(maxsize=EMAIL_RENDER_CACHE_SIZE)
+def _encode_header(value: str) -> bytes:
+    # RFC 2047 base64 encoded-words of at most 39 UTF-8 bytes (64 characters, 73 after "Subject: "), on folded lines;
+    # email.header.Header does the same, an order of magnitude slower
+    words, word = [], b""
+    for char in value:
+        encoded = char.encode("utf-8")
+        if len(word) + len(encoded) > 39:
+            words.append(word)
+            word = b""
+        word += encoded
+    words.append(word)
+    return b"\r\n ".join(b"=?utf-8?b?" + base64.b64encode(word) + b"?=" for word in words)
+
+
+class CompiledTemplate:
+    """
+    A str.format template compiled into quoted-printable encoded lines.
+
+    Runs of lines without placeholders are encoded once, here. Lines with placeholders are formatted and encoded on
+    render(), and memoized by their own field values only, so e.g. a line showing the city and intensity is
+    rendered once per (city, intensity) however many recipients share it. Lines using a per_recipient field (one
+    that differs for nearly every message, like the recipient's name) are not memoized, as they would only evict
+    the lines that are shared.
+    """
+
+    def __init__(self, template: str, per_recipient: Sequence[str] = ()):
+        self._segments: list[Union[bytes, Tuple[object, str, Tuple[str, ...]]]] = []
+        static: list[bytes] = []
+        for line in template.split("\n"):
+            fields = tuple(dict.fromkeys(field for _, field, _, _ in Formatter().parse(line) if field))
+            if not fields:
+                static.append(_qp_line(line))
+                continue
+            if static:
+                self._segments.append(CRLF.join(static))
+                static = []
+            render = _format_line if set(fields) & set(per_recipient) else _render_line
+            self._segments.append((render, line, fields))
+        if static:
+            self._segments.append(CRLF.join(static))
+
+    def render(self, **values) -> bytes:
+        """
+        The template filled with values, as a quoted-printable body with CRLF line endings.
+        """
+        return CRLF.join(
+            segment
+            if isinstance(segment, bytes)
+            else segment[0](segment[1], segment[2], tuple(values[field] for field in segment[2]))
+            for segment in self._segments
+        )
+
+
+class CompiledEmail:
+    """
+    An HTML + plain text email (the layout of notifier.build_email_message) whose MIME skeleton is assembled once.
+    render() only fills in the recipient and the template fields, and returns the message as wire-ready bytes.
+    """
+
+    def __init__(self, subject: str, text: str, html: str, per_recipient: Sequence[str] = ()):
+        self.subject = subject
+        self.text = CompiledTemplate(text, per_recipient)
+        self.html = CompiledTemplate(html, per_recipient)
+        boundary = f"===============aurora{uuid.uuid4().hex}=="
+        part = 'Content-Type: text/{}; charset="utf-8"\r\nContent-Transfer-Encoding: quoted-printable\r\n\r\n'
+        self._head = (
+            f'MIME-Version: 1.0\r\nContent-Type: multipart/mixed;\r\n boundary="{boundary}"\r\n\r\n'
+            f"--{boundary}\r\n{part.format('plain')}"
+        ).encode("ascii")
+        self._middle = f"\r\n--{boundary}\r\n{part.format('html')}".encode("ascii")
+        self._tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+
+    def render(self, sender: str, to_email: str, **values) -> bytes:
+        return b"".join(
+            [
+                f"From: {sender}\r\nTo: {to_email}\r\nSubject: ".encode(),
+                _encode_header(self.subject.format(**values)),
+                CRLF,
+                self._head,
+                self.text.render(**values),
+                self._middle,
+                self.html.render(**values),
+                self._tail,
+            ]
+        )
@@ -1,75 +1,140 @@
-import json
 import os
+import threading
 import time
+from typing import Optional
 
 import requests
 import streamlit as st
 from loguru import logger
 
-from .config import API_URL, CACHE_FILE, CACHE_TTL
+from .config import API_URL, ARCHIVE_DIR, CACHE_FILE, REVALIDATE_INTERVAL
+from .metrics import NOAA_FETCH_SECONDS, SNAPSHOT_CACHE
+from .ovation_grid import OvationGrid
+from .snapshot_archive import SnapshotArchive
+
+
+class SnapshotManager:
+    """
+    Keeps the latest OVATION snapshot in memory and revalidates it against NOAA.
+
+    Revalidation uses conditional requests (ETag / Last-Modified), so an unchanged product costs a 304, and
+    the snapshot is only replaced when the payload's Forecast Time changes. Concurrent callers share a
+    single in-flight download. Every new snapshot is also added to the archive in archive_dir (if set).
+    """
+
+    def __init__(
+        self,
+        url: str = API_URL,
+        cache_file: str = CACHE_FILE,
+        revalidate_after: float = REVALIDATE_INTERVAL,
+        archive_dir: Optional[str] = ARCHIVE_DIR,
+    ):
+        self.url = url
+        self.cache_file = cache_file
+        self.revalidate_after = revalidate_after
+        self.archive = SnapshotArchive(archive_dir) if archive_dir else None
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._grid: Optional[OvationGrid] = None
+        self._etag = None
+        self._last_modified = None
+        self._checked_at = None
+
+    def _is_fresh(self) -> bool:
+        return self._checked_at is not None and time.monotonic() - self._checked_at < self.revalidate_after
+
+    def get(self) -> Optional[OvationGrid]:
+        """
+        Returns the latest snapshot, revalidating it if it is older than revalidate_after
+        (None if no data is available at all).
+        """
+        if self._is_fresh():
+            SNAPSHOT_CACHE.inc(result="hit")
+            return self._grid
+
+        with self._lock:
+            # Another caller may have refreshed while we waited for the lock
+            if not self._is_fresh():
+                self._refresh()
+            else:
+                SNAPSHOT_CACHE.inc(result="hit")
+            return self._grid
+
+    def _refresh(self):
+        if self._grid is None and os.path.exists(self.cache_file):
+            self._grid = OvationGrid.load(self.cache_file)
+
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+
+        logger.info("Revalidating aurora data with NOAA API...")
+        try:
+            with NOAA_FETCH_SECONDS.time():
+                response = self._session.get(self.url, headers=headers, timeout=10)
+            if response.status_code == 304:
+                SNAPSHOT_CACHE.inc(result="not_modified")
+                logger.info("Aurora data not modified.")
+                return
+            response.raise_for_status()
+            self._etag = response.headers.get("ETag")
+            self._last_modified = response.headers.get("Last-Modified")
+
+            data = response.json()
+            if self._grid is not None and data.get("Forecast Time") == self._grid.forecast_time:
+                SNAPSHOT_CACHE.inc(result="not_modified")
+                logger.info(f"Aurora data unchanged (forecast time {self._grid.forecast_time}).")
+                return
+
+            OvationGrid.from_payload(data, resample=True).save(self.cache_file)
+            self._grid = OvationGrid.load(self.cache_file)
+            SNAPSHOT_CACHE.inc(result="miss")
+            logger.info(f"Aurora data fetched and saved successfully (forecast time {self._grid.forecast_time}).")
+            self._archive()
+        except Exception as e:
+            SNAPSHOT_CACHE.inc(result="error")
+            logger.error(f"Failed to fetch aurora data: {e}")
+            if self._grid is not None:
+                logger.warning("Using old cached data due to API failure.")
+        finally:
+            # Failures are retried after the same interval, so an outage doesn't turn into a request storm
+            self._checked_at = time.monotonic()
+
+    def _archive(self):
+        if self.archive is None:
+            return
+        try:
+            self.archive.append(self._grid)
+        except Exception as e:
+            # History is best effort; the live snapshot is already in place
+            logger.error(f"Failed to archive aurora data: {e}")
+
+
+snapshot_manager = SnapshotManager()
 
 
 # @st.cache_data(ttl=300)  # cache for 5 minutes
 def fetch_realtime_aurora_data():
     """
     Fetch real aurora data from NOAA API.
-    Returns the aurora oval data.
+    Returns the aurora oval as an OvationGrid (None if no data is available).
     """
-    # Check if cache exists and is recent
-    if os.path.exists(CACHE_FILE):
-        last_modified = os.path.getmtime(CACHE_FILE)
-        age = time.time() - last_modified
-        if age < CACHE_TTL:
-            logger.info(f"Using cached aurora data ({age / 3600:.2f} hours old).")
-            with open(CACHE_FILE, "r") as f:
-                return json.load(f)
-
-    # Fetch fresh data from API
-    # Make a get request to https://services.swpc.noaa.gov/json/ovation_aurora_latest.json to get the latest aurora data
-
-    logger.info("Fetching realtime aurora data from NOAA API...")
-    try:
-        response = requests.get(API_URL, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        with open(CACHE_FILE, "w") as f:
-            json.dump(data, f)
-        logger.info("Aurora data fetched and saved successfully.")
-        return data
-    except Exception as e:
-        logger.error(f"Failed to fetch aurora data: {e}")
-
-        # Fallback to cached data if available
-        if os.path.exists(CACHE_FILE):
-            logger.warning("Using old cached data due to API failure.")
-            with open(CACHE_FILE, "r") as f:
-                return json.load(f)
-        return None
+    return snapshot_manager.get()
 
 
 def load_aurora_points():
     """
-    Returns list of [lat, lon, intensity] from NOAA aurora JSON.
+    Returns list of [lat, lon, intensity] from NOAA aurora data.
     Uses caching to avoid repeated disk reads.
     """
-    data = fetch_realtime_aurora_data()
-    if not data:
+    grid = fetch_realtime_aurora_data()
+    if grid is None:
         return []
-
-    # Convert coordinates to [lat, lon, intensity] format
-    points = []
-    for lon, lat, intensity in data.get("coordinates", []):
-        points.append([lat, lon, intensity])
-    return points
+    return grid.points()
 
 
 # @st.cache_data(show_spinner=False)
 def _load_aurora_points_cached(filepath):
-    with open(filepath, "r") as f:
-        data = json.load(f)
-
-    points = []
-    for lon, lat, intensity in data["coordinates"]:
-        points.append([lat, lon, intensity])
-
-    return points
+    return OvationGrid.load(filepath).points()
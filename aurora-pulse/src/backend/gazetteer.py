@@ -0,0 +1,285 @@
+import os
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+from scipy.spatial import cKDTree
+
+from .config import GAZETTEER_CACHE, GAZETTEER_FILE, GAZETTEER_MAX_DISTANCE_KM
+from .geocode_cache import GeocodeCache, coordinate_key
+
+EARTH_RADIUS_KM = 6371.0
+UNKNOWN_LOCATION = "Unknown location"
+
+# Nominatim address fields naming a place, from the most to the least specific one we show
+CITY_FALLBACKS = ("city", "town", "village", "hamlet", "county")
+
+MIN_TRIGRAM_SIMILARITY = 0.5  # Dice coefficient a misspelt name needs to match a place
+
+_COLUMNS = ("name", "ascii_name", "admin", "country", "lat", "lon", "population")
+
+
+def city_from_address(address: Dict[str, str]) -> str:
+    """
+    Best place name in a Nominatim-style address, following CITY_FALLBACKS.
+    """
+    for field in CITY_FALLBACKS:
+        if address.get(field):
+            return address[field]
+    return UNKNOWN_LOCATION
+
+
+def normalize_name(name: str) -> str:
+    """
+    Case- and accent-insensitive form of a place name used by forward lookups ("Tromsø" -> "tromso").
+    """
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return " ".join("".join(ch for ch in decomposed if not unicodedata.combining(ch)).split())
+
+
+def _trigrams(name: str) -> set:
+    padded = f"  {name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """
+    Points on the unit sphere for latitudes/longitudes in degrees, as an (n, 3) array.
+    Euclidean nearest neighbours of these are great-circle nearest neighbours.
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+@dataclass(slots=True)
+class Place:
+    name: str
+    admin: str  # first-level administrative division (state, region, ...)
+    country: str
+    latitude: float
+    longitude: float
+    population: int
+
+    def address(self) -> Dict[str, str]:
+        """
+        The place as a Nominatim-style address.
+        """
+        return {"city": self.name, "state": self.admin, "country": self.country}
+
+
+class Gazetteer:
+    """
+    Offline index of world cities for reverse and forward geocoding.
+
+    Reverse lookups query a KD-tree of the cities on the unit sphere; forward lookups use a sorted name array for
+    prefix matches and a trigram index for misspelt names. Both answer in microseconds without any network call.
+    Building the index takes about a second, so a process keeps one (see get_gazetteer).
+    """
+
+    def __init__(self, name, ascii_name, admin, country, lat, lon, population):
+        self.name = np.asarray(name, dtype=str)
+        self.ascii_name = np.asarray(ascii_name, dtype=str)
+        self.admin = np.asarray(admin, dtype=str)
+        self.country = np.asarray(country, dtype=str)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.population = np.asarray(population, dtype=np.int64)
+
+        self._tree = cKDTree(to_unit_vectors(self.lat, self.lon))
+
+        # Forward index: every place under both its name and its ASCII name, most populous first
+        keys = [normalize_name(n) for n in self.name] + [normalize_name(n) for n in self.ascii_name]
+        places = np.tile(np.arange(len(self)), 2)
+        order = np.lexsort((-self.population[places], keys))
+        self._keys = np.asarray(keys)[order]
+        self._key_places = places[order]
+
+        # Trigram postings over the distinct keys, for names that match no prefix
+        self._unique_keys, self._unique_starts = np.unique(self._keys, return_index=True)
+        postings: Dict[str, List[int]] = {}
+        self._trigram_counts = np.empty(len(self._unique_keys), dtype=np.int64)
+        for k, key in enumerate(self._unique_keys):
+            trigrams = _trigrams(key)
+            self._trigram_counts[k] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(k)
+        self._trigram_index = {trigram: np.array(ids) for trigram, ids in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def place(self, i: int) -> Place:
+        return Place(
+            name=str(self.name[i]),
+            admin=str(self.admin[i]),
+            country=str(self.country[i]),
+            latitude=float(self.lat[i]),
+            longitude=float(self.lon[i]),
+            population=int(self.population[i]),
+        )
+
+    @classmethod
+    def from_xlsx(cls, path: str = GAZETTEER_FILE):
+        """
+        Build the index from a simplemaps-style worldcities spreadsheet
+        (columns city, city_ascii, lat, lng, country, admin_name, population, ...).
+        """
+        # Imported here so openpyxl is only needed when the spreadsheet has to be parsed
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = {name: i for i, name in enumerate(next(rows))}
+            fields = ("city", "city_ascii", "admin_name", "country", "lat", "lng", "population")
+            columns = [[] for _ in fields]
+            for row in rows:
+                if row[header["lat"]] is None or row[header["lng"]] is None:
+                    continue
+                for column, field in zip(columns, fields):
+                    column.append(row[header[field]])
+        finally:
+            workbook.close()
+
+        text = [[value or "" for value in column] for column in columns[:4]]
+        population = [int(value or 0) for value in columns[6]]
+        logger.info(f"Parsed {len(population)} places from {path}")
+        return cls(*text, columns[4], columns[5], population)
+
+    def save(self, path: str):
+        """
+        Store the index columns as a compressed .npz file, loadable by from_npz() in milliseconds.
+        """
+        with open(path, "wb") as f:
+            np.savez_compressed(f, **{column: getattr(self, column) for column in _COLUMNS})
+
+    @classmethod
+    def from_npz(cls, path: str):
+        with np.load(path) as data:
+            return cls(*(data[column] for column in _COLUMNS))
+
+    @classmethod
+    def load(cls, source: str = GAZETTEER_FILE, cache: Optional[str] = GAZETTEER_CACHE):
+        """
+        Load the index from cache if it is newer than source, otherwise parse source and refresh the cache.
+        """
+        if cache and os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(source):
+            return cls.from_npz(cache)
+        gazetteer = cls.from_xlsx(source)
+        if cache:
+            gazetteer.save(cache)
+        return gazetteer
+
+    def nearest(self, lat: float, lon: float, max_distance_km: float = GAZETTEER_MAX_DISTANCE_KM) -> Optional[Place]:
+        """
+        Nearest place to a latitude/longitude, or None if there is none within max_distance_km (great-circle).
+        """
+        chord, i = self._tree.query(to_unit_vectors(lat, lon)[0])
+        distance_km = 2 * EARTH_RADIUS_KM * np.arcsin(min(chord / 2, 1.0))
+        if distance_km > max_distance_km:
+            return None
+        return self.place(i)
+
+    def search(self, query: str, limit: int = 5) -> List[Place]:
+        """
+        Places matching a name, best first: exact names, then prefixes, each ordered by population. If neither
+        matches, names sharing the most trigrams with the query are returned instead.
+        "Name, Country" restricts matches to that country.
+        """
+        name, _, country = query.partition(",")
+        key, country = normalize_name(name), normalize_name(country)
+        if not key:
+            return []
+
+        matches = []
+        seen = set()
+
+        def add(i):
+            if i not in seen and (not country or normalize_name(self.country[i]).startswith(country)):
+                seen.add(i)
+                matches.append(i)
+
+        # Exact names first, then prefixes; both are contiguous runs of the sorted keys
+        start = np.searchsorted(self._keys, key)
+        exact_end = np.searchsorted(self._keys, key, side="right")
+        prefix_end = np.searchsorted(self._keys, key + "\uffff")
+        for j in range(start, exact_end):
+            add(int(self._key_places[j]))
+        prefixes = sorted(range(exact_end, prefix_end), key=lambda j: -self.population[self._key_places[j]])
+        for j in prefixes:
+            add(int(self._key_places[j]))
+            if len(matches) >= limit:
+                break
+
+        if not matches:
+            # Misspelt names: distinct keys by trigram similarity to the query
+            query_trigrams = _trigrams(key)
+            hits = [self._trigram_index[t] for t in query_trigrams if t in self._trigram_index]
+            if hits:
+                shared = np.bincount(np.concatenate(hits), minlength=len(self._unique_keys))
+                similarity = 2 * shared / (len(query_trigrams) + self._trigram_counts)
+                candidates = np.flatnonzero(similarity >= MIN_TRIGRAM_SIMILARITY)
+                for k in candidates[np.argsort(-similarity[candidates], kind="stable")]:
+                    j = self._unique_starts[k]
+                    while j < len(self._keys) and self._keys[j] == self._unique_keys[k]:
+                        add(int(self._key_places[j]))
+                        j += 1
+                    if len(matches) >= limit:
+                        break
+
+        return [self.place(i) for i in matches[:limit]]
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """
+    Returns the process-wide gazetteer, loaded from GAZETTEER_FILE on first use (None if it cannot be loaded).
+    """
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            try:
+                _gazetteer = Gazetteer.load()
+            except Exception as e:
+                logger.error(f"Failed to load gazetteer from {GAZETTEER_FILE}: {e}")
+                return None
+        return _gazetteer
+
+
+def reverse_geocode_city(
+    lat: float, lon: float, fallback: Optional[Callable] = None, cache: Optional[GeocodeCache] = None
+) -> str:
+    """
+    Name of the place at a latitude/longitude, from the nearest city in the gazetteer.
+
+    Only if no city lies within GAZETTEER_MAX_DISTANCE_KM (or the gazetteer is unavailable) is fallback, a
+    geopy-style reverse geocoder such as a rate-limited Nominatim.reverse, asked; its address is reduced to a
+    name with the CITY_FALLBACKS order. With a cache, fallback answers are cached by rounded coordinates, including
+    "no address here" (None); fallback must therefore raise on failure rather than return None, or an outage is
+    cached as unknown locations.
+    """
+    gazetteer = get_gazetteer()
+    place = gazetteer.nearest(lat, lon) if gazetteer is not None else None
+    if place is not None:
+        return place.name
+    if fallback is None:
+        return UNKNOWN_LOCATION
+
+    def ask_fallback():
+        location = fallback((lat, lon), exactly_one=True, language="en")
+        return city_from_address(location.raw.get("address", {}) if location else {})
+
+    try:
+        if cache is None:
+            return ask_fallback()
+        return cache.get_or_compute(coordinate_key(lat, lon), ask_fallback)
+    except Exception as e:
+        logger.warning(f"Reverse geocoding fallback failed for ({lat}, {lon}): {e}")
+        return UNKNOWN_LOCATION
@@ -0,0 +1,230 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+from .config import GEOCODE_CACHE_DB, GEOCODE_CACHE_MAX_ENTRIES, GEOCODE_CACHE_PRECISION, GEOCODE_CACHE_TTL
+
+# Returned by get() for keys that are not cached (None is a valid cached result: "nothing found")
+MISSING = object()
+
+
+def coordinate_key(lat: float, lon: float, precision: int = GEOCODE_CACHE_PRECISION) -> str:
+    """
+    Cache key of a reverse lookup: the coordinates rounded to precision decimal places (2 is about 1 km), with
+    longitudes wrapped onto -180..180 so nearby clicks share a key.
+    """
+    lon = (lon + 180) % 360 - 180
+    return f"reverse:{round(lat, precision):.{precision}f},{round(lon, precision):.{precision}f}"
+
+
+def name_key(name: str) -> str:
+    """
+    Cache key of a forward lookup: the name, case- and whitespace-insensitive.
+    """
+    return "forward:" + " ".join(name.casefold().split())
+
+
+class GeocodeCache(ABC):
+    """
+    Cache of geocoding results with TTL expiry, least-recently-used eviction beyond max_entries, and hit/miss
+    counters. Values are anything JSON-serialisable, including None for "not found".
+    """
+
+    def __init__(self, ttl: int = GEOCODE_CACHE_TTL, max_entries: int = GEOCODE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """
+        Cached value of key, or MISSING. Counts a hit or a miss.
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: Any):
+        """
+        Caches value under key for ttl seconds, evicting the least recently used entries beyond max_entries.
+        """
+
+    @abstractmethod
+    def stats(self) -> Dict[str, float]:
+        """
+        {"hits", "misses", "hit_rate"} since the counters were created.
+        """
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Cached value of key, computing and caching it on a miss. Cache errors never fail the lookup itself.
+        """
+        try:
+            value = self.get(key)
+        except Exception as e:
+            logger.warning(f"Geocode cache read failed for {key}: {e}")
+            return compute()
+        if value is not MISSING:
+            return value
+
+        value = compute()
+        try:
+            self.set(key, value)
+        except Exception as e:
+            logger.warning(f"Geocode cache write failed for {key}: {e}")
+        return value
+
+    @staticmethod
+    def _hit_rate(hits: int, misses: int) -> Dict[str, float]:
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+
+class RedisGeocodeCache(GeocodeCache):
+    """
+    Geocode cache shared by every app server through Redis. Entries expire with Redis TTLs; a sorted set of
+    last-access times drives LRU eviction.
+    """
+
+    def __init__(self, connection, prefix: str = "aurora:geocode", **kwargs):
+        super().__init__(**kwargs)
+        self.connection = connection
+        self.prefix = prefix
+        self._lru_key = f"{prefix}:lru"
+        self._stats_key = f"{prefix}:stats"
+
+    def get(self, key: str) -> Any:
+        raw = self.connection.get(f"{self.prefix}:{key}")
+        pipe = self.connection.pipeline()
+        if raw is None:
+            pipe.hincrby(self._stats_key, "misses")
+            pipe.zrem(self._lru_key, key)
+        else:
+            pipe.hincrby(self._stats_key, "hits")
+            pipe.zadd(self._lru_key, {key: time.time()})
+        pipe.execute()
+        return MISSING if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        pipe = self.connection.pipeline()
+        pipe.set(f"{self.prefix}:{key}", json.dumps(value), ex=self.ttl)
+        # Entries not accessed within the TTL have expired; their members would count against max_entries
+        pipe.zremrangebyscore(self._lru_key, "-inf", now - self.ttl)
+        pipe.zadd(self._lru_key, {key: now})
+        pipe.zcard(self._lru_key)
+        overflow = pipe.execute()[-1] - self.max_entries
+        if overflow > 0:
+            evicted = [member.decode() for member, _ in self.connection.zpopmin(self._lru_key, overflow)]
+            self.connection.delete(*(f"{self.prefix}:{k}" for k in evicted))
+            logger.debug(f"Evicted {len(evicted)} geocode cache entries")
+
+    def stats(self) -> Dict[str, float]:
+        counters = self.connection.hgetall(self._stats_key)
+        return self._hit_rate(int(counters.get(b"hits", 0)), int(counters.get(b"misses", 0)))
+
+
+class SQLiteGeocodeCache(GeocodeCache):
+    """
+    Geocode cache in a local SQLite file, for deployments without Redis.
+    """
+
+    def __init__(self, path: str = GEOCODE_CACHE_DB, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS geocode_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_cache_accessed ON geocode_cache (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS geocode_cache_stats (name TEXT PRIMARY KEY, count INTEGER)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, conn: sqlite3.Connection, name: str):
+        conn.execute(
+            """
+            INSERT INTO geocode_cache_stats (name, count) VALUES (?, 1)
+            ON CONFLICT (name) DO UPDATE SET count = count + 1
+            """,
+            (name,),
+        )
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute("SELECT value FROM geocode_cache WHERE key=? AND expires_at > ?", (key, now)).fetchone()
+            if row is None:
+                self._count(conn, "misses")
+                return MISSING
+            conn.execute("UPDATE geocode_cache SET accessed_at=? WHERE key=?", (now, key))
+            self._count(conn, "hits")
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            conn.execute("DELETE FROM geocode_cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                """
+                DELETE FROM geocode_cache WHERE key IN (
+                    SELECT key FROM geocode_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def stats(self) -> Dict[str, float]:
+        counters = dict(self._connection().execute("SELECT name, count FROM geocode_cache_stats").fetchall())
+        return self._hit_rate(counters.get("hits", 0), counters.get("misses", 0))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_geocode_cache: Optional[GeocodeCache] = None
+_geocode_cache_lock = threading.Lock()
+
+
+def get_geocode_cache() -> GeocodeCache:
+    """
+    Returns the process-wide geocode cache: in Redis if it is reachable, otherwise in GEOCODE_CACHE_DB.
+    """
+    global _geocode_cache
+    with _geocode_cache_lock:
+        if _geocode_cache is None:
+            try:
+                # Imported here: importing redis_conn creates the client, which processes without Redis don't need
+                from .redis_handler.redis_conn import redis_conn
+
+                redis_conn.ping()
+                _geocode_cache = RedisGeocodeCache(redis_conn)
+            except Exception as e:
+                logger.warning(f"Redis unavailable for the geocode cache, using {GEOCODE_CACHE_DB}: {e}")
+                _geocode_cache = SQLiteGeocodeCache()
+        return _geocode_cache
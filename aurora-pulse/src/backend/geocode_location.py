@@ -1,19 +1,35 @@
 from geopy.geocoders import Nominatim
 from loguru import logger
 
+from .gazetteer import get_gazetteer
+from .geocode_cache import get_geocode_cache, name_key
+
 # Initialize Nominatim API with a user agent
 geolocator = Nominatim(user_agent="city_coordinate_finder")
 
 
 def get_city_coordinates(city_name):
     """
-    Get the latitude and longitude of a city using geopy.
+    Get the latitude and longitude of a city from the offline gazetteer, falling back to geopy.
     Args:
-        city_name (str): Name of the city to geocode.
+        city_name (str): Name of the city to geocode (optionally "City, Country").
     Returns:
         tuple: (latitude, longitude) or None if not found.
     """
 
+    # Look the city up offline first
+    gazetteer = get_gazetteer()
+    places = gazetteer.search(city_name, limit=1) if gazetteer is not None else []
+    if places:
+        logger.info(f"Found coordinates for {city_name} in gazetteer: ({places[0].latitude}, {places[0].longitude})")
+        return (places[0].latitude, places[0].longitude)
+
+    # Then earlier online lookups, and only then Nominatim
+    coordinates = get_geocode_cache().get_or_compute(name_key(city_name), lambda: _geocode_online(city_name))
+    return tuple(coordinates) if coordinates else None
+
+
+def _geocode_online(city_name):
     # Geocode the city
     location = geolocator.geocode(city_name)
 
@@ -25,7 +41,7 @@ def get_city_coordinates(city_name):
         logger.info(f"The coordinates of {city_name} are:")
         logger.info(f"Latitude: {latitude}")
         logger.info(f"Longitude: {longitude}")
-        return (latitude, longitude)
+        return [latitude, longitude]
     else:
         logger.warning(f"Could not find coordinates for {city_name}.")
         return None
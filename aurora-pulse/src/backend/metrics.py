@@ -0,0 +1,241 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence, Tuple
+
+from loguru import logger
+
+METRICS_KEY = "aurora:metrics"  # Redis hash every worker adds its samples to
+
+# Latency buckets in seconds, from a fast DB write to a slow NOAA download
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _sample_name(name: str, labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _sample_order(sample: str):
+    # Histogram buckets in numeric order of their upper bound, after every other label
+    name, _, labels = sample.partition("{")
+    other, _, bound = labels.rstrip("}").partition('le="')
+    return name, other, float(bound.rstrip('"')) if bound else 0.0
+
+
+class _Metric(ABC):
+    """
+    A metric family: one value (or histogram) per combination of label values.
+    Updates take a lock and a dict lookup, so metrics can be recorded on hot paths.
+    """
+
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> Dict[str, float]:
+        """
+        Current values in the Prometheus text format's sample names ({'name{label="value"}': value, ...}).
+        """
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count, e.g. of subscriptions scanned.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not amount:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Dict[str, float]:
+        with self._lock:
+            return {_sample_name(self.name, key): value for key, value in self._values.items()}
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observations (typically durations in seconds) over fixed buckets, plus their sum and count.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[tuple, List[float]] = {}  # per label values: bucket counts, then +Inf count, then sum
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the wall-clock duration of the with block, even if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts = self._values.get(self._key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def total(self, **labels) -> float:
+        counts = self._values.get(self._key(labels))
+        return counts[-1] if counts else 0.0
+
+    def samples(self) -> Dict[str, float]:
+        samples = {}
+        with self._lock:
+            for key, counts in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    samples[_sample_name(f"{self.name}_bucket", key + (("le", str(bound)),))] = cumulative
+                samples[_sample_name(f"{self.name}_sum", key)] = counts[-1]
+                samples[_sample_name(f"{self.name}_count", key)] = cumulative
+        return samples
+
+
+REGISTRY: List[_Metric] = []
+
+NOAA_FETCH_SECONDS = Histogram("aurora_noaa_fetch_seconds", "Latency of NOAA OVATION requests")
+SNAPSHOT_CACHE = Counter(
+    "aurora_snapshot_cache_total",
+    "Snapshot lookups by outcome: hit (fresh in memory), not_modified (revalidated), miss (new snapshot), error",
+    labels=("result",),
+)
+SWEEP_STAGE_SECONDS = Histogram(
+    "aurora_sweep_stage_seconds",
+    "Time spent per sweep stage: load, evaluate, alert_load, dispatch, per chunk",
+    ("stage",),
+)
+SUBSCRIPTIONS_SCANNED = Counter("aurora_subscriptions_scanned_total", "Subscriptions evaluated against a snapshot")
+ALERTS = Counter(
+    "aurora_alerts_total", "Subscriptions over their threshold: fired, or suppressed by MIN_ALERT_GAP", ("result",)
+)
+ALERTS_DELIVERED = Counter("aurora_alerts_delivered_total", "Alert emails by delivery outcome", ("result",))
+SMTP_SEND_SECONDS = Histogram("aurora_smtp_send_seconds", "Latency of sending one email over a pooled session")
+DB_WRITE_SECONDS = Histogram("aurora_db_write_seconds", "Duration of subscription store writes", ("operation",))
+
+
+def collect() -> Dict[str, float]:
+    """
+    Every sample recorded by this process.
+    """
+    samples = {}
+    for metric in REGISTRY:
+        samples.update(metric.samples())
+    return samples
+
+
+def render_prometheus(samples: Dict[str, float] = None) -> str:
+    """
+    Samples (by default this process's) in the Prometheus text exposition format.
+    """
+    samples = collect() if samples is None else samples
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        names = (metric.name, f"{metric.name}_bucket", f"{metric.name}_sum", f"{metric.name}_count")
+        for sample in sorted((s for s in samples if s.partition("{")[0] in names), key=_sample_order):
+            lines.append(f"{sample} {_format_value(samples[sample])}")
+    return "\n".join(lines) + "\n"
+
+
+def _format_value(value: float) -> str:
+    # Exact for counts of any size (":g" would round 1234567 to 1.23457e+06); shortest round-trip repr otherwise
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+_pushed: Dict[str, float] = {}
+_push_lock = threading.Lock()
+
+
+def push_metrics(connection):
+    """
+    Add what this process recorded since its last push to the METRICS_KEY hash, where the samples of every worker
+    accumulate. Every sample is a counter (histogram buckets included), so adding deltas aggregates correctly.
+    """
+    with _push_lock:
+        samples = collect()
+        deltas = {sample: value - _pushed.get(sample, 0) for sample, value in samples.items()}
+        deltas = {sample: delta for sample, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        pipe = connection.pipeline()
+        for sample, delta in deltas.items():
+            pipe.hincrbyfloat(METRICS_KEY, sample, delta)
+        pipe.execute()
+        _pushed.update(samples)
+
+
+def load_metrics(connection) -> Dict[str, float]:
+    """
+    Samples accumulated in Redis by push_metrics().
+    """
+    return {sample.decode(): float(value) for sample, value in connection.hgetall(METRICS_KEY).items()}
+
+
+def serve_metrics(port: int, connection) -> ThreadingHTTPServer:
+    """
+    Serve the samples accumulated in Redis as a Prometheus /metrics endpoint, from a daemon thread.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus(load_metrics(connection)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on :{server.server_address[1]}/metrics")
+    return server
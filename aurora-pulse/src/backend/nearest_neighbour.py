@@ -20,7 +20,8 @@ def haversine(lat1, lon1, lat2, lon2) -> float:
     dlon = lon2 - lon1
     a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
     c = 2 * R * np.arcsin(np.sqrt(a))
-    logger.debug(f"Haversine distance: {c} km")
+    # Formatted only if debug logging is on; this runs for every distance computed
+    logger.debug("Haversine distance: {} km", c)
     return c
 
 
@@ -57,11 +58,37 @@ def find_nearest_coord(target_coord, coord_list):
 
     nearest_coord = coords[idx[0][0]]
     distance_km = dist[0][0] * 6371.0  # convert to km
-    logger.debug(f"Nearest coordinate: {nearest_coord}, Distance (km): {distance_km}")
+    logger.debug("Nearest coordinate: {}, Distance (km): {}", nearest_coord, distance_km)
 
     return nearest_coord, distance_km
 
 
+def find_nearest_coords(target_coords, coord_list):
+    """
+    Batch version of find_nearest_coord: one BallTree is built and queried for every target at once.
+
+    Parameters:
+    target_coords : array-like
+        Target coordinates as [[lat, lon], ...].
+    coord_list : array-like
+        List or array of coordinates [[lat, lon, ...], ...].
+
+    Returns:
+    nearest_coords : np.ndarray
+        The nearest row from coord_list for each target.
+    distances_km : np.ndarray
+        The great-circle distances in kilometers.
+    """
+    coords = np.asarray(coord_list, dtype=np.float64)
+    targets = np.asarray(target_coords, dtype=np.float64)[:, :2]
+
+    tree = BallTree(np.radians(coords[:, :2]), metric="haversine")
+    dist, idx = tree.query(np.radians(targets), k=1)
+    logger.debug("Queried {} nearest coordinates against {} points", len(targets), len(coords))
+
+    return coords[idx[:, 0]], dist[:, 0] * 6371.0
+
+
 def check_threshold(aurora_value, threshold):
     return aurora_value >= threshold
 
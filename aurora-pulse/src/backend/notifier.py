@@ -1,23 +1,44 @@
-import smtplib
+import threading
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from typing import List, Sequence, Tuple
 
 import streamlit as st
 from loguru import logger
 
+from .email_template import CompiledEmail
+from .smtp_pool import SmtpPool, WireMessage
 
-def send_notification(email: str, name: str, city: str, aurora_value: float) -> bool:
+_smtp_pool = None
+_smtp_pool_lock = threading.Lock()
+
+
+def get_smtp_pool() -> SmtpPool:
     """
-    User-facing aurora alert email notification.
+    Returns the process-wide SMTP session pool, configured from the [email] secrets on first use.
     """
-    subject = f"🌌 Aurora Alert for {city}"
-    text_body = f"""
+    global _smtp_pool
+    with _smtp_pool_lock:
+        if _smtp_pool is None:
+            email_cfg = st.secrets["email"]
+            _smtp_pool = SmtpPool(
+                email_cfg["smtp_server"],
+                email_cfg["smtp_port"],
+                username=email_cfg["sender_email"],
+                password=email_cfg["app_password"],
+            )
+        return _smtp_pool
+
+
+# Alert email templates, filled in with str.format(name=..., city=..., aurora_value=...)
+ALERT_SUBJECT = "🌌 Aurora Alert for {city}"
+ALERT_TEXT = """
     Hi {name} 🌌,
 
 Good news! An aurora event may be visible near {city}.
 
 """
-    html_body = f"""
+ALERT_HTML = """
 <!DOCTYPE html>
 <html>
 
@@ -62,7 +83,167 @@ Good news! An aurora event may be visible near {city}.
 
 </html>
 """
-    return send_email_notification(email, subject, html_body, text_body)
+
+# The alert templates compiled once per process; see email_template.CompiledEmail
+ALERT_EMAIL = CompiledEmail(ALERT_SUBJECT, ALERT_TEXT, ALERT_HTML, per_recipient=("name",))
+
+
+# Digest of the alerts for several of one user's locations; {location_lines} and {location_items} are the
+# DIGEST_TEXT_ROW and DIGEST_HTML_ROW of every location, filled in with city=..., aurora_value=...
+DIGEST_SUBJECT = "🌌 Aurora Alert for {count} of your locations"
+DIGEST_TEXT = """
+    Hi {name} 🌌,
+
+Good news! An aurora event may be visible near {count} of your locations:
+
+{location_lines}
+
+"""
+DIGEST_TEXT_ROW = "- {city} (Aurora Kp Intensity: {aurora_value})"
+DIGEST_HTML = """
+<!DOCTYPE html>
+<html>
+
+<body style="background-color:#0b1020;color:#ffffff;font-family:Arial,sans-serif;">
+  <table width="100%" cellpadding="0" cellspacing="0">
+    <tr>
+      <td align="center">
+        <table width="600" cellpadding="24" cellspacing="0" style="background:#12172b;border-radius:12px;">
+
+          <tr>
+            <td>
+              <h2 style="color:#cbd5ff;margin-top:0;">
+                Hi {name} 👋
+              </h2>
+
+              <h1 style="color:#7df9ff;">🌌 Aurora Alert</h1>
+
+              <p style="font-size:16px;">
+                Northern Lights may be visible near {count} of your locations:
+              </p>
+
+              <ul style="font-size:16px;">
+{location_items}
+              </ul>
+
+              <div style="background:#1b2140;border-radius:8px;padding:16px;margin-top:20px;">
+                🌠 Tip: Look north, avoid city lights, and check cloud cover.
+              </div>
+
+              <p style="margin-top:30px;color:#9aa4ff;">
+                Clear skies and happy chasing ✨<br />
+                — <strong>Aurora Pulse</strong>
+              </p>
+            </td>
+          </tr>
+
+        </table>
+      </td>
+    </tr>
+  </table>
+</body>
+
+</html>
+"""
+DIGEST_HTML_ROW = "                <li><strong>{city}</strong> ✨ Aurora Kp Intensity: {aurora_value}</li>"
+
+DIGEST_EMAIL = CompiledEmail(
+    DIGEST_SUBJECT, DIGEST_TEXT, DIGEST_HTML, per_recipient=("name", "location_lines", "location_items")
+)
+
+
+def build_alert_email(name: str, city: str, aurora_value: float) -> Tuple[str, str, str]:
+    """
+    User-facing aurora alert content.
+    Returns (subject, html_body, text_body).
+    """
+    fields = {"name": name, "city": city, "aurora_value": aurora_value}
+    return ALERT_SUBJECT.format(**fields), ALERT_HTML.format(**fields), ALERT_TEXT.format(**fields)
+
+
+def build_alert_message(sender: str, email: str, name: str, city: str, aurora_value: float) -> WireMessage:
+    """
+    The aurora alert for one recipient as wire-ready bytes, rendered from the compiled templates.
+    Same content as build_email_message(sender, email, *build_alert_email(name, city, aurora_value)).
+    """
+    data = ALERT_EMAIL.render(sender, email, name=name, city=city, aurora_value=aurora_value)
+    return WireMessage(sender, email, data)
+
+
+def _digest_fields(name: str, locations: Sequence[Tuple[str, float]]) -> dict:
+    rows = [{"city": city, "aurora_value": aurora_value} for city, aurora_value in locations]
+    return {
+        "name": name,
+        "count": len(rows),
+        "location_lines": "\n".join(DIGEST_TEXT_ROW.format(**row) for row in rows),
+        "location_items": "\n".join(DIGEST_HTML_ROW.format(**row) for row in rows),
+    }
+
+
+def build_digest_email(name: str, locations: Sequence[Tuple[str, float]]) -> Tuple[str, str, str]:
+    """
+    User-facing aurora alert for several locations at once, given as (city, aurora_value) pairs.
+    A single location gets the regular alert (see build_alert_email).
+    Returns (subject, html_body, text_body).
+    """
+    if len(locations) == 1:
+        return build_alert_email(name, *locations[0])
+    fields = _digest_fields(name, locations)
+    return DIGEST_SUBJECT.format(**fields), DIGEST_HTML.format(**fields), DIGEST_TEXT.format(**fields)
+
+
+def build_digest_message(sender: str, email: str, name: str, locations: Sequence[Tuple[str, float]]) -> WireMessage:
+    """
+    build_digest_email() for one recipient as wire-ready bytes, rendered from the compiled templates.
+    """
+    if len(locations) == 1:
+        return build_alert_message(sender, email, name, *locations[0])
+    return WireMessage(sender, email, DIGEST_EMAIL.render(sender, email, **_digest_fields(name, locations)))
+
+
+def send_digest(email: str, name: str, locations: Sequence[Tuple[str, float]]) -> bool:
+    """
+    Send one user a single aurora alert covering all of the given (city, aurora_value) locations.
+    """
+    try:
+        pool = get_smtp_pool()
+        msg = build_digest_message(st.secrets["email"]["sender_email"], email, name, locations)
+    except Exception as e:
+        logger.error(f"Failed to send email to {email}: {e}")
+        return False
+    return pool.send(msg)
+
+
+def send_digests(digests: Sequence[Tuple[str, str, Sequence[Tuple[str, float]]]]) -> List[bool]:
+    """
+    Send a batch of digests, given as (email, name, [(city, aurora_value), ...]) tuples, over the SMTP pool.
+    Returns one success flag per digest, in input order.
+    """
+    if not digests:
+        return []
+    try:
+        pool = get_smtp_pool()
+        sender = st.secrets["email"]["sender_email"]
+    except Exception as e:
+        logger.error(f"Failed to send {len(digests)} emails: {e}")
+        return [False] * len(digests)
+
+    return pool.send_many([build_digest_message(sender, *digest) for digest in digests])
+
+
+def send_notification(email: str, name: str, city: str, aurora_value: float) -> bool:
+    """
+    User-facing aurora alert email notification.
+    """
+    return send_digest(email, name, [(city, aurora_value)])
+
+
+def send_notifications(notifications: Sequence[Tuple[str, str, str, float]]) -> List[bool]:
+    """
+    Send a batch of aurora alerts, given as (email, name, city, aurora_value) tuples, over the SMTP pool.
+    Returns one success flag per notification, in input order.
+    """
+    return send_digests([(email, name, [(city, aurora_value)]) for email, name, city, aurora_value in notifications])
 
 
 def send_sms_notification(phone_number, message):
@@ -74,26 +255,31 @@ def send_sms_notification(phone_number, message):
 
 def send_email_notification(to_email: str, subject: str, html_body: str, text_body: str) -> bool:
     """
-    Send an HTML + plain text email using SMTP.
+    Send an HTML + plain text email using a pooled SMTP session.
     Returns True on success, False on failure.
     """
     try:
-        email_cfg = st.secrets["email"]
-
-        msg = MIMEMultipart()
-        msg["From"] = email_cfg["sender_email"]
-        msg["To"] = to_email
-        msg["Subject"] = subject
-
-        msg.attach(MIMEText(text_body, "plain"))
-        msg.attach(MIMEText(html_body, "html"))
-
-        with smtplib.SMTP(email_cfg["smtp_server"], email_cfg["smtp_port"]) as server:
-            server.starttls()
-            server.login(email_cfg["sender_email"], email_cfg["app_password"])
-            server.send_message(msg)
-        logger.info(f"Email sent to {to_email} with subject '{subject}'")
-        return True
+        pool = get_smtp_pool()
+        msg = build_email_message(st.secrets["email"]["sender_email"], to_email, subject, html_body, text_body)
     except Exception as e:
         logger.error(f"Failed to send email to {to_email}: {e}")
         return False
+
+    if pool.send(msg):
+        logger.info(f"Email sent to {to_email} with subject '{subject}'")
+        return True
+    return False
+
+
+def build_email_message(sender: str, to_email: str, subject: str, html_body: str, text_body: str) -> MIMEMultipart:
+    """
+    Assemble an HTML + plain text email.
+    """
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = to_email
+    msg["Subject"] = subject
+
+    msg.attach(MIMEText(text_body, "plain"))
+    msg.attach(MIMEText(html_body, "html"))
+    return msg
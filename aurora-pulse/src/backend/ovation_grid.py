@@ -0,0 +1,266 @@
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+# The OVATION product is a regular 1°x1° grid: latitude -90..90 (rows), longitude 0..359 (columns)
+GRID_LATS = 181
+GRID_LONS = 360
+GRID_SHAPE = (GRID_LATS, GRID_LONS)
+GRID_SIZE = GRID_LATS * GRID_LONS
+
+# Subscriptions are indexed by coarse tiles of TILE_DEG x TILE_DEG grid cells so sweeps can skip quiet regions
+TILE_DEG = 10
+TILE_ROWS = -(-GRID_LATS // TILE_DEG)
+TILE_COLS = GRID_LONS // TILE_DEG
+TILE_COUNT = TILE_ROWS * TILE_COLS
+
+# Binary snapshot file: a fixed header followed by the uint8 intensity grid in row-major order
+SNAPSHOT_MAGIC = b"AURG"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = np.dtype(
+    [
+        ("magic", "S4"),
+        ("version", "<u4"),
+        ("observation_time", "<i8"),  # epoch seconds, 0 if unknown
+        ("forecast_time", "<i8"),
+        ("rows", "<u2"),
+        ("cols", "<u2"),
+        ("reserved", "V4"),
+    ]
+)
+_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"  # NOAA's timestamp format
+
+
+def time_to_epoch(value: str) -> int:
+    """
+    Converts an OVATION time string (e.g. "2025-01-01T00:30:00Z") to epoch seconds; a missing time becomes 0.
+    """
+    if not value:
+        return 0
+    return int(datetime.strptime(value, _TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+
+
+def epoch_to_time(epoch: int):
+    """
+    Converts epoch seconds back to an OVATION time string, the inverse of time_to_epoch (0 becomes None).
+    """
+    if not epoch:
+        return None
+    return datetime.fromtimestamp(int(epoch), tz=timezone.utc).strftime(_TIME_FORMAT)
+
+
+def _check_header(header: np.ndarray):
+    if len(header) != 1 or header["magic"][0] != SNAPSHOT_MAGIC or header["version"][0] != SNAPSHOT_VERSION:
+        raise ValueError("Not an aurora snapshot")
+
+
+def cell_index(lat, lon):
+    """
+    Map latitude/longitude (scalars or arrays, decimal degrees) to the nearest grid cell.
+
+    Longitudes are wrapped onto 0..359 (so -180..180 inputs and 359.6 -> 0 both work) and latitudes are
+    clamped onto -90..90, so anything at or beyond a pole lands on the pole row.
+
+    Returns:
+        (row, col) integer index arrays into a GRID_SHAPE array.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    row = np.clip(np.rint(lat), -90, 90).astype(np.intp) + 90
+    col = np.rint(lon).astype(np.intp) % GRID_LONS
+    return row, col
+
+
+def cell_id(lat, lon):
+    """
+    Map latitude/longitude (scalars or arrays) to the flat index (row * GRID_LONS + col) of their nearest grid
+    cell, as stored with each subscription so sweeps can read its intensity without redoing the mapping.
+    """
+    row, col = cell_index(lat, lon)
+    return row * GRID_LONS + col
+
+
+def tile_index(lat, lon):
+    """
+    Map latitude/longitude (scalars or arrays) to the index of the tile containing their nearest grid cell.
+    """
+    row, col = cell_index(lat, lon)
+    return (row // TILE_DEG) * TILE_COLS + col // TILE_DEG
+
+
+def tile_max(values: np.ndarray) -> np.ndarray:
+    """
+    Maximum of a GRID_SHAPE array within each tile, indexed like tile_index().
+    """
+    padded = np.zeros((TILE_ROWS * TILE_DEG, GRID_LONS), dtype=values.dtype)
+    padded[:GRID_LATS] = values
+    return padded.reshape(TILE_ROWS, TILE_DEG, TILE_COLS, TILE_DEG).max(axis=(1, 3)).ravel()
+
+
+class OvationGrid:
+    """
+    Dense intensity grid for one OVATION snapshot.
+
+    Built once per NOAA response; nearest-cell lookups are plain index arithmetic instead of a BallTree query.
+    """
+
+    def __init__(self, intensity: np.ndarray, observation_time: str = None, forecast_time: str = None):
+        intensity = np.asanyarray(intensity)
+        if intensity.shape != GRID_SHAPE:
+            raise ValueError(f"Expected intensity grid of shape {GRID_SHAPE}, got {intensity.shape}")
+        self.intensity = intensity
+        self.observation_time = observation_time
+        self.forecast_time = forecast_time
+
+    @classmethod
+    def from_coordinates(cls, coordinates, observation_time: str = None, forecast_time: str = None):
+        """
+        Build a grid from NOAA [lon, lat, intensity] rows.
+        Raises ValueError if the rows do not cover the regular 1° grid exactly once.
+        """
+        coords = np.asarray(coordinates, dtype=np.float64)
+        if coords.ndim != 2 or coords.shape[0] != GRID_SIZE or coords.shape[1] < 3:
+            raise ValueError(f"Expected {GRID_SIZE} [lon, lat, intensity] rows, got shape {coords.shape}")
+
+        lon, lat, values = coords[:, 0], coords[:, 1], coords[:, 2]
+        if not (np.array_equal(lon, np.rint(lon)) and np.array_equal(lat, np.rint(lat))):
+            raise ValueError("Coordinates are not on integer degrees")
+        if lat.min() < -90 or lat.max() > 90:
+            raise ValueError("Latitude out of range")
+
+        row, col = cell_index(lat, lon)
+        flat = row * GRID_LONS + col
+        if np.unique(flat).size != GRID_SIZE:
+            raise ValueError("Coordinates do not cover every grid cell exactly once")
+
+        intensity = np.zeros(GRID_SIZE, dtype=np.uint8)
+        intensity[flat] = np.clip(np.rint(values), 0, 255)
+        return cls(intensity.reshape(GRID_SHAPE), observation_time, forecast_time)
+
+    @classmethod
+    def from_irregular_coordinates(cls, coordinates, observation_time: str = None, forecast_time: str = None):
+        """
+        Resample arbitrary [lon, lat, intensity] rows onto the regular grid, taking each cell's value from the
+        nearest input point (great-circle distance).
+        """
+        # Imported here to keep sklearn off the import path of the regular-grid code
+        from src.backend.nearest_neighbour import find_nearest_coords
+
+        coords = np.asarray(coordinates, dtype=np.float64)
+        if coords.ndim != 2 or coords.shape[0] == 0 or coords.shape[1] < 3:
+            raise ValueError(f"Expected [lon, lat, intensity] rows, got shape {coords.shape}")
+
+        lats, lons = np.meshgrid(np.arange(-90, 91), np.arange(GRID_LONS), indexing="ij")
+        targets = np.column_stack([lats.ravel(), lons.ravel()])
+        nearest, _ = find_nearest_coords(targets, coords[:, [1, 0, 2]])
+        intensity = np.clip(np.rint(nearest[:, 2]), 0, 255).astype(np.uint8)
+        return cls(intensity.reshape(GRID_SHAPE), observation_time, forecast_time)
+
+    @classmethod
+    def from_payload(cls, data: dict, resample: bool = False):
+        """
+        Build a grid from the raw NOAA OVATION JSON payload.
+        With resample=True, payloads that are not a regular grid are resampled instead of rejected.
+        """
+        coordinates = data.get("coordinates", [])
+        times = {"observation_time": data.get("Observation Time"), "forecast_time": data.get("Forecast Time")}
+        try:
+            return cls.from_coordinates(coordinates, **times)
+        except ValueError:
+            if not resample:
+                raise
+            return cls.from_irregular_coordinates(coordinates, **times)
+
+    @property
+    def snapshot_id(self) -> str:
+        """
+        Stable identifier of this snapshot: its forecast time as epoch seconds, or a content hash if unknown.
+        """
+        forecast_epoch = time_to_epoch(self.forecast_time)
+        if forecast_epoch:
+            return str(forecast_epoch)
+        return hashlib.sha1(np.ascontiguousarray(self.intensity).tobytes()).hexdigest()[:16]
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialise the grid in the binary snapshot format (header followed by the uint8 grid).
+        """
+        header = np.zeros(1, dtype=SNAPSHOT_HEADER)
+        header["magic"] = SNAPSHOT_MAGIC
+        header["version"] = SNAPSHOT_VERSION
+        header["observation_time"] = time_to_epoch(self.observation_time)
+        header["forecast_time"] = time_to_epoch(self.forecast_time)
+        header["rows"], header["cols"] = GRID_SHAPE
+        return header.tobytes() + np.ascontiguousarray(self.intensity, dtype=np.uint8).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """
+        Parse bytes produced by to_bytes(). The intensity array is a read-only view of data.
+        """
+        header = np.frombuffer(data, dtype=SNAPSHOT_HEADER, count=1)
+        _check_header(header)
+        intensity = np.frombuffer(data, dtype=np.uint8, offset=SNAPSHOT_HEADER.itemsize).reshape(GRID_SHAPE)
+        return cls._from_header(header, intensity)
+
+    def save(self, path: str):
+        """
+        Write the grid as a binary snapshot file. The file is replaced atomically, so concurrent readers
+        (including existing memory maps) always see a complete snapshot.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.to_bytes())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Memory-map a binary snapshot file written by save(). The intensity array is read-only and shared
+        through the page cache with every other process mapping the same file.
+        """
+        header = np.fromfile(path, dtype=SNAPSHOT_HEADER, count=1)
+        _check_header(header)
+        intensity = np.memmap(path, dtype=np.uint8, mode="r", offset=SNAPSHOT_HEADER.itemsize, shape=GRID_SHAPE)
+        return cls._from_header(header, intensity)
+
+    @classmethod
+    def _from_header(cls, header: np.ndarray, intensity: np.ndarray):
+        return cls(
+            intensity,
+            observation_time=epoch_to_time(header["observation_time"][0]),
+            forecast_time=epoch_to_time(header["forecast_time"][0]),
+        )
+
+    def intensity_at(self, lat, lon):
+        """
+        Intensity of the grid cell nearest to each latitude/longitude (scalars or arrays).
+        """
+        row, col = cell_index(lat, lon)
+        return self.intensity[row, col]
+
+    def intensity_at_cells(self, cells):
+        """
+        Intensity of grid cells given by flat index (see cell_id), e.g. the stored cells of subscriptions.
+        """
+        return self.intensity.reshape(GRID_SIZE)[cells]
+
+    def tile_max(self) -> np.ndarray:
+        """
+        Maximum intensity within each tile, indexed like tile_index().
+        """
+        return tile_max(self.intensity)
+
+    def points(self):
+        """
+        Returns list of [lat, lon, intensity] for every grid cell.
+        """
+        lats, lons = np.meshgrid(np.arange(-90, 91), np.arange(GRID_LONS), indexing="ij")
+        return np.column_stack([lats.ravel(), lons.ravel(), self.intensity.ravel()]).tolist()
@@ -0,0 +1,272 @@
+"""
+Single-node parallel sweep: alert evaluation spread over a pool of processes on one machine.
+
+The delta candidates are loaded straight into a shared memory block, and the intensity grid is copied into another;
+pool processes attach to them by name and each evaluates a disjoint slice, so a task is a few names and bounds
+instead of a pickle of the data. The slices' alert IDs are merged into one batch in the sweeping process, which then
+notifies as usual.
+
+Starting a pool costs far more than evaluating a sweep, so a worker process keeps one evaluator (its pool and its
+blocks, which are reused while large enough) for all of its sweeps, see get_evaluator().
+"""
+
+import atexit
+import multiprocessing
+import os
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.pool import Pool
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from .alerts import (
+    SweepResult,
+    _alert_mask,
+    _record_evaluation,
+    evaluate_due,
+    iter_delta_candidates,
+    notify_due,
+    resume_after,
+)
+from .config import MIN_ALERT_GAP, SWEEP_PROCESSES
+from .db import clear_pending
+from .metrics import SWEEP_STAGE_SECONDS
+from .ovation_grid import GRID_SIZE, OvationGrid
+from .storage import SUBSCRIPTION_DTYPE, SweepState
+
+SLICES_PER_PROCESS = 4  # Slices per pool process, so a process that is slowed down does not hold up the sweep
+MIN_SLICE = 50_000  # Fewest subscriptions worth a slice; smaller sweeps are evaluated in-process
+
+# (shared memory name, shape, dtype) of a SharedArray, as sent to pool processes
+ArraySpec = Tuple[str, tuple, np.dtype]
+
+
+class SharedArray:
+    """
+    One-dimensional array of `capacity` elements in a shared memory block, which other processes attach to by name
+    (see spec). The creating process unlinks the block on close().
+    """
+
+    def __init__(self, capacity: int, dtype):
+        dtype = np.dtype(dtype)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(capacity * dtype.itemsize, 1))
+        self.array = np.ndarray((capacity,), dtype=dtype, buffer=self._shm.buf)
+        self.spec: ArraySpec = (self._shm.name, (capacity,), dtype)
+
+    def holds(self, array: np.ndarray) -> bool:
+        """
+        Whether array is a view of the start of this block (as returned by ParallelEvaluator.load).
+        """
+        return (
+            array.dtype == self.array.dtype
+            and len(array) <= len(self.array)
+            and array.__array_interface__["data"][0] == self.array.__array_interface__["data"][0]
+            and array.flags.c_contiguous
+        )
+
+    def close(self):
+        self.array = None  # the buffer cannot be released while a view of it exists
+        self._shm.unlink()
+        _unmap(self._shm)
+
+
+# Blocks unlinked while views of them were still around (e.g. a ParallelEvaluator.load result), to unmap later
+_unmapped: List[shared_memory.SharedMemory] = []
+
+
+def _unmap(shm: shared_memory.SharedMemory):
+    for block in _unmapped + [shm]:
+        try:
+            block.close()
+        except BufferError:
+            if block not in _unmapped:
+                _unmapped.append(block)
+        else:
+            if block in _unmapped:
+                _unmapped.remove(block)
+
+
+# Blocks a pool process is attached to, by name: those of the evaluator's current grid and subscriptions
+_attached: Dict[str, Tuple[shared_memory.SharedMemory, np.ndarray]] = {}
+
+
+def _attach(spec: ArraySpec) -> np.ndarray:
+    name, shape, dtype = spec
+    if name not in _attached:
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return _attached[name][1]
+
+
+def _detach_all_but(names):
+    for name in [name for name in _attached if name not in names]:
+        shm, _ = _attached.pop(name)
+        shm.close()
+
+
+def _evaluate_slice(task) -> Tuple[np.ndarray, np.ndarray, int]:
+    # Runs in a pool process: (IDs to notify, IDs held back by min_gap, invalid thresholds) of a slice
+    grid_spec, subs_spec, start, stop, now_epoch, min_gap = task
+    _detach_all_but({grid_spec[0], subs_spec[0]})
+    intensity = _attach(grid_spec)
+    subs = _attach(subs_spec)[start:stop]
+    fire, hits, invalid = _alert_mask(intensity[subs["cell"]], subs, now_epoch, min_gap)
+    return subs["id"][fire], subs["id"][hits & ~fire], invalid
+
+
+def _context():
+    # Workers and their sweeps run threads (metrics server, SMTP pool), which fork() does not copy safely; pool
+    # processes are forked from a single-threaded server instead, which has this module imported already
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+class ParallelEvaluator:
+    """
+    Evaluates alerts like alerts.evaluate_due on a pool of `processes` processes, started on first use and
+    reused until close() (or the end of a with block), as are its shared blocks.
+    Not thread-safe: one sweep at a time per evaluator.
+    """
+
+    def __init__(self, processes: int = SWEEP_PROCESSES, min_slice: int = MIN_SLICE):
+        self.processes = processes
+        self.min_slice = min_slice
+        self._pool: Optional[Pool] = None
+        self._grid: Optional[SharedArray] = None
+        self._subs: Optional[SharedArray] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        for block in (self._grid, self._subs):
+            if block is not None:
+                block.close()
+        self._grid = self._subs = None
+
+    def _slices(self, count: int) -> int:
+        # Slices count subscriptions are split into, below 2 if they are evaluated in-process
+        return 0 if self.processes < 2 else min(self.processes * SLICES_PER_PROCESS, count // self.min_slice)
+
+    def _block(self, current: Optional[SharedArray], count: int, dtype) -> SharedArray:
+        # current if it can hold count elements of dtype, otherwise a new block with some headroom to grow into
+        if current is not None and len(current.array) >= count and current.array.dtype == dtype:
+            return current
+        if current is not None:
+            current.close()  # pool processes still attached to it detach with their next task
+        return SharedArray(count + count // 4, dtype)
+
+    def load(self, chunks: List[np.ndarray]) -> np.ndarray:
+        """
+        Concatenates chunks of subscription columns, straight into the shared block of the subscriptions if there
+        are enough of them to be split, so evaluate() does not copy them again. The result is only valid until the
+        next load() or close().
+        """
+        count = sum(len(chunk) for chunk in chunks)
+        if self._slices(count) < 2:
+            return np.concatenate(chunks) if chunks else np.empty(0, dtype=SUBSCRIPTION_DTYPE)
+        self._subs = self._block(self._subs, count, SUBSCRIPTION_DTYPE)
+        return np.concatenate(chunks, out=self._subs.array[:count])
+
+    def evaluate(
+        self, grid: OvationGrid, subs: np.ndarray, now_epoch: int, min_gap: int = MIN_ALERT_GAP
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (IDs of the subscriptions to notify, IDs held back by min_gap), in the order of subs, with the same logging
+        and metrics as alerts.evaluate_due. Sweeps too small to split across the processes are evaluated in this
+        process.
+        """
+        slices = self._slices(len(subs))
+        if slices < 2:
+            return evaluate_due(grid.intensity_at_cells(subs["cell"]), subs, now_epoch, min_gap)
+
+        if self._pool is None:
+            # Started before the pool so its processes share it: one started by a pool process on attaching would
+            # "clean up" (unlink) the blocks again when that process exits
+            resource_tracker.ensure_running()
+            self._pool = _context().Pool(self.processes)
+        intensity = np.asarray(grid.intensity).reshape(GRID_SIZE)
+        self._grid = self._block(self._grid, GRID_SIZE, intensity.dtype)
+        self._grid.array[:GRID_SIZE] = intensity
+        if self._subs is None or not self._subs.holds(subs):
+            # Not loaded through load(): copied in
+            self._subs = self._block(self._subs, len(subs), subs.dtype)
+            self._subs.array[: len(subs)] = subs
+
+        bounds = np.linspace(0, len(subs), slices + 1).astype(int).tolist()
+        tasks = [
+            (self._grid.spec, self._subs.spec, start, stop, now_epoch, min_gap)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        results = self._pool.map(_evaluate_slice, tasks, chunksize=1)
+
+        alert_ids = np.concatenate([ids for ids, _, _ in results])
+        held_ids = np.concatenate([held for _, held, _ in results])
+        _record_evaluation(len(alert_ids), len(alert_ids) + len(held_ids), sum(bad for *_, bad in results))
+        logger.debug("Evaluated {} subscriptions in {} slices", len(subs), slices)
+        return alert_ids, held_ids
+
+
+# The evaluators of this process, by process count, and the process they belong to (a forked child starts its own)
+_evaluators: Dict[int, ParallelEvaluator] = {}
+_evaluators_pid: Optional[int] = None
+
+
+def get_evaluator(processes: int = SWEEP_PROCESSES) -> ParallelEvaluator:
+    """
+    This process's ParallelEvaluator of `processes` processes, kept (with its pool) until the process exits.
+    """
+    global _evaluators, _evaluators_pid
+    if _evaluators_pid != os.getpid():
+        if _evaluators_pid is None:
+            atexit.register(close_evaluators)
+        _evaluators, _evaluators_pid = {}, os.getpid()
+    if processes not in _evaluators:
+        _evaluators[processes] = ParallelEvaluator(processes)
+    return _evaluators[processes]
+
+
+def close_evaluators():
+    """
+    Closes the evaluators of get_evaluator(), stopping their pools and releasing their shared blocks.
+    """
+    if _evaluators_pid != os.getpid():
+        return
+    while _evaluators:
+        _evaluators.popitem()[1].close()
+
+
+def sweep_parallel(
+    grid: OvationGrid,
+    state: SweepState,
+    after_id: int = 0,
+    max_id: Optional[int] = None,
+    outbox=None,
+    processes: int = SWEEP_PROCESSES,
+) -> SweepResult:
+    """
+    alerts.sweep_subscriptions on this machine's cores: the delta candidates are loaded in full, evaluated in one
+    pass by this process's ParallelEvaluator and the alerts that fire are notified (through outbox if given).
+    """
+    started = datetime.now()
+    evaluator = get_evaluator(processes)
+    with SWEEP_STAGE_SECONDS.time(stage="load"):
+        chunks = list(iter_delta_candidates(grid, state, after_id=after_id, max_id=max_id))
+        subs = evaluator.load(chunks)
+    result = SweepResult()
+    if len(subs):
+        result = notify_due(grid, subs, outbox=outbox, evaluate=evaluator.evaluate)
+    clear_pending(resume_after(grid, state, after_id), max_id, started)
+    return result
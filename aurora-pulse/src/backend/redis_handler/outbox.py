@@ -0,0 +1,372 @@
+import asyncio
+import json
+import os
+import random
+import socket
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+from src.backend.config import (
+    MIN_ALERT_GAP,
+    OUTBOX_CLAIM_IDLE,
+    OUTBOX_CONFIRM_BATCH,
+    OUTBOX_CONFIRM_INTERVAL,
+    OUTBOX_KEY_TTL,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_BASE,
+    OUTBOX_SENDERS,
+)
+from src.backend.metrics import ALERTS_DELIVERED, push_metrics
+
+from .redis_conn import REDIS_URL, redis_conn
+
+OUTBOX_STREAM = "aurora:outbox"
+OUTBOX_GROUP = "senders"
+RETRY_MAX_DELAY = 60  # Seconds; cap of the exponential retry delay
+
+# (subscription ID, email, name, city, threshold) of an alert to deliver
+AlertIntent = Tuple[int, str, str, str, int]
+
+
+class Outbox:
+    """
+    Durable queue of alert intents in a Redis stream, written by sweeps and drained by OutboxSender.
+
+    Every intent carries an idempotency key (subscription and snapshot), so a retried sweep or shard of the same
+    snapshot does not queue the same alert twice.
+
+    Intents are held back per user until the sweep of the snapshot releases them, so a user whose locations are
+    spread over several shards gets one digest email listing all of them: publish() appends each intent to its
+    user's digest list for the snapshot, and release() turns every digest into one stream entry.
+    """
+
+    def __init__(self, connection=redis_conn, stream: str = OUTBOX_STREAM):
+        self.connection = connection
+        self.stream = stream
+
+    def _digests_key(self, snapshot_id: str) -> str:
+        return f"{self.stream}:digests:{snapshot_id}"
+
+    def _digest_key(self, snapshot_id: str, email: str) -> str:
+        return f"{self.stream}:digest:{snapshot_id}:{email}"
+
+    def publish(self, intents: Sequence[AlertIntent], snapshot_id: str, alert_time: datetime) -> int:
+        """
+        Queue alerts for delivery once the snapshot is released (see release()).
+        Returns how many were queued (intents already queued for the snapshot are not).
+        """
+        pipe = self.connection.pipeline()
+        for sub_id, *_ in intents:
+            pipe.set(f"{self.stream}:key:{sub_id}:{snapshot_id}", 1, nx=True, ex=OUTBOX_KEY_TTL)
+        fresh = pipe.execute()
+
+        by_email: Dict[str, List[str]] = {}
+        for (sub_id, email, name, city, threshold), is_new in zip(intents, fresh):
+            if is_new:
+                item = {"sub_id": sub_id, "name": name, "city": city, "threshold": threshold}
+                by_email.setdefault(email, []).append(json.dumps({**item, "alert_time": alert_time.isoformat()}))
+
+        queued = sum(len(items) for items in by_email.values())
+        if by_email:
+            digests_key = self._digests_key(snapshot_id)
+            pipe = self.connection.pipeline()
+            for email, items in by_email.items():
+                pipe.rpush(self._digest_key(snapshot_id, email), *items)
+                pipe.expire(self._digest_key(snapshot_id, email), OUTBOX_KEY_TTL)
+            pipe.sadd(digests_key, *by_email)
+            pipe.expire(digests_key, OUTBOX_KEY_TTL)
+            pipe.execute()
+        if queued < len(intents):
+            logger.info(f"{len(intents) - queued} alerts were already queued for snapshot {snapshot_id}")
+        return queued
+
+    def release(self, snapshot_id: str) -> int:
+        """
+        Hand every user's alerts queued for the snapshot to the senders as one digest entry per user.
+        Returns the number of digests released.
+        """
+        digests_key = self._digests_key(snapshot_id)
+        released = 0
+        for email in self.connection.smembers(digests_key):
+            email = email.decode()
+            digest_key = self._digest_key(snapshot_id, email)
+            # Drained in one MULTI/EXEC, so alerts a late shard pushes meanwhile are left for the next release
+            # (should this worker die before the XADD, the drained alerts are still pending in the DB)
+            pipe = self.connection.pipeline(transaction=True)
+            pipe.lrange(digest_key, 0, -1)
+            pipe.delete(digest_key)
+            pipe.srem(digests_key, email)
+            items = [json.loads(item) for item in pipe.execute()[0]]
+            if items:
+                fields = {"email": email, "name": items[0]["name"], "key": f"{email}:{snapshot_id}"}
+                self.connection.xadd(self.stream, {**fields, "items": json.dumps(items)})
+                released += 1
+        return released
+
+
+def retry_delay(attempt: int, base: float = OUTBOX_RETRY_BASE) -> float:
+    """
+    Seconds to wait before retry number attempt (1, 2, ...): exponential backoff with full jitter, so senders
+    retrying after the same outage do not hit the SMTP server in lockstep.
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY, base * 2 ** (attempt - 1)))
+
+
+def _default_send(email: str, name: str, locations: List[Tuple[str, int]]) -> bool:
+    # Imported here so the publishing side (sweep workers) does not load the notifier and its Streamlit secrets
+    from src.backend.notifier import send_digest
+
+    return send_digest(email, name, locations)
+
+
+def _default_confirm(sub_ids: List[int], alert_time: datetime):
+    from src.backend.db import bulk_update_last_alert_sent
+
+    bulk_update_last_alert_sent(sub_ids, alert_time)
+
+
+class OutboxSender:
+    """
+    Drains the outbox with a pool of asyncio sender tasks.
+
+    - Backpressure: entries are read from the stream only as fast as `concurrency` senders take them; the rest
+      stays durably in Redis.
+    - Retries: a failed delivery is retried up to max_attempts times with jittered exponential backoff, then moved
+      to the dead-letter stream.
+    - Idempotency: before sending, a sender claims each subscription of a digest for MIN_ALERT_GAP, so redelivered
+      entries (a crashed sender) or alerts from overlapping sweeps never reach a user twice; a digest only lists
+      the locations it could claim.
+    - Confirmation: delivered alerts are written back with one bulk_update_last_alert_sent per confirm_batch and
+      only then acknowledged, so an entry is not lost if the sender dies in between.
+
+    send(email, name, [(city, threshold), ...]) -> bool and confirm(sub_ids, alert_time) are blocking calls run in
+    threads.
+    """
+
+    def __init__(
+        self,
+        connection,
+        send: Callable[[str, str, List[Tuple[str, int]]], bool] = _default_send,
+        confirm: Callable[[List[int], datetime], None] = _default_confirm,
+        stream: str = OUTBOX_STREAM,
+        consumer: Optional[str] = None,
+        concurrency: int = OUTBOX_SENDERS,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        retry_base: float = OUTBOX_RETRY_BASE,
+        confirm_batch: int = OUTBOX_CONFIRM_BATCH,
+        confirm_interval: float = OUTBOX_CONFIRM_INTERVAL,
+        claim_idle: float = OUTBOX_CLAIM_IDLE,
+        metrics_connection=None,
+    ):
+        self.connection = connection
+        self.send = send
+        self.confirm = confirm
+        self.stream = stream
+        self.dead_letter_stream = f"{stream}:dead"
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.confirm_batch = confirm_batch
+        self.confirm_interval = confirm_interval
+        self.claim_idle = claim_idle
+        self.metrics_connection = metrics_connection  # (blocking) Redis client metrics are pushed to, if any
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._in_flight = 0
+        self._delivered: List[Tuple[bytes, int, str]] = []  # (entry ID, subscription ID, alert time) to confirm
+        self._acks: List[bytes] = []  # entries to acknowledge without a database write
+        self._held = set()  # entries this process is working on, until they are acknowledged
+        self._confirm_lock: Optional[asyncio.Lock] = None
+
+    async def _ensure_group(self):
+        try:
+            await self.connection.xgroup_create(self.stream, OUTBOX_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run(self, stop: Optional[asyncio.Event] = None, burst: bool = False):
+        """
+        Deliver queued alerts until stop is set, or with burst=True until the outbox is empty.
+        """
+        stop = stop or asyncio.Event()
+        self._queue = asyncio.Queue(maxsize=self.concurrency)
+        self._confirm_lock = asyncio.Lock()
+        await self._ensure_group()
+
+        senders = [asyncio.create_task(self._send_loop()) for _ in range(self.concurrency)]
+        flusher = asyncio.create_task(self._flush_loop())
+        try:
+            # Entries left unconfirmed by this consumer (a restart) or stale ones of a crashed one are taken first
+            last_id = "0"
+            while entries := await self._read(last_id):
+                await self._enqueue(entries)
+                last_id = entries[-1][0]
+            await self._enqueue(await self._claim_stale())
+            last_claim = asyncio.get_running_loop().time()
+
+            while not stop.is_set():
+                entries = await self._read(">", block=100 if burst else 1000)
+                await self._enqueue(entries)
+                await asyncio.sleep(0)  # let the senders start on what was read before reading more
+                if burst and not entries and self._queue.empty() and not self._in_flight:
+                    break
+                if asyncio.get_running_loop().time() - last_claim > self.claim_idle / 2:
+                    await self._enqueue(await self._claim_stale())
+                    last_claim = asyncio.get_running_loop().time()
+
+            await self._queue.join()
+        finally:
+            for task in senders + [flusher]:
+                task.cancel()
+            await asyncio.gather(*senders, flusher, return_exceptions=True)
+            await self._flush()
+
+    async def _read(self, entry_id: str, block: Optional[int] = None) -> list:
+        # Only as many entries as there are free senders: the stream is the buffer, not this process
+        count = max(1, self._queue.maxsize - self._queue.qsize())
+        response = await self.connection.xreadgroup(
+            OUTBOX_GROUP, self.consumer, {self.stream: entry_id}, count=count, block=block
+        )
+        return response[0][1] if response else []
+
+    async def _claim_stale(self) -> list:
+        _, entries, *_ = await self.connection.xautoclaim(
+            self.stream, OUTBOX_GROUP, self.consumer, int(self.claim_idle * 1000), "0-0", count=self.concurrency
+        )
+        if entries:
+            logger.warning(f"Took over {len(entries)} alerts left unconfirmed by another sender")
+        return entries
+
+    async def _enqueue(self, entries: list):
+        for entry_id, fields in entries:
+            if entry_id in self._held:
+                continue  # idle only because its delivery is being retried or confirmed here
+            self._held.add(entry_id)
+            if fields:  # entries deleted while pending come back without fields
+                await self._queue.put((entry_id, {k.decode(): v.decode() for k, v in fields.items()}))
+            else:
+                self._acks.append(entry_id)
+
+    async def _send_loop(self):
+        while True:
+            entry_id, fields = await self._queue.get()
+            self._in_flight += 1
+            try:
+                await self._deliver(entry_id, fields)
+            except Exception as e:
+                # Left pending: a sender takes it over after claim_idle
+                logger.error(f"Failed to process outbox entry {entry_id}: {e}")
+                self._held.discard(entry_id)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _deliver(self, entry_id: bytes, fields: Dict[str, str]):
+        key = fields["key"]
+        items = json.loads(fields["items"])
+        # Claim each subscription for this digest ("pending:<key>", then "sent:<key>" once delivered)
+        claim_keys = [f"{self.stream}:sent:{item['sub_id']}" for item in items]
+        pipe = self.connection.pipeline()
+        for claim_key in claim_keys:
+            pipe.set(claim_key, f"pending:{key}", nx=True, ex=MIN_ALERT_GAP)
+        claimed = await pipe.execute()
+        pipe = self.connection.pipeline()
+        for claim_key in claim_keys:
+            pipe.get(claim_key)
+        claims = [(claim or b"").decode() for claim in await pipe.execute()]
+
+        to_send, already_sent = [], []
+        for item, claim_key, is_new, claim in zip(items, claim_keys, claimed, claims):
+            if is_new or claim == f"pending:{key}":
+                # Claimed now, or a sender died while sending this very digest and whether it went out is unknown
+                to_send.append((item, claim_key))
+            elif claim == f"sent:{key}":
+                # Sent before a crash or restart but never confirmed: confirm it without sending again
+                already_sent.append(item)
+            else:
+                logger.info(f"Subscription {item['sub_id']} was alerted within MIN_ALERT_GAP, dropping duplicate alert")
+
+        if not to_send:
+            await self._confirmed(entry_id, already_sent)
+            return
+
+        locations = [(item["city"], int(item["threshold"])) for item, _ in to_send]
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                delivered = await asyncio.to_thread(self.send, fields["email"], fields["name"], locations)
+            except Exception as e:
+                logger.warning(f"Alert for {fields['email']} raised on attempt {attempt}: {e}")
+                delivered = False
+            if delivered:
+                ALERTS_DELIVERED.inc(len(to_send), result="delivered")
+                pipe = self.connection.pipeline()
+                for _, claim_key in to_send:
+                    pipe.set(claim_key, f"sent:{key}", ex=MIN_ALERT_GAP)
+                await pipe.execute()
+                await self._confirmed(entry_id, already_sent + [item for item, _ in to_send])
+                return
+            if attempt < self.max_attempts:
+                await asyncio.sleep(retry_delay(attempt, self.retry_base))
+
+        ALERTS_DELIVERED.inc(len(to_send), result="failed")
+        logger.error(f"Alert for {fields['email']} failed {self.max_attempts} times, moving it to dead letters")
+        pipe = self.connection.pipeline()
+        pipe.xadd(self.dead_letter_stream, fields)
+        pipe.delete(*(claim_key for _, claim_key in to_send))  # still pending in the DB: later sweeps retry
+        await pipe.execute()
+        await self._confirmed(entry_id, already_sent)
+
+    async def _confirmed(self, entry_id: bytes, items: List[dict]):
+        if not items:
+            self._acks.append(entry_id)
+            return
+        self._delivered.extend((entry_id, int(item["sub_id"]), item["alert_time"]) for item in items)
+        if len(self._delivered) >= self.confirm_batch:
+            await self._flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.confirm_interval)
+            await self._flush()
+            if self.metrics_connection is not None:
+                try:
+                    await asyncio.to_thread(push_metrics, self.metrics_connection)
+                except Exception as e:
+                    logger.warning(f"Failed to push metrics: {e}")
+
+    async def _flush(self):
+        """
+        Write the delivered alerts back to the database, then acknowledge and delete their entries.
+        """
+        async with self._confirm_lock:
+            delivered, self._delivered = self._delivered, []
+            acks, self._acks = self._acks, []
+            by_time: Dict[str, List[int]] = {}
+            for _, sub_id, alert_time in delivered:
+                by_time.setdefault(alert_time, []).append(sub_id)
+            try:
+                for alert_time, sub_ids in by_time.items():
+                    await asyncio.to_thread(self.confirm, sub_ids, datetime.fromisoformat(alert_time))
+            except Exception as e:
+                # Not acknowledged: the entries are taken over and confirmed (not re-sent) after claim_idle
+                logger.error(f"Failed to confirm {len(delivered)} delivered alerts: {e}")
+                self._held.difference_update(entry_id for entry_id, *_ in delivered)
+                delivered = []
+
+            entry_ids = list(dict.fromkeys([entry_id for entry_id, *_ in delivered] + acks))
+            if entry_ids:
+                pipe = self.connection.pipeline()
+                pipe.xack(self.stream, OUTBOX_GROUP, *entry_ids)
+                pipe.xdel(self.stream, *entry_ids)
+                await pipe.execute()
+                self._held.difference_update(entry_ids)
+
+
+if __name__ == "__main__":
+    import redis.asyncio
+
+    logger.info("Starting outbox sender...")
+    asyncio.run(OutboxSender(redis.asyncio.from_url(REDIS_URL), metrics_connection=redis_conn).run())
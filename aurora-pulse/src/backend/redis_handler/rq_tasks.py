@@ -1,57 +1,237 @@
-from datetime import datetime, timedelta
+import functools
+import os
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import Optional
 
+import numpy as np
 from loguru import logger
-from src.backend.config import KP_TO_OVATION
-from src.backend.db import get_all_subscriptions, update_last_alert_sent
+from rq import Queue, Retry, get_current_job
+from rq.job import Dependency, Job, JobStatus
+from src.backend.alerts import SweepResult, check_subscription, complete_sweep, sweep_subscriptions
+from src.backend.config import SWEEP_LOCK_TTL, SWEEP_MIN_CPUS, SWEEP_PROCESSES, SWEEP_SHARDS, SWEEP_WINDOW
+from src.backend.db import get_max_subscription_id, load_sweep_state
 from src.backend.fetch_data import fetch_realtime_aurora_data
-from src.backend.nearest_neighbour import find_nearest_coord
-from src.backend.notifier import send_notification
+from src.backend.metrics import push_metrics
+from src.backend.ovation_grid import OvationGrid
+from src.backend.parallel_sweep import sweep_parallel
 
-MIN_ALERT_GAP = timedelta(hours=1)  # avoid spam
+from .outbox import Outbox
+from .redis_conn import redis_conn
+from .snapshots import load_snapshot, publish_overlay, publish_snapshot
 
+SWEEP_SUMMARY_KEY = "aurora:sweep:last"
+SWEEP_LOCK_KEY = "aurora:sweep:lock"
 
-def check_aurora_alerts():
+
+def _connection():
+    job = get_current_job()
+    return job.connection if job else redis_conn
+
+
+def _queue() -> Queue:
+    # Shards go to the same queue as the job that spawned them
+    job = get_current_job()
+    return Queue(job.origin if job else "aurora", connection=_connection())
+
+
+def _pushes_metrics(task):
+    # Workers are separate processes; each task adds what it recorded to the shared Redis metrics when it ends
+    @functools.wraps(task)
+    def wrapper(*args, **kwargs):
+        try:
+            return task(*args, **kwargs)
+        finally:
+            try:
+                push_metrics(_connection())
+            except Exception as e:
+                logger.warning(f"Failed to push metrics: {e}")
+
+    return wrapper
+
+
+def enqueue_sweep(queue: Queue) -> Optional[Job]:
     """
-    Background task:
-    - Fetch latest aurora data (cached)
-    - Check all subscriptions
-    - Send alerts if thresholds met
+    Enqueue a full sweep unless one is already queued or running.
+
+    Sweeps are coalesced per SWEEP_WINDOW: the job ID is derived from the window, so a window's sweep runs at
+    most once, and a Redis lock held until the sweep's summary job finishes keeps a second sweep from being
+    queued meanwhile. Returns the enqueued job, or None if the request was coalesced.
     """
-    logger.info("RQ task started: checking aurora alerts")
+    job_id = f"sweep-{int(time.time() // SWEEP_WINDOW)}"
+    if not queue.connection.set(SWEEP_LOCK_KEY, job_id, nx=True, ex=SWEEP_LOCK_TTL):
+        logger.debug("Sweep already queued or running, not enqueueing another")
+        return None
+    if Job.exists(job_id, connection=queue.connection):
+        logger.debug(f"Sweep {job_id} already ran in this window")
+        queue.connection.delete(SWEEP_LOCK_KEY)
+        return None
 
-    aurora_data = fetch_realtime_aurora_data()
-    if not aurora_data:
+    # The finished job is kept for the rest of the window so the check above sees it
+    return queue.enqueue(check_aurora_alerts, job_id=job_id, job_timeout=300, result_ttl=SWEEP_WINDOW)
+
+
+def _release_sweep_lock(connection, sweep_id: str):
+    if sweep_id and connection.get(SWEEP_LOCK_KEY) == sweep_id.encode():
+        connection.delete(SWEEP_LOCK_KEY)
+
+
+def enqueue_subscription_check(queue: Queue, sub_id: int) -> Job:
+    """
+    Enqueue a targeted check of one (new or updated) subscription instead of a full sweep.
+    Repeated requests for the same subscription while its check is still queued are coalesced.
+    """
+    job_id = f"check-subscription-{sub_id}"
+    job = Job.fetch(job_id, connection=queue.connection) if Job.exists(job_id, connection=queue.connection) else None
+    if job is not None and job.get_status() in ("queued", "started", "deferred", "scheduled"):
+        return job
+    return queue.enqueue(check_aurora_subscription, sub_id, job_id=job_id, job_timeout=60, result_ttl=0)
+
+
+@_pushes_metrics
+def check_aurora_subscription(sub_id: int) -> SweepResult:
+    """
+    Background task: check a single subscription against the latest aurora data.
+    """
+    grid = fetch_realtime_aurora_data()
+    if grid is None:
         logger.warning("No aurora data available")
-        return
+        return SweepResult()
 
-    subs = get_all_subscriptions()
-    logger.info(f"Checking {len(subs)} subscriptions")
+    result = check_subscription(grid, sub_id)
+    logger.info(f"Subscription {sub_id} checked: {result}")
+    return result
 
-    for sub in subs:
-        nearest_point, _ = find_nearest_coord([sub.latitude, sub.longitude], aurora_data["coordinates"])
 
-        intensity = nearest_point[2]
-        kp_threshold = sub.threshold
-        ovation_threshold = KP_TO_OVATION.get(kp_threshold)
-        if ovation_threshold is None:
-            logger.warning(f"Invalid threshold {kp_threshold} for subscription {sub.id}")
-            continue
+@_pushes_metrics
+def check_aurora_alerts(shards: int = SWEEP_SHARDS, processes: int = SWEEP_PROCESSES):
+    """
+    Background task (sweep coordinator):
+    - Fetch latest aurora data (cached) and publish it to Redis for the shard jobs
+    - Render the app's map overlay for the snapshot, if it is a new one
+    - Split subscriptions into ID ranges and enqueue one check_aurora_shard job per range
+    - Enqueue summarize_sweep to run once every shard has finished, or failed for good
+    With processes >= 2 the coordinator instead sweeps every subscription itself on a pool of that many
+    processes (see parallel_sweep), for a single machine with more cores than RQ workers. Machines with fewer than
+    SWEEP_MIN_CPUS cores shard the sweep anyway: there a pool is no faster than evaluating in-process.
+    If the coordinator fails, the sweep lock taken by enqueue_sweep is released.
+    """
+    logger.info("RQ task started: checking aurora alerts")
 
-        logger.debug(f"Subscription {sub.id}: intensity={intensity}, ovation_threshold={ovation_threshold}")
-        if intensity >= ovation_threshold:
-            now = datetime.now()
+    job = get_current_job()
+    sweep_id = job.id if job else None
+    connection = _connection()
 
-            if sub.last_alert_sent and now - sub.last_alert_sent < MIN_ALERT_GAP:
-                continue
+    try:
+        grid = fetch_realtime_aurora_data()
+        if grid is None:
+            logger.warning("No aurora data available")
+            _release_sweep_lock(connection, sweep_id)
+            return
 
-            send_notification(
-                email=sub.user_email,
-                name=sub.user_name,
-                city=sub.city,
-                aurora_value=kp_threshold,
+        snapshot_id = publish_snapshot(grid, connection=connection)
+        try:
+            publish_overlay(grid, connection=connection)
+        except Exception as e:
+            # The overlay is cosmetic; never let it hold up the alerts
+            logger.error(f"Failed to publish aurora overlay for snapshot {snapshot_id}: {e}")
+        high_water = get_max_subscription_id()
+        if processes >= 2 and (os.cpu_count() or 1) < SWEEP_MIN_CPUS:
+            logger.warning(
+                f"Only {os.cpu_count()} cores (SWEEP_MIN_CPUS is {SWEEP_MIN_CPUS}), sharding the sweep instead"
             )
+            processes = 0
+        if processes >= 2:
+            outbox = Outbox(connection)
+            result = sweep_parallel(grid, load_sweep_state(), max_id=high_water, outbox=outbox, processes=processes)
+            _record_sweep(connection, grid, snapshot_id, high_water, result, shards=1, failed=0, sweep_id=sweep_id)
+            return
+
+        bounds = np.unique(np.linspace(0, high_water, shards + 1).astype(int))
+
+        q = _queue()
+        shard_jobs = [
+            q.enqueue(check_aurora_shard, snapshot_id, int(after_id), int(max_id), job_timeout=300, retry=Retry(max=2))
+            for after_id, max_id in zip(bounds[:-1], bounds[1:])
+        ]
+        q.enqueue(
+            summarize_sweep,
+            snapshot_id,
+            [job.id for job in shard_jobs],
+            high_water,
+            sweep_id,
+            # Also after failed shards, so the digests of the ones that succeeded are released
+            depends_on=Dependency(jobs=shard_jobs, allow_failure=True) if shard_jobs else None,
+        )
+        logger.info(f"RQ task completed ({len(shard_jobs)} shards enqueued for snapshot {snapshot_id})")
+    except Exception:
+        # Let the next tick of the scheduler enqueue a sweep instead of waiting for the lock to expire
+        _release_sweep_lock(connection, sweep_id)
+        raise
+
+
+@_pushes_metrics
+def check_aurora_shard(snapshot_id: str, after_id: int, max_id: int) -> SweepResult:
+    """
+    Background task: sweep the subscriptions with after_id < ID <= max_id against a published snapshot.
+    """
+    grid = load_snapshot(snapshot_id, connection=_connection())
+    if grid is None:
+        raise RuntimeError(f"Aurora snapshot {snapshot_id} expired before shard ({after_id}, {max_id}] ran")
+
+    # Alerts are only queued here; the outbox senders deliver them, so a slow SMTP server cannot stall the sweep
+    outbox = Outbox(_connection())
+    result = sweep_subscriptions(grid, load_sweep_state(), after_id=after_id, max_id=max_id, outbox=outbox)
+    logger.info(f"Shard ({after_id}, {max_id}] done: {result}")
+    return result
+
+
+@_pushes_metrics
+def summarize_sweep(snapshot_id: str, shard_job_ids: list, high_water: int, sweep_id: str = None) -> dict:
+    """
+    Background task: aggregate the shard results of a sweep, release its alerts to the outbox senders as one
+    digest per user, record it as the new incremental baseline (only if every shard succeeded) and release the
+    sweep lock taken by enqueue_sweep.
+    """
+    connection = _connection()
+    jobs = Job.fetch_many(shard_job_ids, connection=connection)
+    results = [job.return_value() for job in jobs if job is not None]
+    total = sum((result for result in results if result is not None), SweepResult())
+    failed = sum(job is None or job.get_status() != JobStatus.FINISHED for job in jobs)
+
+    grid = load_snapshot(snapshot_id, connection=connection)
+    return _record_sweep(connection, grid, snapshot_id, high_water, total, len(shard_job_ids), failed, sweep_id)
+
+
+def _record_sweep(
+    connection,
+    grid: Optional[OvationGrid],
+    snapshot_id: str,
+    high_water: int,
+    total: SweepResult,
+    shards: int,
+    failed: int,
+    sweep_id: Optional[str],
+) -> dict:
+    # Release the sweep's alerts, record it as the next baseline if it finished and store its summary
+    digests = Outbox(connection).release(snapshot_id)
 
-            update_last_alert_sent(sub.id, now)
-            logger.success(f"Alert sent to {sub.user_email}")
+    if failed:
+        # The next sweep evaluates everyone again instead of only the changed cells
+        logger.error(f"{failed} shards of snapshot {snapshot_id} failed, not recording the sweep as a baseline")
+    elif grid is not None:
+        complete_sweep(grid, high_water)
 
-    logger.info("RQ task completed")
+    summary = {
+        "snapshot_id": snapshot_id,
+        "shards": shards,
+        "failed_shards": failed,
+        **asdict(total),
+        "digests": digests,
+        "completed_at": datetime.now().isoformat(),
+    }
+    connection.hset(SWEEP_SUMMARY_KEY, mapping=summary)
+    _release_sweep_lock(connection, sweep_id)
+    logger.info(f"Sweep of snapshot {snapshot_id} completed: {summary}")
+    return summary
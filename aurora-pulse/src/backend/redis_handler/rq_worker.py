@@ -1,10 +1,18 @@
 from loguru import logger
 from rq import Queue, SimpleWorker, Worker
+from src.backend.config import METRICS_PORT
+from src.backend.metrics import serve_metrics
 
 from .redis_conn import redis_conn
 
 if __name__ == "__main__":
     logger.info("Starting RQ Worker...")
+    if METRICS_PORT:
+        try:
+            serve_metrics(METRICS_PORT, redis_conn)
+        except OSError as e:
+            # Another worker on this host already serves the (shared) metrics
+            logger.info(f"Metrics endpoint not started: {e}")
     q = Queue("aurora", connection=redis_conn)
     # worker = Worker([q])  # does not work on Windows
     worker = SimpleWorker([q], connection=redis_conn)
@@ -0,0 +1,61 @@
+from typing import Optional, Tuple
+
+from loguru import logger
+from src.backend.aurora_overlay import render_overlay
+from src.backend.config import SNAPSHOT_TTL
+from src.backend.ovation_grid import OvationGrid
+
+from .redis_conn import redis_conn
+
+SNAPSHOT_KEY = "aurora:snapshot:{}"
+OVERLAY_KEY = "aurora:overlay:{}"
+LATEST_OVERLAY_KEY = "aurora:overlay:latest"
+
+
+def publish_snapshot(grid: OvationGrid, connection=redis_conn) -> str:
+    """
+    Store a snapshot in Redis so every worker of a sweep reads the same grid without re-fetching NOAA.
+    Returns the snapshot ID to hand to those workers.
+    """
+    snapshot_id = grid.snapshot_id
+    connection.set(SNAPSHOT_KEY.format(snapshot_id), grid.to_bytes(), ex=SNAPSHOT_TTL)
+    logger.info(f"Published aurora snapshot {snapshot_id}")
+    return snapshot_id
+
+
+def load_snapshot(snapshot_id: str, connection=redis_conn) -> Optional[OvationGrid]:
+    """
+    Load a snapshot published with publish_snapshot() (None if it has expired).
+    """
+    data = connection.get(SNAPSHOT_KEY.format(snapshot_id))
+    if data is None:
+        logger.warning(f"Aurora snapshot {snapshot_id} not found in Redis")
+        return None
+    return OvationGrid.from_bytes(data)
+
+
+def publish_overlay(grid: OvationGrid, connection=redis_conn) -> str:
+    """
+    Render the map overlay of a snapshot (see render_overlay) unless it already has one, and make it the latest.
+    Overlays are rendered here, once per forecast time, so the app only ever reads the finished PNG.
+    Returns the snapshot ID.
+    """
+    snapshot_id = grid.snapshot_id
+    key = OVERLAY_KEY.format(snapshot_id)
+    if not connection.exists(key):
+        connection.set(key, render_overlay(grid), ex=SNAPSHOT_TTL)
+        logger.info(f"Rendered aurora overlay for snapshot {snapshot_id}")
+    connection.set(LATEST_OVERLAY_KEY, snapshot_id, ex=SNAPSHOT_TTL)
+    return snapshot_id
+
+
+def load_latest_overlay(connection=redis_conn) -> Optional[Tuple[str, bytes]]:
+    """
+    (snapshot ID, PNG) of the most recently published overlay, or None if there is none.
+    """
+    snapshot_id = connection.get(LATEST_OVERLAY_KEY)
+    if snapshot_id is None:
+        return None
+    snapshot_id = snapshot_id.decode()
+    png = connection.get(OVERLAY_KEY.format(snapshot_id))
+    return None if png is None else (snapshot_id, png)
@@ -0,0 +1,33 @@
+import threading
+from typing import Optional
+
+from loguru import logger
+from rq import Queue
+from src.backend.config import SWEEP_TICK
+
+from .redis_conn import redis_conn
+from .rq_tasks import enqueue_sweep
+
+
+def run(queue: Queue, tick: float = SWEEP_TICK, stop: Optional[threading.Event] = None):
+    """
+    Enqueue a full sweep every SWEEP_WINDOW until stop is set.
+
+    enqueue_sweep() is tried every `tick` seconds and coalesces the attempts to one sweep per window, so a window
+    whose sweep could not be enqueued at its start (a previous sweep still running, Redis unreachable) still gets
+    one later on, and several schedulers may run side by side.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            job = enqueue_sweep(queue)
+            if job is not None:
+                logger.info(f"Enqueued sweep {job.id}")
+        except Exception as e:
+            logger.error(f"Failed to enqueue sweep: {e}")
+        stop.wait(tick)
+
+
+if __name__ == "__main__":
+    logger.info("Starting sweep scheduler...")
+    run(Queue("aurora", connection=redis_conn))
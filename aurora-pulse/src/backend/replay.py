@@ -0,0 +1,261 @@
+"""
+Replay the alert rules over archived snapshots, without notifying anyone.
+
+Answers "how many emails would this storm have sent" for the current subscriptions, or for other values of
+MIN_ALERT_GAP, KP_TO_OVATION or the thresholds, by evaluating every snapshot x subscription as array operations:
+
+    python -m src.backend.replay --start 2025-05-10 --end 2025-05-12 --min-gap 7200
+"""
+
+import argparse
+import json
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Mapping, Optional
+
+import numpy as np
+
+from .config import KP_TO_OVATION, MIN_ALERT_GAP
+from .db import get_subscription_columns
+from .snapshot_archive import CHUNK_SECONDS, SnapshotArchive, TimeBound
+
+NEVER = np.iinfo(np.int64).min // 2  # last alert time of a subscription that was never alerted
+
+
+@dataclass
+class ReplayResult:
+    times: np.ndarray  # forecast time (epoch seconds) of each replayed snapshot
+    alerts: np.ndarray  # alerts sent at each snapshot
+    suppressed: np.ndarray  # subscriptions over their threshold at each snapshot but within the minimum gap
+    sub_ids: np.ndarray  # the replayed subscriptions
+    groups: np.ndarray  # alert group of each subscription (-1 for invalid thresholds, which never fire)
+    offsets: np.ndarray  # alerts of group g are event_steps[offsets[g]:offsets[g + 1]]
+    event_steps: np.ndarray  # index into times of every alert, by group then time
+
+    @property
+    def total(self) -> int:
+        return int(self.alerts.sum())
+
+    def alert_counts(self) -> np.ndarray:
+        """
+        Number of alerts each subscription received, aligned with sub_ids.
+        """
+        counts = np.diff(self.offsets)
+        return np.where(self.groups >= 0, counts[np.maximum(self.groups, 0)], 0)
+
+    def timeline(self, sub_id: int) -> np.ndarray:
+        """
+        Times (epoch seconds) at which a subscription was alerted.
+        """
+        (index,) = np.flatnonzero(self.sub_ids == sub_id)
+        group = self.groups[index]
+        if group < 0:
+            return np.empty(0, dtype=np.int64)
+        return self.times[self.event_steps[self.offsets[group] : self.offsets[group + 1]]]
+
+    def timelines(self) -> Dict[int, np.ndarray]:
+        """
+        {subscription ID: alert times} for every subscription alerted at least once.
+        """
+        return {int(sub_id): self.timeline(sub_id) for sub_id in self.sub_ids[self.alert_counts() > 0]}
+
+
+class AlertReplay:
+    """
+    Runs the rules of alerts.evaluate_alerts over a sequence of snapshots fed in time order, carrying every
+    subscription's last alert time across them.
+
+    Subscriptions sharing a grid cell, threshold and starting last alert time always alert together, so the rules
+    run once per such group. Per snapshot, the threshold level of every subscribed cell is looked up at once; the
+    (snapshot, cell) pairs where a level is reached (and, incrementally, changed) are expanded to the groups of
+    that cell it reaches, and only those are checked against the minimum gap, snapshot by snapshot.
+
+    With incremental=True (as the live sweeps run, see alerts.iter_delta_candidates) a subscription is only
+    evaluated when its cell crossed a threshold level since the previous snapshot, so an aurora that stays over a
+    threshold alerts once; the first snapshot evaluates everyone. A subscription held back by the minimum gap stays
+    pending, as it does live: it is evaluated again at every snapshot until it fires or its cell drops below its
+    threshold. Every alert is taken as delivered. Replays start without previous alerts unless carry_last_alert is
+    set, which starts from the subscriptions' last_alert instead.
+    """
+
+    def __init__(
+        self,
+        subs: np.ndarray,
+        min_gap: int = MIN_ALERT_GAP,
+        kp_to_ovation: Mapping[int, int] = KP_TO_OVATION,
+        incremental: bool = True,
+        carry_last_alert: bool = False,
+    ):
+        table = np.array([kp_to_ovation[kp] for kp in range(len(kp_to_ovation))])
+        if np.any(np.diff(table) < 0):
+            raise ValueError("kp_to_ovation must not decrease with Kp")
+        self.min_gap = min_gap
+        self.incremental = incremental
+        # Threshold level (see alerts.threshold_levels) of every uint8 intensity
+        self._levels = np.searchsorted(table, np.arange(256), side="right").astype(np.uint8)
+
+        kp = subs["threshold"]
+        valid = (kp >= 0) & (kp < len(table))
+        last = subs["last_alert"] if carry_last_alert else np.full(len(subs), NEVER)
+        # Groups sorted by cell, then threshold: the groups a cell's level reaches are a prefix of the cell's groups
+        keys, inverse = np.unique(np.column_stack([subs["cell"], kp, last])[valid], axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        self.sub_ids = subs["id"].copy()
+        self._groups = np.full(len(subs), -1, dtype=np.int64)
+        self._groups[valid] = inverse
+        self._sizes = np.bincount(inverse, minlength=len(keys))
+        self._last = keys[:, 2].copy()
+
+        self._cells, self._cell_start, group_cell = np.unique(keys[:, 0], return_index=True, return_inverse=True)
+        self._group_cell = group_cell.ravel()
+        self._group_kp = keys[:, 1].copy()
+        # Number of a cell's groups reached at each level (a Kp threshold is reached from level Kp + 1 on)
+        reached = np.zeros((len(self._cells), len(table) + 1), dtype=np.int64)
+        np.add.at(reached, (self._group_cell, self._group_kp + 1), 1)
+        self._reached = np.cumsum(reached, axis=1)
+        self._previous: Optional[np.ndarray] = None  # levels of the subscribed cells at the last snapshot fed
+        self._pending = np.empty(0, dtype=np.int64)  # groups held back by the minimum gap at the last snapshot fed
+
+        self._times, self._alerts, self._suppressed = [], [], []
+        self._event_steps, self._event_groups = [], []
+        self._steps = 0
+
+    def _candidates(self, levels: np.ndarray):
+        # (snapshot, group) pairs to evaluate, by snapshot: the groups reached by each cell's level
+        active = levels > 0
+        if self.incremental:
+            changed = np.empty_like(active)
+            changed[1:] = levels[1:] != levels[:-1]
+            changed[0] = True if self._previous is None else levels[0] != self._previous
+            active &= changed
+        steps, cells = np.nonzero(active)
+        counts = self._reached[cells, levels[steps, cells]]
+        ends = np.cumsum(counts)
+        first = np.repeat(self._cell_start[cells] - (ends - counts), counts)
+        return np.repeat(steps, counts), np.arange(len(first)) + first
+
+    def feed(self, times: np.ndarray, grids: np.ndarray):
+        """
+        Replay the next snapshots: forecast times (epoch seconds, ascending, after those already fed) and their
+        uint8 intensity grids, as returned by SnapshotArchive.read_range().
+        """
+        times = np.asarray(times, dtype=np.int64)
+        if not len(times):
+            return
+        levels = self._levels[grids.reshape(len(times), -1)[:, self._cells]]
+        steps, groups = self._candidates(levels)
+        self._previous = levels[-1]
+
+        alerts = np.zeros(len(times), dtype=np.int64)
+        suppressed = np.zeros(len(times), dtype=np.int64)
+        # Candidates of step s are groups[bounds[s]:bounds[s + 1]]
+        bounds = np.searchsorted(steps, np.arange(len(times) + 1))
+        for step in range(len(times)):
+            step_groups = groups[bounds[step] : bounds[step + 1]]
+            if len(self._pending):
+                # Pending groups whose cell still reaches their threshold are evaluated again
+                still = self._pending[levels[step, self._group_cell[self._pending]] > self._group_kp[self._pending]]
+                step_groups = np.union1d(step_groups, still)
+            if not len(step_groups):
+                self._pending = step_groups
+                continue
+            due = times[step] - self._last[step_groups] >= self.min_gap
+            fired = step_groups[due]
+            self._last[fired] = times[step]
+            alerts[step] = self._sizes[fired].sum()
+            suppressed[step] = self._sizes[step_groups[~due]].sum()
+            self._event_steps.append(np.full(len(fired), self._steps + step))
+            self._event_groups.append(fired)
+            if self.incremental:
+                self._pending = step_groups[~due]
+
+        self._times.append(times)
+        self._alerts.append(alerts)
+        self._suppressed.append(suppressed)
+        self._steps += len(times)
+
+    def result(self) -> ReplayResult:
+        """
+        Per-snapshot alert counts and per-subscription timelines of everything fed so far.
+        """
+
+        def concat(chunks, dtype=np.int64):
+            return np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+
+        event_groups = concat(self._event_groups)
+        order = np.argsort(event_groups, kind="stable")  # events were recorded in time order
+        offsets = np.zeros(len(self._sizes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(event_groups, minlength=len(self._sizes)), out=offsets[1:])
+        return ReplayResult(
+            times=concat(self._times),
+            alerts=concat(self._alerts),
+            suppressed=concat(self._suppressed),
+            sub_ids=self.sub_ids,
+            groups=self._groups,
+            offsets=offsets,
+            event_steps=concat(self._event_steps)[order],
+        )
+
+
+def replay_archive(
+    archive: Optional[SnapshotArchive] = None,
+    start: TimeBound = None,
+    end: TimeBound = None,
+    subs: Optional[np.ndarray] = None,
+    **options,
+) -> ReplayResult:
+    """
+    Replay the archived snapshots with start <= forecast time <= end against subs (by default every current
+    subscription), one archive day at a time. Options are passed to AlertReplay.
+    """
+    archive = SnapshotArchive() if archive is None else archive
+    replay = AlertReplay(get_subscription_columns() if subs is None else subs, **options)
+    times = archive.times(start, end)
+    for day in np.unique(times - times % CHUNK_SECONDS):
+        day_times = times[(times >= day) & (times < day + CHUNK_SECONDS)]
+        replay.feed(*archive.read_range(int(day_times[0]), int(day_times[-1])))
+    return replay.result()
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--archive", help="archive directory (default: ARCHIVE_DIR)")
+    parser.add_argument("--start", type=_parse_time, help="first forecast time, ISO 8601 UTC")
+    parser.add_argument("--end", type=_parse_time, help="last forecast time, ISO 8601 UTC")
+    parser.add_argument("--min-gap", type=int, default=MIN_ALERT_GAP, help="seconds between two alerts to a user")
+    parser.add_argument("--kp-to-ovation", type=json.loads, help='e.g. \'{"0": 1, "1": 2, ...}\' (JSON)')
+    parser.add_argument("--full", action="store_true", help="evaluate every subscription at every snapshot")
+    parser.add_argument("--timelines", action="store_true", help="include every alerted subscription's alert times")
+    args = parser.parse_args(argv)
+
+    options = {"min_gap": args.min_gap, "incremental": not args.full}
+    if args.kp_to_ovation:
+        options["kp_to_ovation"] = {int(kp): value for kp, value in args.kp_to_ovation.items()}
+    archive = SnapshotArchive(args.archive) if args.archive else None
+    result = replay_archive(archive, args.start, args.end, **options)
+
+    def iso(epoch):
+        return datetime.fromtimestamp(int(epoch), tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    report = {
+        "snapshots": len(result.times),
+        "alerts": result.total,
+        "subscriptions_alerted": int(np.count_nonzero(result.alert_counts())),
+        "steps": [
+            {"forecast_time": iso(t), "alerts": int(a), "suppressed": int(s)}
+            for t, a, s in zip(result.times, result.alerts, result.suppressed)
+        ],
+    }
+    if args.timelines:
+        report["timelines"] = {sub_id: [iso(t) for t in times] for sub_id, times in result.timelines().items()}
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.message import Message
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from .config import SMTP_MESSAGES_PER_SESSION, SMTP_POOL_SIZE, SMTP_RATE_LIMIT
+from .metrics import SMTP_SEND_SECONDS
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing `rate` acquisitions per second with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Rate limits are per SMTP server, shared by every pool talking to it
+_rate_limiters: Dict[Tuple[str, int], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def _rate_limiter_for(host: str, port: int, rate: Optional[float]) -> Optional[RateLimiter]:
+    if not rate:
+        return None
+    with _rate_limiters_lock:
+        if (host, port) not in _rate_limiters:
+            _rate_limiters[(host, port)] = RateLimiter(rate)
+        return _rate_limiters[(host, port)]
+
+
+@dataclass(slots=True)
+class WireMessage:
+    """
+    A message already rendered to RFC 5322 bytes with CRLF line endings, sent as is.
+    """
+
+    sender: str
+    recipient: str
+    data: bytes
+
+
+def _recipient(msg: Union[Message, WireMessage]) -> str:
+    return msg.recipient if isinstance(msg, WireMessage) else msg["To"]
+
+
+class _Session:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+
+class SmtpPool:
+    """
+    Bounded pool of authenticated SMTP sessions.
+
+    Each session is reused for up to max_messages_per_session messages, so STARTTLS and login happen once per
+    session instead of once per email. send_many() delivers a batch concurrently over up to `size` sessions,
+    throttled by a per-server rate limit, and reports success or failure for every message.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str = None,
+        password: str = None,
+        starttls: bool = True,
+        size: int = SMTP_POOL_SIZE,
+        max_messages_per_session: int = SMTP_MESSAGES_PER_SESSION,
+        rate_limit: Optional[float] = SMTP_RATE_LIMIT,
+        timeout: float = 30,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.size = size
+        self.max_messages_per_session = max_messages_per_session
+        self.timeout = timeout
+        self._limiter = _rate_limiter_for(host, port, rate_limit)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> _Session:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        logger.debug(f"Opened SMTP session to {self.host}:{self.port}")
+        return _Session(smtp)
+
+    @contextmanager
+    def _session(self):
+        with self._slots:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                session = self._connect()
+
+            try:
+                yield session
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # The server rejected this message but the session itself is still usable
+                self._idle.put(session)
+                raise
+            except Exception:
+                # The connection is unusable, or left mid-transaction by an error smtplib raised (e.g. encoding an
+                # address); drop it and let the next caller open a fresh one
+                session.smtp.close()
+                raise
+
+            if session.sent >= self.max_messages_per_session:
+                session.close()
+            else:
+                self._idle.put(session)
+
+    def send(self, msg: Union[Message, WireMessage]) -> bool:
+        """
+        Send one message over a pooled session. Returns True on success, False on failure.
+        """
+        # An idle session may have been closed by the server, so a disconnect is retried once on a new one
+        for attempt in range(2):
+            try:
+                if self._limiter:
+                    self._limiter.acquire()
+                with self._session() as session, SMTP_SEND_SECONDS.time():
+                    if isinstance(msg, WireMessage):
+                        session.smtp.sendmail(msg.sender, [msg.recipient], msg.data)
+                    else:
+                        session.smtp.send_message(msg)
+                    session.sent += 1
+                return True
+            except smtplib.SMTPServerDisconnected as e:
+                if attempt == 1:
+                    logger.error(f"Failed to send email to {_recipient(msg)}: {e}")
+            except Exception as e:
+                # Any failure is this message's alone; the rest of a send_many batch still goes out
+                logger.error(f"Failed to send email to {_recipient(msg)}: {e}")
+                return False
+        return False
+
+    def send_many(self, messages: Sequence[Union[Message, WireMessage]]) -> List[bool]:
+        """
+        Send a batch of messages concurrently across the pool.
+        Returns one success flag per message, in input order.
+        """
+        if not messages:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.size, len(messages))) as executor:
+            results = list(executor.map(self.send, messages))
+        logger.info("Delivered {}/{} emails via {}", sum(results), len(results), self.host)
+        return results
+
+    def close(self):
+        """
+        Close every idle session.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,188 @@
+import mmap
+import os
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+from loguru import logger
+
+from .config import ARCHIVE_DIR
+from .ovation_grid import GRID_SHAPE, GRID_SIZE, OvationGrid, cell_index, epoch_to_time, time_to_epoch
+from .storage import to_epoch
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialised within this process
+    fcntl = None
+
+CHUNK_SECONDS = 24 * 60 * 60  # Snapshots are grouped into one data file and one index file per UTC day
+COMPRESSION_LEVEL = 9  # zlib level; a snapshot is archived once, so spend the CPU on size
+
+# Index file: one fixed-size record per archived snapshot, in append order
+ARCHIVE_INDEX = np.dtype(
+    [
+        ("forecast_time", "<i8"),  # epoch seconds
+        ("observation_time", "<i8"),  # epoch seconds, 0 if unknown
+        ("offset", "<u8"),  # of the compressed grid in the data file
+        ("length", "<u4"),
+        ("reserved", "V4"),
+    ]
+)
+
+TimeBound = Union[datetime, int, float, None]
+
+
+def _epoch(value: TimeBound, default: int) -> int:
+    if value is None:
+        return default
+    if isinstance(value, datetime):
+        return to_epoch(value)
+    return int(value)
+
+
+def _parse_index(data: bytes) -> np.ndarray:
+    # A crash mid-append can leave a partial trailing record, which is ignored (and overwritten by the next append)
+    return np.frombuffer(data, dtype=ARCHIVE_INDEX, count=len(data) // ARCHIVE_INDEX.itemsize)
+
+
+class SnapshotArchive:
+    """
+    Append-only archive of every distinct OVATION snapshot, keyed by forecast time.
+
+    Each UTC day has a data file (YYYYMMDD.grids) of zlib-compressed uint8 grids, a few KB each, and an index file
+    (YYYYMMDD.index) of ARCHIVE_INDEX records locating them. A grid is written before its index record, so a crash
+    leaves at most unindexed bytes behind. Reads consult the index and only decompress the snapshots in the
+    requested time range; a cell's series only decompresses each grid up to that cell.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _paths(self, chunk: int) -> Tuple[str, str]:
+        name = datetime.fromtimestamp(chunk, tz=timezone.utc).strftime("%Y%m%d")
+        return os.path.join(self.directory, f"{name}.grids"), os.path.join(self.directory, f"{name}.index")
+
+    def append(self, grid: OvationGrid) -> bool:
+        """
+        Archive a snapshot. Returns False if a snapshot with the same forecast time is already archived, or if the
+        grid has no forecast time to key it by.
+        """
+        forecast_time = time_to_epoch(grid.forecast_time)
+        if not forecast_time:
+            logger.warning("Not archiving a snapshot without a forecast time")
+            return False
+
+        grids_path, index_path = self._paths(forecast_time - forecast_time % CHUNK_SECONDS)
+        blob = zlib.compress(np.ascontiguousarray(grid.intensity, dtype=np.uint8).tobytes(), COMPRESSION_LEVEL)
+        os.makedirs(self.directory, exist_ok=True)
+        # The index file doubles as the lock serialising appends from every process sharing the archive
+        with self._lock, open(index_path, "a+b") as index:
+            if fcntl:
+                fcntl.flock(index, fcntl.LOCK_EX)  # released when the file is closed
+            index.seek(0)
+            records = _parse_index(index.read())
+            if forecast_time in records["forecast_time"]:
+                return False
+
+            with open(grids_path, "ab") as grids:
+                offset = grids.seek(0, os.SEEK_END)
+                grids.write(blob)
+                grids.flush()
+                os.fsync(grids.fileno())
+
+            record = np.zeros(1, dtype=ARCHIVE_INDEX)
+            record["forecast_time"] = forecast_time
+            record["observation_time"] = time_to_epoch(grid.observation_time)
+            record["offset"] = offset
+            record["length"] = len(blob)
+            index.truncate(records.nbytes)
+            index.write(record.tobytes())
+        logger.info(f"Archived snapshot {grid.forecast_time} ({len(blob)} bytes)")
+        return True
+
+    def _select(self, start: TimeBound, end: TimeBound) -> List[Tuple[str, np.ndarray]]:
+        # (data file, index records sorted by forecast time) of every day with snapshots in [start, end]
+        start = _epoch(start, np.iinfo(np.int64).min)
+        end = _epoch(end, np.iinfo(np.int64).max)
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(".index"))
+        except FileNotFoundError:
+            return []
+
+        selected = []
+        for name in names:
+            day = datetime.strptime(name[: -len(".index")], "%Y%m%d").replace(tzinfo=timezone.utc)
+            chunk = int(day.timestamp())
+            if chunk + CHUNK_SECONDS <= start or chunk > end:
+                continue
+            with open(os.path.join(self.directory, name), "rb") as f:
+                records = _parse_index(f.read())
+            records = records[np.argsort(records["forecast_time"], kind="stable")]
+            records = records[(records["forecast_time"] >= start) & (records["forecast_time"] <= end)]
+            if len(records):
+                selected.append((self._paths(chunk)[0], records))
+        return selected
+
+    def _read(self, start: TimeBound, end: TimeBound, decode, shape: tuple) -> Tuple[np.ndarray, np.ndarray]:
+        # (forecast times, decode(compressed grid) of each snapshot in [start, end] stacked into one array)
+        selected = self._select(start, end)
+        times = np.concatenate([records["forecast_time"] for _, records in selected]) if selected else np.empty(0, int)
+        values = np.empty((len(times),) + shape, dtype=np.uint8)
+        i = 0
+        for grids_path, records in selected:
+            with open(grids_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for offset, length in zip(records["offset"].tolist(), records["length"].tolist()):
+                    values[i] = decode(data[offset : offset + length])
+                    i += 1
+        return times.astype(np.int64), values
+
+    def times(self, start: TimeBound = None, end: TimeBound = None) -> np.ndarray:
+        """
+        Forecast times (epoch seconds, ascending) of the archived snapshots with start <= forecast time <= end.
+        Bounds are datetimes (naive ones taken as UTC) or epoch seconds; None leaves that side open.
+        """
+        selected = self._select(start, end)
+        if not selected:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([records["forecast_time"] for _, records in selected]).astype(np.int64)
+
+    def read_range(self, start: TimeBound = None, end: TimeBound = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        All archived grids with start <= forecast time <= end.
+        Returns (forecast times as epoch seconds, uint8 intensity array of shape (n,) + GRID_SHAPE), by time.
+        """
+        times, grids = self._read(start, end, lambda blob: np.frombuffer(zlib.decompress(blob), np.uint8), (GRID_SIZE,))
+        return times, grids.reshape((len(times),) + GRID_SHAPE)
+
+    def series(self, lat, lon, start: TimeBound = None, end: TimeBound = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Intensity over time at the grid cell nearest to lat/lon (scalars, or arrays for several cells at once).
+        Returns (forecast times as epoch seconds, uint8 values of shape (n,) + the shape of lat/lon), by time.
+        """
+        flat = np.ravel_multi_index(cell_index(lat, lon), GRID_SHAPE)
+        limit = int(np.max(flat)) + 1
+
+        def decode(blob):
+            # Grids are stored row-major, so decompression can stop at the last requested cell
+            return np.frombuffer(zlib.decompressobj().decompress(blob, limit), dtype=np.uint8)[flat]
+
+        return self._read(start, end, decode, np.shape(flat))
+
+    def load(self, forecast_time: TimeBound) -> Optional[OvationGrid]:
+        """
+        The archived snapshot with exactly this forecast time, or None.
+        """
+        for grids_path, records in self._select(forecast_time, forecast_time):
+            record = records[0]
+            with open(grids_path, "rb") as f:
+                f.seek(int(record["offset"]))
+                intensity = np.frombuffer(zlib.decompress(f.read(int(record["length"]))), dtype=np.uint8)
+            return OvationGrid(
+                intensity.reshape(GRID_SHAPE),
+                observation_time=epoch_to_time(record["observation_time"]),
+                forecast_time=epoch_to_time(record["forecast_time"]),
+            )
+        return None
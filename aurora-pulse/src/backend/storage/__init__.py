@@ -0,0 +1,4 @@
+from .base import SUBSCRIPTION_DTYPE, Subscription, SubscriptionStore, SweepState, to_epoch
+from .sqlite_store import SQLiteStore
+
+# PostgresStore lives in .postgres_store and is imported on demand, so psycopg stays an optional dependency
@@ -0,0 +1,219 @@
+import calendar
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from src.backend.config import SUBSCRIPTION_BATCH_SIZE
+
+
+# Data model for a subscription
+@dataclass(slots=True)
+class Subscription:
+    id: int
+    user_email: str
+    user_name: str
+    latitude: float
+    longitude: float
+    city: str
+    threshold: int
+    last_alert_sent: Optional[datetime]
+
+
+# Columnar view of the subscriptions used by alert sweeps; cell is the flat index of the subscription's grid cell
+# (see ovation_grid.cell_id), last_alert is an epoch (0 = never alerted)
+SUBSCRIPTION_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("cell", np.int64),
+        ("threshold", np.int64),
+        ("last_alert", np.int64),
+    ]
+)
+
+
+# Progress of incremental alert sweeps, persisted so a restarted worker can pick up where it stopped
+@dataclass
+class SweepState:
+    forecast_time: Optional[str] = None  # snapshot the last (possibly unfinished) sweep ran against
+    grid: Optional[np.ndarray] = None  # intensity grid of the last completed sweep
+    cursor: Optional[int] = None  # last subscription ID alerted by an unfinished sweep of forecast_time
+    high_water: int = 0  # highest subscription ID covered by the last completed sweep
+
+
+# Columns of a subscription as given to bulk loads: (user_email, user_name, latitude, longitude, city, threshold)
+SubscriptionRow = Tuple[str, str, float, float, str, int]
+
+# {max Kp threshold: [tile, ...]} as produced by alerts.active_tiles()
+ActiveTiles = Dict[int, List[int]]
+
+
+def to_epoch(dt: datetime) -> int:
+    """
+    Converts a datetime to epoch seconds the same way the stores read stored alert times
+    (naive values are taken as UTC, aware values are converted to UTC).
+    """
+    return calendar.timegm(dt.utctimetuple())
+
+
+def log_merged_cells(rows: Iterable[tuple]):
+    """
+    Logs every (user, grid cell) whose duplicate subscriptions are merged, with the locations dropped, from
+    (user_email, cell, kept ID, dropped ID, city, latitude, longitude) rows.
+    """
+    dropped: Dict[tuple, List[str]] = {}
+    for email, cell, kept_id, sub_id, city, lat, lon in rows:
+        dropped.setdefault((email, cell, kept_id), []).append(f"{sub_id} {city or ''} ({lat}, {lon})")
+    for (email, cell, kept_id), locations in dropped.items():
+        logger.warning(
+            f"Merged subscriptions of {email} in grid cell {cell} into {kept_id}, dropping {'; '.join(locations)}"
+        )
+
+
+def row_to_subscription(row) -> Subscription:
+    """
+    Builds a Subscription from (id, user_email, user_name, latitude, longitude, city, threshold, last_alert_sent).
+    """
+    last_alert = row[7]
+    if isinstance(last_alert, str):
+        last_alert = datetime.fromisoformat(last_alert)
+    return Subscription(
+        id=row[0],
+        user_email=row[1],
+        user_name=row[2],
+        latitude=row[3],
+        longitude=row[4],
+        city=row[5],
+        threshold=row[6],
+        last_alert_sent=last_alert or None,
+    )
+
+
+class SubscriptionStore(ABC):
+    """
+    Storage backend for subscriptions and sweep progress.
+
+    The functions in src.backend.db delegate to the store selected by DATABASE_URL, so the web app, the scheduler
+    and the RQ workers share one implementation per backend.
+    """
+
+    @abstractmethod
+    def init_schema(self):
+        """
+        Creates the tables and indexes if they don't exist and migrates older schemas.
+        """
+
+    @abstractmethod
+    def save_subscription(
+        self, user_email: str, user_name: str, latitude: float, longitude: float, city: str, threshold: int
+    ) -> int:
+        """
+        Inserts a new subscription or updates the existing one of the same email in the same grid cell, marking
+        it pending (see mark_pending). Returns the subscription ID.
+        """
+
+    @abstractmethod
+    def bulk_load_subscriptions(self, rows: Iterable[SubscriptionRow]) -> int:
+        """
+        Inserts many new subscriptions at once, without the duplicate check of save_subscription().
+        Returns the number of subscriptions inserted (or updated, for a cell the user already subscribed to).
+        """
+
+    @abstractmethod
+    def get_all_subscriptions(self) -> List[Subscription]:
+        """
+        Fetches every subscription.
+        """
+
+    @abstractmethod
+    def get_subscriptions_for_user(self, user_email: str) -> List[Subscription]:
+        """
+        Fetches the subscriptions of a single user, in ID order.
+        """
+
+    @abstractmethod
+    def iter_subscriptions(
+        self,
+        batch_size: int = SUBSCRIPTION_BATCH_SIZE,
+        active_tiles: Optional[ActiveTiles] = None,
+        after_id: int = 0,
+        max_id: Optional[int] = None,
+        pending: bool = False,
+    ) -> Iterator[np.ndarray]:
+        """
+        Yields the subscriptions with after_id < ID <= max_id, in ID order, as SUBSCRIPTION_DTYPE arrays of at
+        most batch_size elements. If active_tiles is given, only subscriptions in those tiles with a threshold
+        at or below the tile's maximum are yielded; with pending=True, only subscriptions marked pending.
+        """
+
+    def get_subscription_columns(
+        self,
+        active_tiles: Optional[ActiveTiles] = None,
+        after_id: int = 0,
+        max_id: Optional[int] = None,
+        pending: bool = False,
+    ) -> np.ndarray:
+        """
+        Same selection as iter_subscriptions(), as a single SUBSCRIPTION_DTYPE array.
+        """
+        chunks = list(
+            self.iter_subscriptions(active_tiles=active_tiles, after_id=after_id, max_id=max_id, pending=pending)
+        )
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=SUBSCRIPTION_DTYPE)
+
+    @abstractmethod
+    def get_subscriptions_by_ids(self, sub_ids: List[int]) -> List[Subscription]:
+        """
+        Fetches the subscriptions with the given (sorted) IDs, in ID order.
+        """
+
+    @abstractmethod
+    def get_max_subscription_id(self) -> int:
+        """
+        Returns the highest subscription ID (0 if there are none).
+        """
+
+    @abstractmethod
+    def load_sweep_state(self) -> SweepState:
+        """
+        Loads the persisted sweep state (an empty SweepState if no sweep has run yet).
+        """
+
+    @abstractmethod
+    def save_sweep_state(self, state: SweepState):
+        """
+        Persists the sweep state, replacing the previous one.
+        """
+
+    @abstractmethod
+    def bulk_update_last_alert_sent(self, sub_ids: List[int], alert_time: datetime):
+        """
+        Sets last_alert_sent for the given subscriptions in a single transaction, clearing their pending marks.
+        """
+
+    @abstractmethod
+    def mark_pending(self, sub_ids: List[int], since: int):
+        """
+        Marks subscriptions pending as of since (epoch seconds): they need another look in the next sweep even if
+        their cell does not change, e.g. because an alert is due but was held back or not delivered yet.
+        """
+
+    @abstractmethod
+    def clear_pending(self, after_id: int, max_id: Optional[int], before: int):
+        """
+        Clears the pending marks set before `before` (epoch seconds) of subscriptions with after_id < ID <= max_id.
+        """
+
+    @abstractmethod
+    def remove_subscription(self, sub_id: int) -> Optional[Subscription]:
+        """
+        Deletes a subscription. Returns the removed subscription, or None if it did not exist.
+        """
+
+    @abstractmethod
+    def close(self):
+        """
+        Releases the connections held by this store.
+        """
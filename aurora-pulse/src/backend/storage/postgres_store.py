@@ -0,0 +1,325 @@
+import itertools
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+from loguru import logger
+from psycopg_pool import ConnectionPool
+from src.backend.config import DB_POOL_SIZE, SUBSCRIPTION_BATCH_SIZE
+from src.backend.ovation_grid import GRID_SHAPE, cell_id, tile_index
+
+from .base import (
+    SUBSCRIPTION_DTYPE,
+    ActiveTiles,
+    Subscription,
+    SubscriptionRow,
+    SubscriptionStore,
+    SweepState,
+    log_merged_cells,
+    row_to_subscription,
+    to_epoch,
+)
+
+_SUBSCRIPTION_COLUMNS = "id, user_email, user_name, latitude, longitude, city, threshold, last_alert_sent"
+_UPSERT_COLUMNS = "user_email, user_name, latitude, longitude, city, threshold, tile, cell"
+# A location in a cell the user already subscribed to updates that subscription: its threshold, name and the
+# location within the cell. The update marks it pending (the %(now)s parameter, an epoch), as delta sweeps would
+# otherwise not look at it again until its cell crosses a threshold level
+_ON_CELL_CONFLICT = """
+    ON CONFLICT (user_email, cell) DO UPDATE SET threshold=EXCLUDED.threshold, user_name=EXCLUDED.user_name,
+        city=EXCLUDED.city, latitude=EXCLUDED.latitude, longitude=EXCLUDED.longitude, pending_since=%(now)s
+"""
+
+# Names server-side cursors uniquely within a process
+_cursor_ids = itertools.count()
+
+
+class PostgresStore(SubscriptionStore):
+    """
+    Subscription store in PostgreSQL, for deployments where the web app and several workers share the data.
+
+    Connections come from a pool shared by the process's threads. Sweeps stream subscriptions through
+    server-side cursors, and bulk loads use COPY.
+    """
+
+    def __init__(self, conninfo: str, max_size: int = DB_POOL_SIZE):
+        self.pool = ConnectionPool(conninfo, min_size=1, max_size=max_size, open=True)
+
+    def close(self):
+        self.pool.close()
+
+    def init_schema(self):
+        with self.pool.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    id BIGSERIAL PRIMARY KEY,
+                    user_email TEXT NOT NULL,
+                    user_name TEXT,
+                    latitude DOUBLE PRECISION NOT NULL,
+                    longitude DOUBLE PRECISION NOT NULL,
+                    city TEXT,
+                    threshold INTEGER NOT NULL,
+                    last_alert_sent TIMESTAMP,
+                    tile INTEGER,
+                    cell INTEGER,
+                    pending_since BIGINT
+                )
+                """
+            )
+            self._migrate_columns(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_tile ON subscriptions (tile, threshold)")
+            conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_subscriptions_pending ON subscriptions (id)
+                WHERE pending_since IS NOT NULL
+                """
+            )
+            self._merge_duplicate_cells(conn)
+            conn.execute("DROP INDEX IF EXISTS idx_subscriptions_user_location")
+            conn.execute("DROP INDEX IF EXISTS idx_subscriptions_user_cell")
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_subscriptions_user_cell ON subscriptions (user_email, cell)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sweep_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    forecast_time TEXT,
+                    grid BYTEA,
+                    cursor BIGINT,
+                    high_water BIGINT NOT NULL DEFAULT 0
+                )
+                """
+            )
+
+    @staticmethod
+    def _migrate_columns(conn):
+        """
+        Adds the cell and pending_since columns to databases created before they existed and backfills cell from
+        the coordinates.
+        """
+        conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS cell INTEGER")
+        conn.execute("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS pending_since BIGINT")
+        rows = conn.execute("SELECT id, latitude, longitude FROM subscriptions WHERE cell IS NULL").fetchall()
+        if rows:
+            ids, lats, lons = (np.array(col) for col in zip(*rows))
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "UPDATE subscriptions SET cell=%s WHERE id=%s", zip(cell_id(lats, lons).tolist(), ids.tolist())
+                )
+            logger.info(f"Backfilled cell for {len(rows)} subscriptions")
+
+    @staticmethod
+    def _merge_duplicate_cells(conn):
+        """
+        Merges subscriptions of a user that share a grid cell, as saved before duplicates were detected by cell,
+        so that (user_email, cell) can be unique: the latest one is kept, with the lowest threshold and the latest
+        alert time of them all. The locations dropped are logged. Runs once, before the unique index exists.
+        """
+        if conn.execute("SELECT to_regclass('uq_subscriptions_user_cell')").fetchone()[0] is not None:
+            return
+        log_merged_cells(
+            conn.execute(
+                """
+                SELECT s.user_email, s.cell, kept.id, s.id, s.city, s.latitude, s.longitude
+                FROM subscriptions s JOIN (
+                    SELECT user_email, cell, MAX(id) AS id FROM subscriptions
+                    GROUP BY user_email, cell HAVING COUNT(*) > 1
+                ) kept ON kept.user_email = s.user_email AND kept.cell = s.cell AND s.id < kept.id
+                ORDER BY s.id
+                """
+            ).fetchall()
+        )
+        conn.execute(
+            """
+            UPDATE subscriptions s SET threshold = d.threshold, last_alert_sent = d.last_alert_sent
+            FROM (
+                SELECT MAX(id) AS id, MIN(threshold) AS threshold, MAX(last_alert_sent) AS last_alert_sent
+                FROM subscriptions GROUP BY user_email, cell HAVING COUNT(*) > 1
+            ) d
+            WHERE s.id = d.id
+            """
+        )
+        merged = conn.execute(
+            """
+            DELETE FROM subscriptions s USING subscriptions newer
+            WHERE newer.user_email = s.user_email AND newer.cell = s.cell AND newer.id > s.id
+            """
+        ).rowcount
+        if merged:
+            logger.info(f"Merged {merged} subscriptions into others of the same user and grid cell")
+
+    def save_subscription(
+        self, user_email: str, user_name: str, latitude: float, longitude: float, city: str, threshold: int
+    ) -> int:
+        cell = int(cell_id(latitude, longitude))
+        tile = int(tile_index(latitude, longitude))
+        with self.pool.connection() as conn:
+            # Atomic even for concurrent saves of the same location, which a SELECT ... FOR UPDATE of a row that
+            # does not exist yet could not serialize
+            row = conn.execute(
+                f"""
+                INSERT INTO subscriptions ({_UPSERT_COLUMNS})
+                VALUES (%(email)s, %(name)s, %(lat)s, %(lon)s, %(city)s, %(threshold)s, %(tile)s, %(cell)s)
+                {_ON_CELL_CONFLICT}
+                RETURNING id
+                """,
+                {
+                    "email": user_email,
+                    "name": user_name,
+                    "lat": latitude,
+                    "lon": longitude,
+                    "city": city,
+                    "threshold": threshold,
+                    "tile": tile,
+                    "cell": cell,
+                    "now": to_epoch(datetime.now()),
+                },
+            ).fetchone()
+            return row[0]
+
+    def bulk_load_subscriptions(self, rows: Iterable[SubscriptionRow]) -> int:
+        copied = 0
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            # COPY cannot resolve conflicts, so rows are copied into a staging table and upserted from there (the
+            # last row of a user and cell wins, as with repeated save_subscription calls)
+            cur.execute(
+                """
+                CREATE TEMPORARY TABLE subscriptions_staging (
+                    ord BIGSERIAL, user_email TEXT, user_name TEXT, latitude DOUBLE PRECISION,
+                    longitude DOUBLE PRECISION, city TEXT, threshold INTEGER, tile INTEGER, cell INTEGER
+                ) ON COMMIT DROP
+                """
+            )
+            with cur.copy(f"COPY subscriptions_staging ({_UPSERT_COLUMNS}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row((*row, int(tile_index(row[2], row[3])), int(cell_id(row[2], row[3]))))
+                    copied += 1
+            cur.execute(
+                f"""
+                INSERT INTO subscriptions ({_UPSERT_COLUMNS})
+                SELECT {_UPSERT_COLUMNS} FROM (
+                    SELECT DISTINCT ON (user_email, cell) * FROM subscriptions_staging
+                    ORDER BY user_email, cell, ord DESC
+                ) latest
+                ORDER BY ord
+                {_ON_CELL_CONFLICT}
+                """,
+                {"now": to_epoch(datetime.now())},
+            )
+            # Staged duplicates of a user and cell were collapsed into one row
+            count = cur.rowcount
+        logger.debug(f"Copied {copied} subscriptions into PostgreSQL, {count} inserted or updated")
+        return count
+
+    def get_all_subscriptions(self) -> List[Subscription]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(f"SELECT {_SUBSCRIPTION_COLUMNS} FROM subscriptions").fetchall()
+        return [row_to_subscription(row) for row in rows]
+
+    def get_subscriptions_for_user(self, user_email: str) -> List[Subscription]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {_SUBSCRIPTION_COLUMNS} FROM subscriptions WHERE user_email=%s ORDER BY id", (user_email,)
+            ).fetchall()
+        return [row_to_subscription(row) for row in rows]
+
+    def iter_subscriptions(
+        self,
+        batch_size: int = SUBSCRIPTION_BATCH_SIZE,
+        active_tiles: Optional[ActiveTiles] = None,
+        after_id: int = 0,
+        max_id: Optional[int] = None,
+        pending: bool = False,
+    ) -> Iterator[np.ndarray]:
+        query = """
+            SELECT id, cell, threshold, COALESCE(EXTRACT(EPOCH FROM last_alert_sent)::BIGINT, 0)
+            FROM subscriptions
+            WHERE id > %s
+        """
+        params = [after_id]
+        if max_id is not None:
+            query += " AND id <= %s"
+            params.append(max_id)
+        if pending:
+            query += " AND pending_since IS NOT NULL"
+        if active_tiles is not None:
+            clauses = []
+            for max_kp, tiles in active_tiles.items():
+                if tiles:
+                    clauses.append("(tile = ANY(%s) AND threshold <= %s)")
+                    params.extend([list(tiles), max_kp])
+            if not clauses:
+                return
+            query += " AND (" + " OR ".join(clauses) + ")"
+        query += " ORDER BY id"
+
+        # The server-side cursor keeps one pooled connection (and its snapshot) for the whole stream;
+        # alert updates made meanwhile go through other connections of the pool
+        with self.pool.connection() as conn, conn.transaction():
+            with conn.cursor(name=f"aurora_subscriptions_{next(_cursor_ids)}") as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                while rows := cur.fetchmany(batch_size):
+                    yield np.array(rows, dtype=SUBSCRIPTION_DTYPE)
+
+    def get_subscriptions_by_ids(self, sub_ids: List[int]) -> List[Subscription]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {_SUBSCRIPTION_COLUMNS} FROM subscriptions WHERE id = ANY(%s) ORDER BY id", (sub_ids,)
+            ).fetchall()
+        return [row_to_subscription(row) for row in rows]
+
+    def get_max_subscription_id(self) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM subscriptions").fetchone()[0]
+
+    def load_sweep_state(self) -> SweepState:
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT forecast_time, grid, cursor, high_water FROM sweep_state WHERE id=1").fetchone()
+
+        if not row:
+            return SweepState()
+        grid = np.frombuffer(row[1], dtype=np.uint8).reshape(GRID_SHAPE) if row[1] else None
+        return SweepState(forecast_time=row[0], grid=grid, cursor=row[2], high_water=row[3])
+
+    def save_sweep_state(self, state: SweepState):
+        grid = np.clip(state.grid, 0, 255).astype(np.uint8).tobytes() if state.grid is not None else None
+        with self.pool.connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO sweep_state (id, forecast_time, grid, cursor, high_water)
+                VALUES (1, %s, %s, %s, %s)
+                ON CONFLICT (id) DO UPDATE SET forecast_time = EXCLUDED.forecast_time, grid = EXCLUDED.grid,
+                    cursor = EXCLUDED.cursor, high_water = EXCLUDED.high_water
+                """,
+                (state.forecast_time, grid, state.cursor, state.high_water),
+            )
+
+    def bulk_update_last_alert_sent(self, sub_ids: List[int], alert_time: datetime):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE subscriptions SET last_alert_sent=%s, pending_since=NULL WHERE id = ANY(%s)",
+                (alert_time, sub_ids),
+            )
+
+    def mark_pending(self, sub_ids: List[int], since: int):
+        with self.pool.connection() as conn:
+            conn.execute("UPDATE subscriptions SET pending_since=%s WHERE id = ANY(%s)", (since, sub_ids))
+
+    def clear_pending(self, after_id: int, max_id: Optional[int], before: int):
+        query = "UPDATE subscriptions SET pending_since=NULL WHERE pending_since < %s AND id > %s"
+        params = [before, after_id]
+        if max_id is not None:
+            query += " AND id <= %s"
+            params.append(max_id)
+        with self.pool.connection() as conn:
+            conn.execute(query, params)
+
+    def remove_subscription(self, sub_id: int) -> Optional[Subscription]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                f"DELETE FROM subscriptions WHERE id=%s RETURNING {_SUBSCRIPTION_COLUMNS}", (sub_id,)
+            ).fetchone()
+        return row_to_subscription(row) if row else None
@@ -0,0 +1,359 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+from loguru import logger
+from src.backend.config import SUBSCRIPTION_BATCH_SIZE
+from src.backend.ovation_grid import GRID_SHAPE, cell_id, tile_index
+
+from .base import (
+    SUBSCRIPTION_DTYPE,
+    ActiveTiles,
+    Subscription,
+    SubscriptionRow,
+    SubscriptionStore,
+    SweepState,
+    log_merged_cells,
+    row_to_subscription,
+    to_epoch,
+)
+
+_MAX_SQL_VARIABLES = 900  # stay well below SQLite's bound parameter limit
+
+# A location in a cell the user already subscribed to updates that subscription: its threshold, name and the
+# location within the cell. The update marks it pending (the last parameter: now, as an epoch), as delta sweeps
+# would otherwise not look at it again until its cell crosses a threshold level
+_UPSERT_SUBSCRIPTION = """
+    INSERT INTO subscriptions (user_email, user_name, latitude, longitude, city, threshold, tile, cell)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_email, cell) DO UPDATE SET threshold=excluded.threshold, user_name=excluded.user_name,
+        city=excluded.city, latitude=excluded.latitude, longitude=excluded.longitude, pending_since=?
+"""
+
+
+class SQLiteStore(SubscriptionStore):
+    """
+    Subscription store in a local SQLite file.
+
+    Each thread keeps one long-lived connection so sqlite3's prepared statement cache is reused. Connections use
+    WAL journaling so the web app and workers can read while a sweep writes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # Every connection opened by this process's threads, so close() also reaches those of threads that are
+        # done with the store (e.g. asyncio.to_thread workers) and WAL files are not left behind
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._connections_pid = os.getpid()
+        self._generation = 0
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns this thread's connection, opening it on first use (and again in forked children or after close()).
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid() or self._local.generation != self._generation:
+            # Used by this thread only; check_same_thread is off so that close() may close it from another
+            conn = sqlite3.connect(self.path, timeout=30, cached_statements=256, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._connections_lock:
+                if self._connections_pid != os.getpid():
+                    # A forked child: the parent's connections are not this process's to close
+                    self._connections, self._connections_pid = [], os.getpid()
+                self._connections.append(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.generation = self._generation
+        return conn
+
+    def close(self):
+        with self._connections_lock:
+            connections = self._connections if self._connections_pid == os.getpid() else []
+            self._connections = []
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+        self._local.conn = None
+
+    def init_schema(self):
+        conn = self.connection()
+        with conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_email TEXT NOT NULL,
+                    user_name TEXT,
+                    latitude REAL NOT NULL,
+                    longitude REAL NOT NULL,
+                    city TEXT,
+                    threshold INTEGER NOT NULL,
+                    last_alert_sent TEXT,
+                    tile INTEGER,
+                    cell INTEGER,
+                    pending_since INTEGER
+                )
+                """
+            )
+            self._migrate_columns(c)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_tile ON subscriptions (tile, threshold)")
+            c.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_subscriptions_pending ON subscriptions (id)
+                WHERE pending_since IS NOT NULL
+                """
+            )
+            self._merge_duplicate_cells(c)
+            # Serves both per-user lookups (prefix) and the upsert in save_subscription
+            c.execute("DROP INDEX IF EXISTS idx_subscriptions_user_location")
+            c.execute("DROP INDEX IF EXISTS idx_subscriptions_user_cell")
+            c.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_subscriptions_user_cell ON subscriptions (user_email, cell)"
+            )
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sweep_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    forecast_time TEXT,
+                    grid BLOB,
+                    cursor INTEGER,
+                    high_water INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+
+    @staticmethod
+    def _migrate_columns(c: sqlite3.Cursor):
+        """
+        Adds the tile, cell and pending_since columns to databases created before they existed and backfills tile
+        and cell from the coordinates.
+        """
+        columns = {row[1] for row in c.execute("PRAGMA table_info(subscriptions)")}
+        for column in ("tile", "cell", "pending_since"):
+            if column not in columns:
+                c.execute(f"ALTER TABLE subscriptions ADD COLUMN {column} INTEGER")
+
+        rows = c.execute(
+            "SELECT id, latitude, longitude FROM subscriptions WHERE tile IS NULL OR cell IS NULL"
+        ).fetchall()
+        if rows:
+            ids, lats, lons = (np.array(col) for col in zip(*rows))
+            c.executemany(
+                "UPDATE subscriptions SET tile=?, cell=? WHERE id=?",
+                zip(tile_index(lats, lons).tolist(), cell_id(lats, lons).tolist(), ids.tolist()),
+            )
+            logger.info(f"Backfilled tile and cell for {len(rows)} subscriptions")
+
+    @staticmethod
+    def _merge_duplicate_cells(c: sqlite3.Cursor):
+        """
+        Merges subscriptions of a user that share a grid cell, as saved before duplicates were detected by cell,
+        so that (user_email, cell) can be unique: the latest one is kept, with the lowest threshold and the latest
+        alert time of them all. The locations dropped are logged. Runs once, before the unique index exists.
+        """
+        query = "SELECT 1 FROM sqlite_master WHERE type='index' AND name='uq_subscriptions_user_cell'"
+        if c.execute(query).fetchone():
+            return
+        log_merged_cells(
+            c.execute(
+                """
+                SELECT s.user_email, s.cell, kept.id, s.id, s.city, s.latitude, s.longitude
+                FROM subscriptions s JOIN (
+                    SELECT user_email, cell, MAX(id) AS id FROM subscriptions
+                    GROUP BY user_email, cell HAVING COUNT(*) > 1
+                ) kept ON kept.user_email = s.user_email AND kept.cell = s.cell AND s.id < kept.id
+                ORDER BY s.id
+                """
+            ).fetchall()
+        )
+        c.execute(
+            """
+            UPDATE subscriptions
+            SET (threshold, last_alert_sent) = (
+                SELECT MIN(d.threshold), MAX(d.last_alert_sent) FROM subscriptions d
+                WHERE d.user_email = subscriptions.user_email AND d.cell = subscriptions.cell
+            )
+            WHERE id IN (SELECT MAX(id) FROM subscriptions GROUP BY user_email, cell HAVING COUNT(*) > 1)
+            """
+        )
+        c.execute(
+            "DELETE FROM subscriptions WHERE id NOT IN (SELECT MAX(id) FROM subscriptions GROUP BY user_email, cell)"
+        )
+        if c.rowcount:
+            logger.info(f"Merged {c.rowcount} subscriptions into others of the same user and grid cell")
+
+    def save_subscription(
+        self, user_email: str, user_name: str, latitude: float, longitude: float, city: str, threshold: int
+    ) -> int:
+        cell = int(cell_id(latitude, longitude))
+        tile = int(tile_index(latitude, longitude))
+        conn = self.connection()
+        with conn:
+            row = conn.execute(
+                _UPSERT_SUBSCRIPTION + " RETURNING id",
+                (user_email, user_name, latitude, longitude, city, threshold, tile, cell, to_epoch(datetime.now())),
+            ).fetchone()
+        return row[0]
+
+    def bulk_load_subscriptions(self, rows: Iterable[SubscriptionRow]) -> int:
+        now = to_epoch(datetime.now())
+        conn = self.connection()
+        with conn:
+            c = conn.executemany(
+                _UPSERT_SUBSCRIPTION,
+                ((*row, int(tile_index(row[2], row[3])), int(cell_id(row[2], row[3])), now) for row in rows),
+            )
+        return c.rowcount
+
+    def get_all_subscriptions(self) -> List[Subscription]:
+        c = self.connection().cursor()
+        c.execute("SELECT * FROM subscriptions")
+        return [row_to_subscription(row) for row in c.fetchall()]
+
+    def get_subscriptions_for_user(self, user_email: str) -> List[Subscription]:
+        c = self.connection().cursor()
+        c.execute("SELECT * FROM subscriptions WHERE user_email=? ORDER BY id", (user_email,))
+        return [row_to_subscription(row) for row in c.fetchall()]
+
+    def _columns_query(self, active_tiles: Optional[ActiveTiles], max_id: Optional[int], pending: bool):
+        query = """
+            SELECT id, cell, threshold, COALESCE(CAST(strftime('%s', last_alert_sent) AS INTEGER), 0)
+            FROM subscriptions
+            WHERE id > ?
+        """
+        params = []
+        if max_id is not None:
+            query += " AND id <= ?"
+            params.append(max_id)
+        if pending:
+            query += " AND pending_since IS NOT NULL"
+        if active_tiles is not None:
+            clauses = []
+            for max_kp, tiles in active_tiles.items():
+                if tiles:
+                    clauses.append(f"(tile IN ({','.join('?' * len(tiles))}) AND threshold <= ?)")
+                    params.extend(tiles)
+                    params.append(max_kp)
+            if not clauses:
+                return None, None
+            query += " AND (" + " OR ".join(clauses) + ")"
+        return query + " ORDER BY id", params
+
+    def get_subscription_columns(
+        self,
+        active_tiles: Optional[ActiveTiles] = None,
+        after_id: int = 0,
+        max_id: Optional[int] = None,
+        pending: bool = False,
+    ) -> np.ndarray:
+        query, params = self._columns_query(active_tiles, max_id, pending)
+        if query is None:
+            return np.empty(0, dtype=SUBSCRIPTION_DTYPE)
+
+        c = self.connection().cursor()
+        c.execute(query, [after_id] + params)
+        return np.fromiter(c, dtype=SUBSCRIPTION_DTYPE)
+
+    def iter_subscriptions(
+        self,
+        batch_size: int = SUBSCRIPTION_BATCH_SIZE,
+        active_tiles: Optional[ActiveTiles] = None,
+        after_id: int = 0,
+        max_id: Optional[int] = None,
+        pending: bool = False,
+    ) -> Iterator[np.ndarray]:
+        query, params = self._columns_query(active_tiles, max_id, pending)
+        if query is None:
+            return
+
+        # Each chunk is a separate query resuming after the previous chunk's last ID, so no read stays open
+        # (and no WAL snapshot is pinned) while the caller writes between chunks
+        query += " LIMIT ?"
+        c = self.connection().cursor()
+        while True:
+            c.execute(query, [after_id] + params + [batch_size])
+            chunk = np.fromiter(c, dtype=SUBSCRIPTION_DTYPE)
+            if len(chunk):
+                yield chunk
+            if len(chunk) < batch_size:
+                return
+            after_id = int(chunk["id"][-1])
+
+    def get_subscriptions_by_ids(self, sub_ids: List[int]) -> List[Subscription]:
+        c = self.connection().cursor()
+        subs = []
+        for start in range(0, len(sub_ids), _MAX_SQL_VARIABLES):
+            chunk = sub_ids[start : start + _MAX_SQL_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            c.execute(f"SELECT * FROM subscriptions WHERE id IN ({placeholders}) ORDER BY id", chunk)
+            subs.extend(row_to_subscription(row) for row in c.fetchall())
+        return subs
+
+    def get_max_subscription_id(self) -> int:
+        c = self.connection().cursor()
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM subscriptions")
+        return c.fetchone()[0]
+
+    def load_sweep_state(self) -> SweepState:
+        c = self.connection().cursor()
+        c.execute("SELECT forecast_time, grid, cursor, high_water FROM sweep_state WHERE id=1")
+        row = c.fetchone()
+
+        if not row:
+            return SweepState()
+        grid = np.frombuffer(row[1], dtype=np.uint8).reshape(GRID_SHAPE) if row[1] else None
+        return SweepState(forecast_time=row[0], grid=grid, cursor=row[2], high_water=row[3])
+
+    def save_sweep_state(self, state: SweepState):
+        grid = np.clip(state.grid, 0, 255).astype(np.uint8).tobytes() if state.grid is not None else None
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO sweep_state (id, forecast_time, grid, cursor, high_water)
+                VALUES (1, ?, ?, ?, ?)
+                """,
+                (state.forecast_time, grid, state.cursor, state.high_water),
+            )
+
+    def bulk_update_last_alert_sent(self, sub_ids: List[int], alert_time: datetime):
+        alert_time = alert_time.isoformat()
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "UPDATE subscriptions SET last_alert_sent=?, pending_since=NULL WHERE id=?",
+                ((alert_time, sub_id) for sub_id in sub_ids),
+            )
+
+    def mark_pending(self, sub_ids: List[int], since: int):
+        conn = self.connection()
+        with conn:
+            conn.executemany("UPDATE subscriptions SET pending_since=? WHERE id=?", ((since, i) for i in sub_ids))
+
+    def clear_pending(self, after_id: int, max_id: Optional[int], before: int):
+        query = "UPDATE subscriptions SET pending_since=NULL WHERE pending_since < ? AND id > ?"
+        params = [before, after_id]
+        if max_id is not None:
+            query += " AND id <= ?"
+            params.append(max_id)
+        conn = self.connection()
+        with conn:
+            conn.execute(query, params)
+
+    def remove_subscription(self, sub_id: int) -> Optional[Subscription]:
+        conn = self.connection()
+        with conn:
+            c = conn.cursor()
+            c.execute("SELECT * FROM subscriptions WHERE id=?", (sub_id,))
+            row = c.fetchone()
+            if not row:
+                return None
+            c.execute("DELETE FROM subscriptions WHERE id=?", (sub_id,))
+        return row_to_subscription(row)
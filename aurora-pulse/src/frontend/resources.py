@@ -0,0 +1,112 @@
+import base64
+import threading
+from typing import List, Optional, Tuple
+
+import folium
+import streamlit as st
+from geopy.extra.rate_limiter import RateLimiter
+from geopy.geocoders import Nominatim
+from loguru import logger
+from rq import Queue
+from src.backend import db
+from src.backend.aurora_overlay import OVERLAY_BOUNDS
+from src.backend.redis_handler.redis_conn import redis_conn
+from src.backend.redis_handler.snapshots import load_latest_overlay
+from src.backend.storage import Subscription, SubscriptionStore
+from streamlit_folium import st_folium
+
+# st_folium renders (and slightly rewrites) the map it is given, and the base map is shared by every session
+_map_lock = threading.Lock()
+
+
+@st.cache_resource
+def get_reverse_geocoder() -> RateLimiter:
+    """
+    Nominatim reverse geocoder shared by every session, rate limited to Nominatim's one request per second.
+    Failures raise instead of returning None, so reverse_geocode_city does not cache them as unknown locations.
+    """
+    geolocator = Nominatim(user_agent="aurora_pulse_app")
+    return RateLimiter(geolocator.reverse, min_delay_seconds=1, swallow_exceptions=False)
+
+
+@st.cache_resource
+def get_queue() -> Queue:
+    """
+    RQ queue the app enqueues subscription checks on.
+    """
+    return Queue("aurora", connection=redis_conn)
+
+
+@st.cache_resource
+def get_subscription_store() -> SubscriptionStore:
+    """
+    Subscription store of this server process (its schema is created when it is first opened).
+    """
+    return db.get_store()
+
+
+# Refreshed every minute; the workers publish a new overlay at most once per forecast
+@st.cache_data(ttl=60)
+def get_aurora_overlay() -> Optional[Tuple[str, str]]:
+    """
+    (snapshot ID, PNG data URL) of the latest aurora overlay rendered by the workers, or None if there is none yet.
+    """
+    try:
+        overlay = load_latest_overlay(redis_conn)
+    except Exception as e:
+        logger.warning(f"Could not load the aurora overlay: {e}")
+        return None
+    if overlay is None:
+        return None
+    snapshot_id, png = overlay
+    return snapshot_id, "data:image/png;base64," + base64.b64encode(png).decode()
+
+
+@st.cache_resource(max_entries=2)
+def get_base_map(overlay: Optional[Tuple[str, str]] = None) -> folium.Map:
+    """
+    World map shared by every session, rendered once per aurora overlay. Per-session markers, center and zoom are
+    passed to st_folium separately so the map is not rebuilt (or remounted in the browser) on every rerun.
+    """
+    m = folium.Map(location=[0, 0], zoom_start=2)
+    if overlay is not None:
+        folium.raster_layers.ImageOverlay(
+            image=overlay[1], bounds=OVERLAY_BOUNDS, name="Aurora forecast", interactive=False
+        ).add_to(m)
+    m.get_root().render()
+    return m
+
+
+def render_map(**kwargs):
+    """
+    Show the base map, with the latest aurora overlay, with st_folium(**kwargs) and return its interaction data.
+    """
+    overlay = get_aurora_overlay()
+    with _map_lock:
+        return st_folium(get_base_map(overlay), render=False, **kwargs)
+
+
+# Cached per user; the TTL picks up alert times written by the workers
+@st.cache_data(ttl=60)
+def get_user_subscriptions(user_email: str) -> List[Subscription]:
+    """
+    Subscriptions of one user, cached until they change (see save_subscription and remove_subscription).
+    """
+    return get_subscription_store().get_subscriptions_for_user(user_email)
+
+
+def save_subscription(user_email: str, user_name: str, latitude: float, longitude: float, city: str, threshold: int):
+    """
+    db.save_subscription that also invalidates the user's cached subscriptions. Returns the subscription ID.
+    """
+    sub_id = db.save_subscription(user_email, user_name, latitude, longitude, city, threshold)
+    get_user_subscriptions.clear(user_email)
+    return sub_id
+
+
+def remove_subscription(sub: Subscription):
+    """
+    db.remove_subscription that also invalidates the user's cached subscriptions.
+    """
+    db.remove_subscription(sub.id)
+    get_user_subscriptions.clear(sub.user_email)
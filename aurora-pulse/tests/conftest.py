@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from src.backend import alerts, db
+from src.backend.ovation_grid import GRID_SHAPE, OvationGrid
+
+
+@pytest.fixture
+def setup_db(monkeypatch, tmp_path):
+    """
+    Points the db module at a fresh SQLite database under tmp_path and yields its path.
+    """
+    path = str(tmp_path / "aurora_subscriptions.db")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.init_db()
+    yield path
+    db.close_connections()
+
+
+@pytest.fixture
+def mock_delivery(mocker):
+    """
+    Replaces email delivery with a mock that reports every digest delivered (set its side_effect to fail them).
+    """
+    return mocker.patch.object(alerts, "send_digests", side_effect=lambda digests: [True] * len(digests))
+
+
+@pytest.fixture
+def make_grid():
+    """
+    Factory of dark grids with `value` at the given (lat, lon) cells.
+    """
+
+    def make(*cells, value=9, forecast_time=None):
+        intensity = np.zeros(GRID_SHAPE, dtype=np.uint8)
+        for lat, lon in cells:
+            intensity[lat + 90, lon] = value
+        return OvationGrid(intensity, forecast_time=forecast_time)
+
+    return make
@@ -0,0 +1,222 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from functools import partial
+
+import numpy as np
+from src.backend import alerts, db
+from src.backend.config import MIN_ALERT_GAP
+from src.backend.ovation_grid import tile_index
+
+
+def make_subs(rows):
+    return np.array(rows, dtype=db.SUBSCRIPTION_DTYPE)
+
+
+def test_evaluate_alerts_thresholds_and_gap():
+    now = 1_000_000
+    subs = make_subs(
+        [
+            (1, 0, 5, 0),  # 12 required, fires
+            (2, 0, 6, 0),  # 14 required, too weak
+            (3, 0, 5, now - 600),  # alerted 10 minutes ago, suppressed
+            (4, 0, 5, now - 7200),  # alerted 2 hours ago, fires
+            (5, 0, 12, 0),  # invalid Kp threshold
+        ]
+    )
+    intensity = np.full(len(subs), 13)
+    assert alerts.evaluate_alerts(intensity, subs, now, min_gap=3600).tolist() == [1, 4]
+
+
+def test_get_subscription_columns(setup_db):
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    db.save_subscription("b@example.com", "B", 51.5, -0.1, "London", 7)
+    sent_at = datetime(2025, 1, 1, 22, 30)
+    db.update_last_alert_sent(1, sent_at)
+
+    cols = db.get_subscription_columns()
+    assert cols["id"].tolist() == [1, 2]
+    assert cols["threshold"].tolist() == [3, 7]
+    assert cols["last_alert"].tolist() == [db.to_epoch(sent_at), 0]
+
+
+def test_run_alert_sweep_notifies_and_suppresses(setup_db, mock_delivery, make_grid):
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    db.save_subscription("b@example.com", "B", 10.0, 10.0, "Elsewhere", 3)
+    grid = make_grid((64, 338), value=6)
+
+    assert alerts.run_alert_sweep(grid) == 1
+    mock_delivery.assert_called_once_with([("a@example.com", "A", [("Reykjavik", 3)])])
+    assert db.get_all_subscriptions()[0].last_alert_sent is not None
+
+    # Second sweep inside MIN_ALERT_GAP sends nothing
+    assert alerts.run_alert_sweep(grid) == 0
+    assert mock_delivery.call_count == 1
+
+
+def test_user_alerts_are_sent_as_one_digest(setup_db, mock_delivery, make_grid):
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    db.save_subscription("b@example.com", "B", 64.1, -21.9, "Reykjavik", 3)
+    db.save_subscription("a@example.com", "A", 65.7, -18.1, "Akureyri", 2)
+    grid = make_grid((64, 338), (66, 342), value=6)
+
+    assert alerts.run_alert_sweep(grid) == 3
+    mock_delivery.assert_called_once_with(
+        [
+            ("a@example.com", "A", [("Reykjavik", 3), ("Akureyri", 2)]),
+            ("b@example.com", "B", [("Reykjavik", 3)]),
+        ]
+    )
+    assert all(sub.last_alert_sent is not None for sub in db.get_all_subscriptions())
+
+
+def test_undelivered_alerts_are_not_marked_sent(setup_db, mock_delivery, make_grid):
+    mock_delivery.side_effect = lambda digests: [False] * len(digests)
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+
+    assert alerts.run_alert_sweep(make_grid((64, 338), value=6)) == 0
+    assert db.get_all_subscriptions()[0].last_alert_sent is None
+
+
+def test_active_tiles_limits_loaded_subscriptions(setup_db, make_grid):
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)  # needs 6
+    db.save_subscription("b@example.com", "B", 64.1, -21.9, "Reykjavik", 5)  # needs 12
+    db.save_subscription("c@example.com", "C", 10.0, 10.0, "Elsewhere", 0)
+    grid = make_grid((64, 338), value=9)
+
+    tiles = alerts.active_tiles(grid)
+    assert tiles == {4: [int(tile_index(64, 338))]}
+    assert db.get_subscription_columns(tiles)["id"].tolist() == [1]
+    assert len(db.get_subscription_columns({})) == 0
+
+
+def test_init_db_backfills_tile_and_cell(setup_db):
+    conn = sqlite3.connect(setup_db)
+    conn.execute("INSERT INTO subscriptions (user_email, latitude, longitude, threshold) VALUES ('x', 64.1, -21.9, 3)")
+    conn.commit()
+    conn.close()
+
+    db.init_db()
+    conn = sqlite3.connect(setup_db)
+    assert conn.execute("SELECT tile, cell FROM subscriptions").fetchone() == (tile_index(64.1, -21.9), 154 * 360 + 338)
+    conn.close()
+
+
+def test_init_db_migrates_subscriptions_without_cell(setup_db, mocker):
+    # A database from before the cell column existed, and duplicates were told apart by exact coordinates
+    db.close_connections()
+    os.remove(setup_db)
+    conn = sqlite3.connect(setup_db)
+    conn.execute(
+        """
+        CREATE TABLE subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_email TEXT NOT NULL, user_name TEXT, latitude REAL NOT NULL,
+            longitude REAL NOT NULL, city TEXT, threshold INTEGER NOT NULL, last_alert_sent TEXT, tile INTEGER
+        )
+        """
+    )
+    # Two clicks of x in one cell, saved as separate subscriptions back then
+    conn.executemany(
+        "INSERT INTO subscriptions (user_email, latitude, longitude, city, threshold, last_alert_sent)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            ("x", 64.1, -21.9, "Reykjavik", 3, "2025-01-01T22:30:00"),
+            ("x", 64.12, -21.93, "Seltjarnarnes", 5, None),
+            ("y", 64.1, -21.9, "Reykjavik", 3, None),
+        ],
+    )
+    conn.commit()
+    conn.close()
+    log = mocker.patch("src.backend.storage.base.logger")
+
+    db.init_db()
+    # The latest of the two is kept, with the lower threshold and the earlier one's alert
+    cols = db.get_subscription_columns()
+    assert cols["id"].tolist() == [2, 3]
+    assert cols["cell"].tolist() == [154 * 360 + 338] * 2
+    assert cols["threshold"].tolist() == [3, 3]
+    assert cols["last_alert"][0] == db.to_epoch(datetime(2025, 1, 1, 22, 30))
+    assert db.get_subscriptions_by_ids([2])[0].city == "Seltjarnarnes"
+    (message,) = log.warning.call_args.args
+    assert message == "Merged subscriptions of x in grid cell 55778 into 2, dropping 1 Reykjavik (64.1, -21.9)"
+    assert db.save_subscription("x", "X", 64.1, -21.9, "Reykjavik", 4) == 2
+
+
+def test_delta_sweep_only_revisits_crossed_cells_and_new_subscriptions(setup_db, mock_delivery, make_grid):
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    quiet, storm = make_grid((64, 338), value=2), make_grid((64, 338), value=9)
+
+    assert alerts.run_alert_sweep(quiet) == 0
+    assert db.load_sweep_state().high_water == 1
+
+    # Unchanged grid: nothing to revisit, but a new subscription is still checked
+    db.save_subscription("b@example.com", "B", 64.2, -22.1, "Reykjavik", 0)
+    assert alerts.run_alert_sweep(quiet) == 1
+    assert mock_delivery.call_args.args[0][0][0] == "b@example.com"
+
+    # The cell crosses Kp 3's level: only then is the first subscription alerted
+    assert alerts.run_alert_sweep(storm) == 1
+    assert mock_delivery.call_args.args[0][0][0] == "a@example.com"
+
+
+def test_delta_sweep_revisits_updated_subscriptions(setup_db, mock_delivery, make_grid):
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 5)  # needs 12
+    grid = make_grid((64, 338), value=9)
+    assert alerts.run_alert_sweep(grid) == 0
+
+    # Lowering the threshold in an unchanged cell is picked up by the next delta sweep, and only that one
+    db.save_subscription("a@example.com", "A", 64.12, -21.93, "Reykjavik", 3)  # needs 6
+    assert alerts.run_alert_sweep(grid) == 1
+    assert alerts.run_alert_sweep(grid) == 0
+    assert mock_delivery.call_count == 1
+
+
+def test_delta_sweep_retries_held_and_undelivered_alerts(setup_db, mock_delivery, make_grid, mocker):
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    db.save_subscription("b@example.com", "B", 64.1, -21.9, "Reykjavik", 3)
+    now = datetime.now()
+    db.update_last_alert_sent(1, now)  # a is held back by MIN_ALERT_GAP
+    mock_delivery.side_effect = lambda digests: [False] * len(digests)  # b's delivery fails
+    grid = make_grid((64, 338), value=9)
+    assert alerts.run_alert_sweep(grid) == 0
+
+    # Neither cell changes, yet b is retried right away and a once the gap has passed
+    mock_delivery.side_effect = lambda digests: [True] * len(digests)
+    assert alerts.run_alert_sweep(grid) == 1
+    assert mock_delivery.call_args.args[0][0][0] == "b@example.com"
+
+    mocker.patch.object(alerts, "datetime").now.return_value = now + timedelta(seconds=MIN_ALERT_GAP)
+    assert alerts.run_alert_sweep(grid) == 1
+    assert mock_delivery.call_args.args[0][0][0] == "a@example.com"
+    assert alerts.run_alert_sweep(grid) == 0
+
+
+def test_sweep_resumes_from_cursor(setup_db, mock_delivery, make_grid):
+    for i in range(3):
+        db.save_subscription(f"{i}@example.com", "A", 64.1, -21.9 + i / 10, "Reykjavik", 3)
+    grid = make_grid((64, 338), value=9, forecast_time="2025-01-01T00:30:00Z")
+
+    # A previous run of this snapshot alerted up to subscription 2 and then died
+    db.save_sweep_state(db.SweepState(forecast_time="2025-01-01T00:30:00Z", cursor=2))
+    assert alerts.run_alert_sweep(grid) == 1
+    mock_delivery.assert_called_once_with([("2@example.com", "A", [("Reykjavik", 3)])])
+
+    state = db.load_sweep_state()
+    assert state.cursor is None and state.high_water == 3
+    assert state.grid[90 + 64, 338] == 9
+
+
+def test_delta_sweep_streams_small_batches(setup_db, mock_delivery, monkeypatch, make_grid):
+    monkeypatch.setattr(alerts, "iter_subscriptions", partial(db.iter_subscriptions, 1))
+    for i in range(3):
+        db.save_subscription(f"{i}@example.com", "A", 64.1, -21.9 + i / 10, "Reykjavik", 3)
+    assert alerts.run_alert_sweep(make_grid((64, 338), value=2)) == 0
+
+    db.save_subscription("new@example.com", "A", 64.1, -21.5, "Reykjavik", 3)
+    assert alerts.run_alert_sweep(make_grid((64, 338), value=9)) == 4
+    assert [call.args[0][0][0] for call in mock_delivery.call_args_list] == [
+        "0@example.com",
+        "1@example.com",
+        "2@example.com",
+        "new@example.com",
+    ]
@@ -0,0 +1,76 @@
+import struct
+import zlib
+
+import fakeredis
+import numpy as np
+from src.backend import aurora_overlay
+from src.backend.aurora_overlay import OVERLAY_PALETTE, encode_indexed_png, overlay_levels, render_overlay
+from src.backend.ovation_grid import GRID_SHAPE, OvationGrid
+from src.backend.redis_handler import snapshots
+
+
+def make_grid():
+    intensity = np.zeros(GRID_SHAPE, dtype=np.uint8)
+    intensity[90 + 60 : 90 + 71, :] = 6  # Kp 3 band around the auroral oval
+    intensity[90 + 64, 338] = 20  # Kp 9 over Reykjavik
+    return OvationGrid(intensity, forecast_time="2025-01-01T00:30:00Z")
+
+
+def read_png(data: bytes):
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks, pos = {}, 8
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos : pos + 4])
+        tag, body = data[pos + 4 : pos + 8], data[pos + 8 : pos + 8 + length]
+        assert struct.unpack(">I", data[pos + 8 + length : pos + 12 + length])[0] == zlib.crc32(tag + body)
+        chunks[tag] = body
+        pos += 12 + length
+    width, height = struct.unpack(">II", chunks[b"IHDR"][:8])
+    rows = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, width + 1)
+    return chunks, rows[:, 1:]
+
+
+def test_overlay_levels_follow_kp_thresholds():
+    levels = overlay_levels(make_grid(), size=1024)
+
+    def level_at(lat, lon):
+        y = (1 - np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) / np.pi) / 2 * 1024
+        return levels[int(y), int((lon + 180) / 360 * 1024)]
+
+    assert level_at(64, -22) == 10  # Kp 9 reached
+    assert level_at(65, 100) == 4  # intensity 6: Kp 0..3 reached
+    assert level_at(40, 100) == 0
+    assert level_at(-65, 100) == 0
+
+
+def test_png_round_trip():
+    indices = np.arange(12, dtype=np.uint8).reshape(3, 4) % len(OVERLAY_PALETTE)
+    chunks, pixels = read_png(encode_indexed_png(indices, OVERLAY_PALETTE))
+
+    assert np.array_equal(pixels, indices)
+    assert chunks[b"IHDR"][8:10] == bytes([8, 3])  # 8-bit palette
+    assert chunks[b"tRNS"][0] == 0  # below Kp 0 is transparent
+
+
+def test_overlay_size_is_constant():
+    quiet = OvationGrid(np.zeros(GRID_SHAPE, dtype=np.uint8))
+    stormy = OvationGrid(np.random.default_rng(0).integers(0, 30, GRID_SHAPE, dtype=np.uint8))
+
+    for grid in (quiet, stormy):
+        _, pixels = read_png(render_overlay(grid, size=256))
+        assert pixels.shape == (256, 256)
+
+
+def test_overlay_is_rendered_once_per_snapshot(mocker):
+    connection = fakeredis.FakeStrictRedis()
+    render = mocker.spy(snapshots, "render_overlay")
+    grid = make_grid()
+
+    assert snapshots.load_latest_overlay(connection) is None
+    snapshots.publish_overlay(grid, connection=connection)
+    snapshots.publish_overlay(grid, connection=connection)
+
+    assert render.call_count == 1
+    snapshot_id, png = snapshots.load_latest_overlay(connection)
+    assert snapshot_id == grid.snapshot_id
+    assert png == aurora_overlay.render_overlay(grid)
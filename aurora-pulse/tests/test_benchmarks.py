@@ -0,0 +1,61 @@
+import json
+import os
+
+import numpy as np
+from benchmarks import alert_pipeline, parallel_sweep, replay
+from benchmarks.synthetic import iter_subscription_rows, make_grid, make_payload
+from src.backend import db
+from src.backend.ovation_grid import OvationGrid
+
+
+def test_synthetic_payload_round_trips():
+    grid = make_grid("moderate")
+    parsed = OvationGrid.from_payload(json.loads(make_payload(grid)))
+
+    assert np.array_equal(parsed.intensity, grid.intensity)
+    assert parsed.snapshot_id == grid.snapshot_id
+
+
+def test_storms_reach_further_from_the_poles():
+    def equatorward_edge(scenario):
+        return np.abs(np.flatnonzero(make_grid(scenario).intensity.max(axis=1)) - 90).min()
+
+    assert equatorward_edge("extreme") < equatorward_edge("moderate") < equatorward_edge("quiet")
+
+
+def test_subscription_rows_are_deterministic():
+    rows = list(iter_subscription_rows(250, seed=1, chunk_size=100))
+    assert len(rows) == 250
+    assert rows == list(iter_subscription_rows(250, seed=1, chunk_size=100))
+    assert all(-55 <= lat <= 72 and 0 <= threshold <= 9 for _, _, lat, _, _, threshold in rows)
+
+
+def test_benchmark_report(tmp_path):
+    db_path = db.DB_PATH
+    report = alert_pipeline.benchmark([500], ["extreme"], repeat=2, data_dir=str(tmp_path))
+
+    assert db.DB_PATH == db_path
+    (result,) = json.loads(json.dumps(report))["results"]
+    assert (result["scenario"], result["subscribers"], result["runs"]) == ("extreme", 500, 2)
+    assert set(result["stages"]) == set(alert_pipeline.STAGES)
+    assert result["total"] > 0
+    # Every run starts from the same database, so alerts written back by one do not suppress the next
+    assert 0 < result["counts"]["delivered"] == result["counts"]["alerted"] <= result["counts"]["candidates"]
+
+
+def test_replay_benchmark_report():
+    report = replay.benchmark(days=2, subscribers=300)
+
+    results = report["results"]
+    assert results["snapshots"] == 2 * replay.DAY_STEPS
+    assert 0 < results["subscriptions_alerted"] <= 300
+    assert results["seconds"]["total"] > 0
+
+
+def test_parallel_sweep_benchmark_report():
+    report = parallel_sweep.benchmark(subscribers=2000, processes=[2], repeat=1)
+
+    results = report["results"]
+    assert report["metadata"]["cpu_count"] == os.cpu_count()
+    assert results["single"]["alerts"] > 0
+    assert results["processes_2"]["seconds"] > 0
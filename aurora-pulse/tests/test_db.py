@@ -15,6 +15,7 @@ def setup_db(monkeypatch):
     db.init_db()
     yield
     # Cleanup
+    db.close_connections()
     os.remove(TEST_DB)
 
 
@@ -40,3 +41,46 @@ def test_update_last_alert(setup_db):
 
     updated_subs = db.get_all_subscriptions()
     assert updated_subs[0].last_alert_sent.isoformat() == now.isoformat()
+
+
+def test_bulk_update_last_alert(setup_db):
+    for i in range(3):
+        db.save_subscription(f"{i}@example.com", "TestUser", 12.3, 45.6 + i, "TestCity", 5)
+
+    now = datetime.now()
+    db.bulk_update_last_alert_sent([1, 3], now)
+    db.bulk_update_last_alert_sent([], now)
+
+    sent = [sub.last_alert_sent for sub in db.get_all_subscriptions()]
+    assert sent == [now, None, now]
+
+
+def test_connection_is_reused_in_wal_mode(setup_db):
+    store = db.get_store()
+    assert isinstance(store, db.SQLiteStore) and store.path == TEST_DB
+    conn = store.connection()
+    assert store.connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(subscriptions)")}
+    assert "uq_subscriptions_user_cell" in indexes
+
+
+def test_get_subscriptions_for_user(setup_db):
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    db.save_subscription("b@example.com", "B", 51.5, -0.1, "London", 7)
+    db.save_subscription("a@example.com", "A", 69.6, 18.9, "Tromso", 5)
+
+    subs = db.get_subscriptions_for_user("a@example.com")
+    assert [sub.city for sub in subs] == ["Reykjavik", "Tromso"]
+    assert db.get_subscriptions_for_user("nobody@example.com") == []
+
+
+def test_iter_subscriptions_in_batches(setup_db):
+    for i in range(7):
+        db.save_subscription(f"{i}@example.com", "TestUser", 12.3, 45.6 + i, "TestCity", 5)
+
+    chunks = list(db.iter_subscriptions(batch_size=3, after_id=1))
+    assert [chunk["id"].tolist() for chunk in chunks] == [[2, 3, 4], [5, 6, 7]]
+    assert all(chunk.dtype == db.SUBSCRIPTION_DTYPE for chunk in chunks)
+    assert list(db.iter_subscriptions(batch_size=3, active_tiles={})) == []
@@ -0,0 +1,37 @@
+from email import message_from_bytes, policy
+
+import pytest
+from src.backend import email_template
+from src.backend.notifier import build_alert_email, build_alert_message
+
+
+@pytest.mark.parametrize(
+    "name, city, aurora_value",
+    [("Ann", "Reykjavik", 7), ("Zoë", "Tromsø", 6.5), ("B" * 120, "São Paulo " * 12, 3)],
+)
+def test_compiled_alert_matches_the_mime_message(name, city, aurora_value):
+    msg = build_alert_message("alerts@example.com", "ann@example.com", name, city, aurora_value)
+    parsed = message_from_bytes(msg.data, policy=policy.default)
+    subject, html_body, text_body = build_alert_email(name, city, aurora_value)
+
+    assert (msg.sender, msg.recipient) == ("alerts@example.com", "ann@example.com")
+    assert (parsed["From"], parsed["To"], parsed["Subject"]) == ("alerts@example.com", "ann@example.com", subject)
+    text, html = parsed.iter_parts()
+    assert text.get_content().replace("\r\n", "\n") == text_body
+    assert html.get_content().replace("\r\n", "\n") == html_body
+    # Wire-ready: CRLF line endings only, within the recommended line length
+    assert b"\n" not in msg.data.replace(b"\r\n", b"")
+    assert max(len(line) for line in msg.data.split(b"\r\n")) <= 78
+
+
+def test_shared_lines_are_rendered_once():
+    template = email_template.CompiledTemplate("Hi {name},\nstatic\n{city} at {kp}\n{city}", per_recipient=("name",))
+    email_template._render_line.cache_clear()
+
+    assert template.render(name="Ann", city="Oslo", kp=5) == b"Hi Ann,\r\nstatic\r\nOslo at 5\r\nOslo"
+    template.render(name="Bob", city="Oslo", kp=5)
+    template.render(name="Cy", city="Oslo", kp=6)
+
+    # The name line is never memoized; the city lines are rendered once per (city, kp) and once per city
+    info = email_template._render_line.cache_info()
+    assert (info.misses, info.hits) == (3, 3)
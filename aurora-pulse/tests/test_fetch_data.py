@@ -1,5 +1,9 @@
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
 
 import pytest
@@ -26,3 +30,102 @@ def sample_data():
 def test_load_aurora_points(sample_data):
     points = fetch_data.load_aurora_points()
     assert len(points) == 65160  # Total points in sample data
+
+
+class StubNoaaHandler(BaseHTTPRequestHandler):
+    """Serves a fixed OVATION payload with an ETag, answering 304 to matching conditional requests."""
+
+    payload = None
+    etag = '"v1"'
+    delay = 0.0
+    requests_seen = []
+
+    def do_GET(self):
+        type(self).requests_seen.append(dict(self.headers))
+        time.sleep(self.delay)
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(self.payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_payload(forecast_time, value):
+    return {
+        "Forecast Time": forecast_time,
+        "coordinates": [[lon, lat, value if lat == 65 else 0] for lon in range(360) for lat in range(-90, 91)],
+    }
+
+
+@pytest.fixture
+def noaa_stub():
+    StubNoaaHandler.payload = make_payload("2025-01-01T00:30:00Z", 4)
+    StubNoaaHandler.etag = '"v1"'
+    StubNoaaHandler.delay = 0.0
+    StubNoaaHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubNoaaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/ovation.json"
+    server.shutdown()
+    server.server_close()
+
+
+def test_snapshot_manager_revalidates_with_etag(noaa_stub, tmp_path):
+    cache_file = str(tmp_path / "aurora_data.bin")
+    archive_dir = str(tmp_path / "archive")
+    manager = fetch_data.SnapshotManager(
+        url=noaa_stub, cache_file=cache_file, revalidate_after=0, archive_dir=archive_dir
+    )
+
+    grid = manager.get()
+    assert grid.intensity_at(65, 20) == 4
+    assert grid.forecast_time == "2025-01-01T00:30:00Z"
+    assert os.path.getsize(cache_file) < 66_000
+
+    # Unchanged upstream: a cheap 304 keeps the same snapshot object
+    assert manager.get() is grid
+    assert StubNoaaHandler.requests_seen[-1]["If-None-Match"] == '"v1"'
+
+    # New product with the same forecast time is not re-parsed into a new snapshot
+    StubNoaaHandler.etag = '"v2"'
+    assert manager.get() is grid
+
+    # New forecast time replaces the snapshot
+    StubNoaaHandler.etag = '"v3"'
+    StubNoaaHandler.payload = make_payload("2025-01-01T00:35:00Z", 9)
+    assert manager.get().intensity_at(65, 20) == 9
+    assert len(StubNoaaHandler.requests_seen) == 4
+
+    # Each distinct snapshot was archived once
+    times, grids = fetch_data.SnapshotArchive(archive_dir).read_range()
+    assert times.tolist() == [1735691400, 1735691700]
+    assert grids[:, 90 + 65, 20].tolist() == [4, 9]
+
+
+def test_snapshot_manager_single_flight(noaa_stub, tmp_path):
+    StubNoaaHandler.delay = 0.3
+    manager = fetch_data.SnapshotManager(url=noaa_stub, cache_file=str(tmp_path / "aurora_data.bin"), archive_dir=None)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        grids = list(pool.map(lambda _: manager.get(), range(8)))
+
+    assert len(StubNoaaHandler.requests_seen) == 1
+    assert all(grid is grids[0] for grid in grids)
+
+
+def test_snapshot_manager_falls_back_to_cache_file(tmp_path):
+    cache_file = str(tmp_path / "aurora_data.bin")
+    fetch_data.OvationGrid.from_payload(make_payload("2025-01-01T00:30:00Z", 4)).save(cache_file)
+    manager = fetch_data.SnapshotManager(url="http://127.0.0.1:9/unreachable", cache_file=cache_file, archive_dir=None)
+
+    assert manager.get().intensity_at(65, 20) == 4
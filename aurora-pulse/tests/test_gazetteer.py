@@ -0,0 +1,93 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from src.backend import gazetteer
+from src.backend.config import GAZETTEER_FILE
+from src.backend.gazetteer import UNKNOWN_LOCATION, Gazetteer, city_from_address, reverse_geocode_city
+from src.backend.geocode_cache import SQLiteGeocodeCache
+
+
+def make_gazetteer():
+    return Gazetteer(
+        name=["Reykjavík", "Tromsø", "Paris", "Paris", "London"],
+        ascii_name=["Reykjavik", "Tromso", "Paris", "Paris", "London"],
+        admin=["Höfuðborgarsvæði", "Troms", "Île-de-France", "Texas", "England"],
+        country=["Iceland", "Norway", "France", "United States", "United Kingdom"],
+        lat=[64.1467, 69.6494, 48.8567, 33.6688, 51.5072],
+        lon=[-21.94, 18.9542, 2.3522, -95.5452, -0.1275],
+        population=[135688, 41915, 11060000, 24847, 11262000],
+    )
+
+
+@pytest.fixture
+def stub_gazetteer(monkeypatch):
+    monkeypatch.setattr(gazetteer, "_gazetteer", make_gazetteer())
+
+
+def test_nearest_place_on_the_sphere():
+    places = make_gazetteer()
+    assert places.nearest(64.2, -21.7).name == "Reykjavík"
+    assert places.nearest(69.6, 18.9).name == "Tromsø"
+    assert places.nearest(0, -140) is None
+    assert places.nearest(0, -140, max_distance_km=20_000) is not None
+
+
+def test_search_prefix_trigram_and_country():
+    places = make_gazetteer()
+    assert [p.name for p in places.search("tromso")] == ["Tromsø"]
+    assert [p.name for p in places.search("REYKJ")] == ["Reykjavík"]
+    assert [p.country for p in places.search("Paris")] == ["France", "United States"]
+    assert [p.country for p in places.search("paris, united")] == ["United States"]
+    assert [p.name for p in places.search("Londn")] == ["London"]
+    assert places.search("xqzv") == []
+
+
+def test_city_fallback_order():
+    assert city_from_address({"village": "Vík", "county": "Mýrdalshreppur"}) == "Vík"
+    assert city_from_address({"county": "Mýrdalshreppur"}) == "Mýrdalshreppur"
+    assert city_from_address({}) == UNKNOWN_LOCATION
+
+
+def test_reverse_geocode_uses_network_only_as_fallback(stub_gazetteer, mocker):
+    location = SimpleNamespace(raw={"address": {"town": "Nowhere Bay", "county": "Far County"}})
+    fallback = mocker.Mock(return_value=location)
+
+    assert reverse_geocode_city(64.15, -21.95, fallback=fallback) == "Reykjavík"
+    fallback.assert_not_called()
+
+    assert reverse_geocode_city(0, -140, fallback=fallback) == "Nowhere Bay"
+    assert reverse_geocode_city(0, -140) == UNKNOWN_LOCATION
+
+
+def test_reverse_geocode_fallback_is_cached(stub_gazetteer, mocker, tmp_path):
+    location = SimpleNamespace(raw={"address": {"county": "Far County"}})
+    fallback = mocker.Mock(return_value=location)
+    cache = SQLiteGeocodeCache(str(tmp_path / "geocode_cache.db"))
+
+    assert reverse_geocode_city(0.001, -140.001, fallback=fallback, cache=cache) == "Far County"
+    assert reverse_geocode_city(0.002, -139.998, fallback=fallback, cache=cache) == "Far County"
+    assert fallback.call_count == 1
+    cache.close()
+
+
+def test_reverse_geocode_fallback_failures_are_not_cached(stub_gazetteer, mocker, tmp_path):
+    location = SimpleNamespace(raw={"address": {"county": "Far County"}})
+    fallback = mocker.Mock(side_effect=[TimeoutError("Nominatim is down"), location])
+    cache = SQLiteGeocodeCache(str(tmp_path / "geocode_cache.db"))
+
+    assert reverse_geocode_city(0.001, -140.001, fallback=fallback, cache=cache) == UNKNOWN_LOCATION
+    assert reverse_geocode_city(0.001, -140.001, fallback=fallback, cache=cache) == "Far County"
+    cache.close()
+
+
+def test_bundled_gazetteer_roundtrip(tmp_path):
+    pytest.importorskip("openpyxl")
+    cache = str(tmp_path / "gazetteer.npz")
+    parsed = Gazetteer.load(GAZETTEER_FILE, cache=cache)
+    assert os.path.exists(cache)
+
+    cached = Gazetteer.load(GAZETTEER_FILE, cache=cache)
+    assert len(cached) == len(parsed) > 40_000
+    assert cached.nearest(64.14, -21.94).name == "Reykjavík"
+    assert cached.search("Fairbanks", limit=1)[0].country == "United States"
@@ -0,0 +1,84 @@
+import fakeredis
+import pytest
+from src.backend.geocode_cache import MISSING, RedisGeocodeCache, SQLiteGeocodeCache, coordinate_key, name_key
+
+
+@pytest.fixture(params=["redis", "sqlite"])
+def make_cache(request, tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        if request.param == "redis":
+            cache = RedisGeocodeCache(fakeredis.FakeRedis(), **kwargs)
+        else:
+            cache = SQLiteGeocodeCache(str(tmp_path / "geocode_cache.db"), **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        if isinstance(cache, SQLiteGeocodeCache):
+            cache.close()
+
+
+def test_keys_quantize_coordinates_and_names():
+    assert coordinate_key(64.1412, -21.9434) == coordinate_key(64.1389, 338.0551) == "reverse:64.14,-21.94"
+    assert coordinate_key(64.1412, -21.9434, precision=3) == "reverse:64.141,-21.943"
+    assert name_key("  Nowhere   Bay ") == name_key("nowhere bay")
+
+
+def test_get_or_compute_caches_results_and_counts_hits(make_cache, mocker):
+    cache = make_cache()
+    compute = mocker.Mock(side_effect=["Nowhere Bay", None])
+
+    assert cache.get_or_compute("a", compute) == "Nowhere Bay"
+    assert cache.get_or_compute("a", compute) == "Nowhere Bay"
+    # "Not found" is cached too
+    assert cache.get_or_compute("b", compute) is None
+    assert cache.get_or_compute("b", compute) is None
+
+    assert compute.call_count == 2
+    assert cache.stats() == {"hits": 2, "misses": 2, "hit_rate": 0.5}
+
+
+def test_least_recently_used_entries_are_evicted(make_cache, mocker):
+    mocker.patch("src.backend.geocode_cache.time.time", side_effect=range(1000, 2000))
+    cache = make_cache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_expired_redis_entries_leave_the_lru_set(mocker):
+    clock = mocker.patch("src.backend.geocode_cache.time.time", return_value=1000)
+    cache = RedisGeocodeCache(fakeredis.FakeRedis(), ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.connection.delete("aurora:geocode:a", "aurora:geocode:b")  # as Redis expires them
+
+    # A miss drops its member, and the next write drops every member older than the TTL
+    assert cache.get("a") is MISSING
+    assert cache.connection.zcard("aurora:geocode:lru") == 1
+    clock.return_value = 1061
+    cache.set("c", 3)
+    assert cache.connection.zcard("aurora:geocode:lru") == 1
+    cache.set("d", 4)
+    assert cache.connection.zrange("aurora:geocode:lru", 0, -1) == [b"c", b"d"]
+    assert (cache.get("c"), cache.get("d")) == (3, 4)
+
+
+def test_entries_expire(tmp_path, mocker):
+    redis_cache = RedisGeocodeCache(fakeredis.FakeRedis(), ttl=60)
+    redis_cache.set("a", 1)
+    assert 0 < redis_cache.connection.ttl("aurora:geocode:a") <= 60
+
+    clock = mocker.patch("src.backend.geocode_cache.time.time", return_value=1000)
+    sqlite_cache = SQLiteGeocodeCache(str(tmp_path / "geocode_cache.db"), ttl=60)
+    sqlite_cache.set("a", 1)
+    clock.return_value = 1061
+    assert sqlite_cache.get("a") is MISSING
+    sqlite_cache.close()
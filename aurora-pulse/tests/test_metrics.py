@@ -0,0 +1,85 @@
+import urllib.request
+
+import fakeredis
+import pytest
+from src.backend import alerts, db, metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # Metrics created by a test register themselves; keep them out of the process-wide registry
+    monkeypatch.setattr(metrics, "REGISTRY", list(metrics.REGISTRY))
+    monkeypatch.setattr(metrics, "_pushed", {})
+    return metrics.REGISTRY
+
+
+def test_prometheus_text_format(registry):
+    requests = metrics.Counter("test_requests_total", "Requests", ("code",))
+    latency = metrics.Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1))
+    requests.inc(code="200")
+    requests.inc(2, code="500")
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+
+    text = metrics.render_prometheus()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{code="500"} 2\n' in text
+    buckets = [line for line in text.splitlines() if line.startswith("test_latency_seconds_bucket")]
+    assert buckets == [
+        'test_latency_seconds_bucket{le="0.1"} 2',
+        'test_latency_seconds_bucket{le="1"} 3',
+        'test_latency_seconds_bucket{le="+Inf"} 4',
+    ]
+    assert "test_latency_seconds_sum 3.65\n" in text
+    assert "test_latency_seconds_count 4\n" in text
+
+    # Large counts and sums keep full precision
+    requests.inc(1_234_567, code="200")
+    latency.observe(2_000_000.125)
+    text = metrics.render_prometheus()
+    assert 'test_requests_total{code="200"} 1234568\n' in text
+    assert "test_latency_seconds_sum 2000003.775\n" in text
+
+    with pytest.raises(ValueError):
+        requests.inc(status="200")
+
+
+def test_workers_aggregate_in_redis(registry):
+    connection = fakeredis.FakeStrictRedis()
+    jobs = metrics.Counter("test_jobs_total", "Jobs")
+
+    jobs.inc(3)
+    metrics.push_metrics(connection)
+    jobs.inc()
+    metrics.push_metrics(connection)
+    metrics.push_metrics(connection)  # nothing new: nothing added
+    # Another worker process pushing its own count
+    connection.hincrbyfloat(metrics.METRICS_KEY, "test_jobs_total", 5)
+
+    assert metrics.load_metrics(connection)["test_jobs_total"] == 9
+
+    server = metrics.serve_metrics(0, connection)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            assert "test_jobs_total 9\n" in response.read().decode()
+    finally:
+        server.shutdown()
+
+
+def test_sweep_records_alerts(setup_db, mock_delivery, make_grid):
+    scanned = metrics.SUBSCRIPTIONS_SCANNED.value()
+    fired = metrics.ALERTS.value(result="fired")
+    suppressed = metrics.ALERTS.value(result="suppressed")
+    writes = metrics.DB_WRITE_SECONDS.count(operation="update_last_alert_sent")
+
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    db.save_subscription("b@example.com", "B", 69.6, 18.9, "Tromso", 3)
+    grid = make_grid((64, 338))
+    # Reykjavik fires, then is suppressed by MIN_ALERT_GAP; Tromso stays dark
+    alerts.notify_due(grid, db.get_subscription_columns())
+    alerts.notify_due(grid, db.get_subscription_columns())
+
+    assert metrics.SUBSCRIPTIONS_SCANNED.value() - scanned == 4
+    assert metrics.ALERTS.value(result="fired") - fired == 1
+    assert metrics.ALERTS.value(result="suppressed") - suppressed == 1
+    assert metrics.DB_WRITE_SECONDS.count(operation="update_last_alert_sent") - writes == 1
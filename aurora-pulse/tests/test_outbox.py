@@ -0,0 +1,205 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+
+import fakeredis
+import pytest
+from src.backend import db
+from src.backend.redis_handler import outbox
+from src.backend.redis_handler.outbox import OUTBOX_GROUP, OUTBOX_STREAM, Outbox, OutboxSender
+
+NOW = datetime(2025, 1, 1, 0, 30)
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def connection(server):
+    return fakeredis.FakeStrictRedis(server=server)
+
+
+def drain(server, send, **kwargs):
+    kwargs = {"confirm": db.bulk_update_last_alert_sent, "retry_base": 0, **kwargs}
+    sender = OutboxSender(fakeredis.aioredis.FakeRedis(server=server), send=send, **kwargs)
+    asyncio.run(sender.run(burst=True))
+
+
+def save_subscriptions(count):
+    return [db.save_subscription(f"{i}@example.com", "A", 64.1, -21.9 + i, "Reykjavik", 3) for i in range(count)]
+
+
+def intents(sub_ids):
+    return [(sub_id, f"{sub_id}@example.com", "A", "Reykjavik", 3) for sub_id in sub_ids]
+
+
+def publish(connection, sub_ids, snapshot_id="snapshot-1"):
+    box = Outbox(connection)
+    queued = box.publish(intents(sub_ids), snapshot_id, NOW)
+    box.release(snapshot_id)
+    return queued
+
+
+def test_retried_sweep_does_not_queue_twice(setup_db, server, connection):
+    sub_ids = save_subscriptions(3)
+    box = Outbox(connection)
+
+    assert box.publish(intents(sub_ids), "snapshot-1", NOW) == 3
+    assert box.publish(intents(sub_ids), "snapshot-1", NOW) == 0
+    # Nothing reaches the senders until the sweep releases the snapshot
+    assert connection.xlen(OUTBOX_STREAM) == 0
+    assert box.release("snapshot-1") == 3
+    assert box.release("snapshot-1") == 0
+    assert connection.xlen(OUTBOX_STREAM) == 3
+
+    sent = []
+    drain(server, lambda email, *_: sent.append(email) or True)
+
+    assert sorted(sent) == sorted(f"{sub_id}@example.com" for sub_id in sub_ids)
+    assert all(sub.last_alert_sent == NOW for sub in db.get_all_subscriptions())
+    # Confirmed entries are acknowledged and removed
+    assert connection.xlen(OUTBOX_STREAM) == 0
+    assert connection.xpending(OUTBOX_STREAM, OUTBOX_GROUP)["pending"] == 0
+
+
+def test_next_snapshot_within_gap_is_not_sent_again(setup_db, server, connection):
+    (sub_id,) = save_subscriptions(1)
+    sent = []
+
+    # Queued again by the next snapshot before the first alert was confirmed
+    publish(connection, [sub_id], "snapshot-1")
+    publish(connection, [sub_id], "snapshot-2")
+    drain(server, lambda email, *_: sent.append(email) or True)
+
+    assert sent == [f"{sub_id}@example.com"]
+    assert connection.xlen(OUTBOX_STREAM) == 0
+
+
+def test_user_alerts_are_sent_as_one_digest(setup_db, server, connection):
+    home, cabin, other = save_subscriptions(3)
+    box = Outbox(connection)
+    # One user's subscriptions, queued by two shards of the same sweep
+    box.publish([(home, "a@example.com", "A", "Reykjavik", 3)], "snapshot-1", NOW)
+    box.publish([(cabin, "a@example.com", "A", "Akureyri", 5), *intents([other])], "snapshot-1", NOW)
+    assert box.release("snapshot-1") == 2
+    # The user was alerted for their cabin by an earlier snapshot, within MIN_ALERT_GAP
+    connection.set(f"{OUTBOX_STREAM}:sent:{cabin}", "sent:a@example.com:snapshot-0")
+
+    sent = []
+    drain(server, lambda email, name, locations: sent.append((email, locations)) or True)
+
+    assert sorted(sent) == [(f"{other}@example.com", [("Reykjavik", 3)]), ("a@example.com", [("Reykjavik", 3)])]
+    alerted = {sub.id for sub in db.get_all_subscriptions() if sub.last_alert_sent}
+    assert alerted == {home, other}
+    assert connection.xlen(OUTBOX_STREAM) == 0
+
+
+def test_alert_queued_during_release_is_not_lost(setup_db, connection, mocker):
+    home, cabin = save_subscriptions(2)
+    box = Outbox(connection)
+    box.publish([(home, "a@example.com", "A", "Reykjavik", 3)], "snapshot-1", NOW)
+    late = [(cabin, "a@example.com", "A", "Akureyri", 5)]
+    pipeline = connection.pipeline
+
+    def pipeline_after_late_shard(*args, **kwargs):
+        # A late shard queues another alert for the user while the release is reading their digest
+        if late:
+            box.publish([late.pop()], "snapshot-1", NOW)
+        return pipeline(*args, **kwargs)
+
+    mocker.patch.object(connection, "pipeline", side_effect=pipeline_after_late_shard)
+    box.release("snapshot-1")
+    box.release("snapshot-1")
+
+    released = [item["sub_id"] for _, entry in connection.xrange(OUTBOX_STREAM) for item in json.loads(entry[b"items"])]
+    assert sorted(released) == [home, cabin]
+
+
+def test_failures_are_retried_then_dead_lettered(setup_db, server, connection, mocker):
+    good, flaky, broken = save_subscriptions(3)
+    publish(connection, [good, flaky, broken])
+    attempts = {}
+
+    def send(email, *_):
+        attempts[email] = attempts.get(email, 0) + 1
+        if email == f"{broken}@example.com":
+            return False
+        if email == f"{flaky}@example.com" and attempts[email] < 3:
+            raise OSError("connection reset")
+        return True
+
+    delay = mocker.spy(outbox, "retry_delay")
+    drain(server, send, max_attempts=4)
+
+    assert attempts == {f"{good}@example.com": 1, f"{flaky}@example.com": 3, f"{broken}@example.com": 4}
+    assert delay.call_count == 2 + 3
+    alerted = {sub.id for sub in db.get_all_subscriptions() if sub.last_alert_sent}
+    assert alerted == {good, flaky}
+
+    (dead,) = connection.xrange(f"{OUTBOX_STREAM}:dead")
+    assert [item["sub_id"] for item in json.loads(dead[1][b"items"])] == [broken]
+    # A later sweep may try the dead-lettered subscription again
+    assert connection.get(f"{OUTBOX_STREAM}:sent:{broken}") is None
+
+
+def test_unconfirmed_alert_is_confirmed_not_resent(setup_db, server, connection):
+    (sub_id,) = save_subscriptions(1)
+    publish(connection, [sub_id])
+
+    # A sender claimed and sent the alert, then crashed before confirming it
+    connection.xgroup_create(OUTBOX_STREAM, OUTBOX_GROUP, id="0")
+    connection.xreadgroup(OUTBOX_GROUP, "crashed", {OUTBOX_STREAM: ">"})
+    connection.set(f"{OUTBOX_STREAM}:sent:{sub_id}", f"sent:{sub_id}@example.com:snapshot-1")
+
+    sent = []
+    drain(server, lambda email, *_: sent.append(email) or True, claim_idle=0)
+
+    assert sent == []
+    assert db.get_all_subscriptions()[0].last_alert_sent == NOW
+    assert connection.xpending(OUTBOX_STREAM, OUTBOX_GROUP)["pending"] == 0
+
+
+def test_alert_interrupted_while_sending_is_sent(setup_db, server, connection):
+    (sub_id,) = save_subscriptions(1)
+    publish(connection, [sub_id])
+
+    # A sender claimed the alert and crashed before it knew whether the email went out
+    connection.xgroup_create(OUTBOX_STREAM, OUTBOX_GROUP, id="0")
+    connection.xreadgroup(OUTBOX_GROUP, "crashed", {OUTBOX_STREAM: ">"})
+    connection.set(f"{OUTBOX_STREAM}:sent:{sub_id}", f"pending:{sub_id}@example.com:snapshot-1")
+
+    sent = []
+    drain(server, lambda email, *_: sent.append(email) or True, claim_idle=0)
+
+    assert sent == [f"{sub_id}@example.com"]
+    assert connection.get(f"{OUTBOX_STREAM}:sent:{sub_id}") == f"sent:{sub_id}@example.com:snapshot-1".encode()
+
+
+def test_concurrency_is_bounded(setup_db, server, connection):
+    sub_ids = save_subscriptions(20)
+    publish(connection, sub_ids)
+    lock = threading.Lock()
+    active, peak, confirms = [0], [0], []
+
+    def send(*_):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        return True
+
+    def confirm(sub_ids, alert_time):
+        confirms.append(len(sub_ids))
+        db.bulk_update_last_alert_sent(sub_ids, alert_time)
+
+    drain(server, send, confirm=confirm, concurrency=3, confirm_batch=8)
+
+    assert 1 < peak[0] <= 3
+    # Delivered alerts are written back in batches, not one by one
+    assert sum(confirms) == 20 and len(confirms) <= 4
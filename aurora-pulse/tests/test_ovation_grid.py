@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from src.backend import nearest_neighbour as nn
+from src.backend.ovation_grid import GRID_SHAPE, OvationGrid, tile_index
+
+
+def make_payload(seed=0):
+    rng = np.random.default_rng(seed)
+    coords = [[lon, lat, int(rng.integers(0, 30))] for lon in range(360) for lat in range(-90, 91)]
+    return {"Observation Time": "2025-01-01T00:00:00Z", "Forecast Time": "2025-01-01T00:30:00Z", "coordinates": coords}
+
+
+def test_grid_matches_payload_cells():
+    payload = make_payload()
+    grid = OvationGrid.from_payload(payload)
+    assert grid.intensity.shape == GRID_SHAPE
+    assert grid.forecast_time == "2025-01-01T00:30:00Z"
+    for lon, lat, intensity in payload["coordinates"][::997]:
+        assert grid.intensity_at(lat, lon) == intensity
+
+
+def test_grid_agrees_with_balltree():
+    payload = make_payload(1)
+    grid = OvationGrid.from_payload(payload)
+    points = [[lat, lon, intensity] for lon, lat, intensity in payload["coordinates"]]
+    for lat, lon in [(64.2, -21.9), (-45.6, 170.4), (0.3, 0.2), (51.5, -0.1)]:
+        nearest, _ = nn.find_nearest_coord([lat, lon], points)
+        assert grid.intensity_at(lat, lon) == nearest[2]
+
+
+def test_longitude_wrap_and_poles():
+    intensity = np.zeros(GRID_SHAPE, dtype=int)
+    intensity[180, 0] = 7  # lat 90, lon 0
+    intensity[0, 359] = 3  # lat -90, lon 359
+    grid = OvationGrid(intensity)
+    assert grid.intensity_at(90, 359.7) == 7
+    assert grid.intensity_at(95, -0.2) == 7
+    assert grid.intensity_at(-90, -1) == 3
+    assert grid.intensity_at(np.array([90, -90]), np.array([360, 359])).tolist() == [7, 3]
+
+
+def test_irregular_coordinates_rejected_or_resampled():
+    payload = {"coordinates": [[0, 0, 5], [10, 10, 3], [-5, -5, 7]]}
+    with pytest.raises(ValueError):
+        OvationGrid.from_payload(payload)
+
+    grid = OvationGrid.from_payload(payload, resample=True)
+    for lat, lon in [(2, 2), (9, 11), (-4.6, 355.1)]:
+        nearest, _ = nn.find_nearest_coord([lat, lon], [[0, 0, 5], [10, 10, 3], [-5, -5, 7]])
+        assert grid.intensity_at(lat, lon) == nearest[2]
+
+
+def test_snapshot_file_roundtrip(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    grid = OvationGrid.from_payload(make_payload())
+    grid.save(path)
+
+    loaded = OvationGrid.load(path)
+    assert isinstance(loaded.intensity, np.memmap)
+    assert np.array_equal(loaded.intensity, grid.intensity)
+    assert loaded.observation_time == "2025-01-01T00:00:00Z"
+    assert loaded.forecast_time == "2025-01-01T00:30:00Z"
+    assert path.stat().st_size < 66_000
+    assert [p.name for p in tmp_path.iterdir()] == ["snapshot.bin"]
+
+
+def test_tile_max_matches_subscription_tiles():
+    intensity = np.zeros(GRID_SHAPE, dtype=int)
+    intensity[90 + 64, 338] = 9  # Reykjavik's cell
+    intensity[180, 5] = 4  # north pole row, padded tile
+    tile_max = OvationGrid(intensity).tile_max()
+    assert tile_max[tile_index(64.1, -21.9)] == 9
+    assert tile_max[tile_index(90, 5)] == 4
+    assert np.count_nonzero(tile_max) == 2
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+from src.backend import alerts, db, metrics
+from src.backend.ovation_grid import GRID_SHAPE, GRID_SIZE, OvationGrid
+from src.backend.parallel_sweep import ParallelEvaluator, close_evaluators, get_evaluator, sweep_parallel
+
+
+def make_subs(count, seed=0):
+    rng = np.random.default_rng(seed)
+    subs = np.zeros(count, dtype=db.SUBSCRIPTION_DTYPE)
+    subs["id"] = np.arange(1, count + 1)
+    subs["cell"] = rng.integers(0, GRID_SIZE, count)
+    subs["threshold"] = rng.integers(-1, 11, count)  # including invalid thresholds
+    subs["last_alert"] = rng.integers(0, 2000, count)
+    return subs
+
+
+def shared_blocks():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")} if os.path.isdir("/dev/shm") else set()
+
+
+def test_parallel_evaluation_matches_evaluate_alerts():
+    subs = make_subs(10_000)
+    grid = OvationGrid(np.random.default_rng(1).integers(0, 25, GRID_SHAPE, dtype=np.uint8))
+    expected, held = alerts.evaluate_due(grid.intensity_at_cells(subs["cell"]), subs, 3000, 1500)
+    fired = metrics.ALERTS.value(result="fired")
+    suppressed = metrics.ALERTS.value(result="suppressed")
+    blocks = shared_blocks()
+
+    with ParallelEvaluator(processes=2, min_slice=1000) as evaluator:
+        for _ in range(2):  # the pool is reused
+            alert_ids, held_ids = evaluator.evaluate(grid, subs, 3000, 1500)
+            assert (alert_ids.tolist(), held_ids.tolist()) == (expected.tolist(), held.tolist())
+
+    # Metrics of the slices are recorded by this process, and every shared block is gone again
+    assert metrics.ALERTS.value(result="fired") - fired == 2 * len(expected)
+    assert metrics.ALERTS.value(result="suppressed") > suppressed
+    assert shared_blocks() == blocks
+
+
+def test_loaded_subscriptions_are_not_copied_again(mocker):
+    subs = make_subs(10_000)
+    grid = OvationGrid(np.random.default_rng(1).integers(0, 25, GRID_SHAPE, dtype=np.uint8))
+    expected = alerts.evaluate_alerts(grid.intensity_at_cells(subs["cell"]), subs, 3000, 1500)
+    blocks = shared_blocks()
+
+    with ParallelEvaluator(processes=2, min_slice=1000) as evaluator:
+        loaded = evaluator.load([subs[:4000], subs[4000:]])
+        assert evaluator._subs.holds(loaded)
+        name = evaluator._subs.spec[0]
+        assert evaluator.evaluate(grid, loaded, 3000, 1500)[0].tolist() == expected.tolist()
+
+        # A smaller sweep reuses the block, a larger one replaces it
+        loaded = evaluator.load([subs[:5000]])
+        assert evaluator.evaluate(grid, loaded, 3000, 1500)[0].tolist() == expected[expected <= 5000].tolist()
+        assert evaluator._subs.spec[0] == name
+        loaded = evaluator.load([subs, subs])
+        assert evaluator._subs.spec[0] != name
+        del loaded
+    assert shared_blocks() == blocks
+
+
+def test_evaluator_is_kept_per_process():
+    evaluator = get_evaluator(2)
+    assert get_evaluator(2) is evaluator and get_evaluator(3) is not evaluator
+    close_evaluators()
+    assert get_evaluator(2) is not evaluator
+    close_evaluators()
+
+
+def test_small_sweeps_are_evaluated_in_process(mocker):
+    context = mocker.patch("src.backend.parallel_sweep._context")
+    subs = make_subs(100)
+    grid = OvationGrid(np.full(GRID_SHAPE, 20, dtype=np.uint8))
+
+    with ParallelEvaluator(processes=4) as evaluator:
+        assert len(evaluator.evaluate(grid, subs, 3000, 1500)[0])
+    context.assert_not_called()
+
+
+def test_sweep_parallel_notifies_due_subscriptions(setup_db, mock_delivery, make_grid):
+    for i in range(6):
+        db.save_subscription(f"{i}@example.com", "A", 64.1, -21.9 + i, "Reykjavik", 3 if i % 2 else 7)
+    grid = make_grid(*((64, lon) for lon in range(330, 350)))
+
+    result = sweep_parallel(grid, db.SweepState(), processes=2)
+
+    # Kp 7 subscriptions cannot fire at this intensity and are not even loaded
+    assert (result.scanned, result.alerted, result.delivered) == (3, 3, 3)
+    emails = sorted(email for email, *_ in mock_delivery.call_args.args[0])
+    assert emails == ["1@example.com", "3@example.com", "5@example.com"]
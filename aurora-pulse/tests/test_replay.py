@@ -0,0 +1,142 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from src.backend import alerts, db
+from src.backend.ovation_grid import GRID_SHAPE, OvationGrid, cell_id
+from src.backend.replay import AlertReplay, replay_archive
+from src.backend.snapshot_archive import SnapshotArchive
+from src.backend.storage import SUBSCRIPTION_DTYPE
+
+START = 1735689600  # 2025-01-01T00:00:00Z
+STEP = 5 * 60
+
+
+def make_subs(count, seed=0):
+    rng = np.random.default_rng(seed)
+    subs = np.zeros(count, dtype=SUBSCRIPTION_DTYPE)
+    subs["id"] = np.arange(1, count + 1)
+    subs["cell"] = cell_id(rng.uniform(55, 75, count), rng.uniform(-30, 30, count))
+    subs["threshold"] = rng.integers(-1, 11, count)  # including invalid thresholds
+    return subs
+
+
+def make_storm(steps, seed=0):
+    # A storm over the subscriptions' region that brightens, flickers and fades again
+    rng = np.random.default_rng(seed)
+    times = START + STEP * np.arange(steps)
+    grids = np.zeros((steps,) + GRID_SHAPE, dtype=np.uint8)
+    peak = 20 * np.sin(np.linspace(0, np.pi, steps))
+    grids[:, 90 + 55 : 90 + 76] = np.clip(peak[:, None, None] + rng.normal(0, 3, (steps, 21, 360)), 0, 255)
+    return times, grids
+
+
+def test_full_replay_matches_evaluate_alerts():
+    subs = make_subs(500)
+    times, grids = make_storm(60)
+
+    replay = AlertReplay(subs, min_gap=30 * 60, incremental=False)
+    replay.feed(times[:25], grids[:25])
+    replay.feed(times[25:], grids[25:])
+    result = replay.result()
+
+    live = subs.copy()
+    live["last_alert"] = -(10**12)
+    expected = []
+    for now, grid in zip(times, grids):
+        intensity = OvationGrid(grid).intensity_at_cells(live["cell"])
+        fired = alerts.evaluate_alerts(intensity, live, now, 30 * 60)
+        live["last_alert"][np.isin(live["id"], fired)] = now
+        expected.append(len(fired))
+
+    assert result.alerts.tolist() == expected
+    assert result.total > len(subs) // 2
+    assert result.suppressed.sum() > 0
+
+
+def test_incremental_replay_alerts_on_level_crossings():
+    subs = make_subs(1)
+    subs["cell"], subs["threshold"] = cell_id(65, 0), 5  # Kp 5 needs intensity 12
+    # Over the threshold for 3 hours, dark, then over it again
+    levels = [0] + [12] * 36 + [14] * 12 + [0] + [12]
+    times = START + STEP * np.arange(len(levels))
+    grids = np.zeros((len(levels),) + GRID_SHAPE, dtype=np.uint8)
+    grids[:, 90 + 65, 0] = levels
+
+    replay = AlertReplay(subs, min_gap=60 * 60)
+    replay.feed(times, grids)
+    result = replay.result()
+    # Crossing into Kp 5, then into Kp 6 more than an hour later, then again after going dark
+    assert result.timeline(1).tolist() == [times[1], times[37], times[50]]
+
+    full = AlertReplay(subs, min_gap=60 * 60, incremental=False)
+    full.feed(times, grids)
+    assert full.result().timeline(1).tolist() == [times[1], times[13], times[25], times[37], times[50]]
+
+
+def test_incremental_replay_matches_live_sweeps(setup_db, mock_delivery, make_grid, mocker):
+    # Kp 0 at (64, 338) flickers and then stays over its threshold past the minimum gap; Kp 3 at (66, 342) comes
+    # back within the gap and drops below its threshold before the gap is over
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 0)
+    db.save_subscription("b@example.com", "B", 65.7, -18.1, "Akureyri", 3)
+    levels = [(1, 6), (0, 0), (1, 6), (1, 6), (1, 9), (1, 0), (1, 0), (1, 6), (1, 6), (1, 6), (1, 6), (1, 6)]
+    times = START + 600 * np.arange(len(levels))
+    grids = np.stack(
+        [
+            make_grid((64, 338), value=a).intensity + make_grid((66, 342), value=b).intensity
+            for a, b in levels
+        ]
+    )
+
+    replay = AlertReplay(db.get_subscription_columns())
+    replay.feed(times, grids)
+    result = replay.result()
+
+    now = mocker.patch.object(alerts, "datetime").now
+    live = []
+    for t, grid in zip(times, grids):
+        now.return_value = datetime.fromtimestamp(int(t), tz=timezone.utc).replace(tzinfo=None)
+        live.append(alerts.run_alert_sweep(OvationGrid(grid, forecast_time=str(t))))
+
+    assert result.alerts.tolist() == live
+    assert live == [2, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0, 0]
+
+
+def test_timelines():
+    subs = make_subs(300)
+    times, grids = make_storm(40)
+    replay = AlertReplay(subs)
+    replay.feed(times, grids)
+    result = replay.result()
+
+    timelines = result.timelines()
+    counts = result.alert_counts()
+    assert sum(len(alert_times) for alert_times in timelines.values()) == result.total == counts.sum()
+    assert all(len(timelines.get(int(sub_id), ())) == count for sub_id, count in zip(subs["id"], counts))
+    # Invalid thresholds never fire
+    assert not counts[(subs["threshold"] < 0) | (subs["threshold"] > 9)].any()
+    for alert_times in timelines.values():
+        assert np.all(np.diff(alert_times) >= 60 * 60)
+
+
+def test_replay_archive(tmp_path):
+    subs = make_subs(200)
+    times, grids = make_storm(400)  # spans two archive days
+    archive = SnapshotArchive(str(tmp_path))
+    for t, grid in zip(times, grids):
+        forecast_time = datetime.fromtimestamp(t, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        archive.append(OvationGrid(grid, forecast_time=forecast_time))
+
+    replay = AlertReplay(subs)
+    replay.feed(times[10:350], grids[10:350])
+    expected = replay.result()
+    result = replay_archive(archive, start=int(times[10]), end=int(times[349]), subs=subs)
+
+    assert np.array_equal(result.times, expected.times)
+    assert np.array_equal(result.alerts, expected.alerts)
+    assert result.timelines().keys() == expected.timelines().keys()
+
+
+def test_thresholds_table_must_increase():
+    with pytest.raises(ValueError):
+        AlertReplay(make_subs(1), kp_to_ovation={0: 5, 1: 3})
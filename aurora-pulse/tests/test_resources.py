@@ -0,0 +1,35 @@
+import pytest
+from src.backend import db
+from src.frontend import resources
+
+
+@pytest.fixture
+def setup_db(setup_db):
+    # The shared database, with the app's cached resources cleared around each test
+    resources.get_subscription_store.clear()
+    resources.get_user_subscriptions.clear()
+    yield setup_db
+    resources.get_subscription_store.clear()
+
+
+def test_user_subscriptions_are_cached_until_changed(setup_db):
+    assert resources.get_user_subscriptions("a@example.com") == []
+
+    # Writes that bypass the app are not seen until the cache expires...
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    assert resources.get_user_subscriptions("a@example.com") == []
+
+    # ...but the app's own writes invalidate it
+    resources.save_subscription("a@example.com", "A", 69.6, 18.9, "Tromso", 5)
+    subs = resources.get_user_subscriptions("a@example.com")
+    assert [sub.city for sub in subs] == ["Reykjavik", "Tromso"]
+
+    resources.remove_subscription(subs[0])
+    assert [sub.city for sub in resources.get_user_subscriptions("a@example.com")] == ["Tromso"]
+
+
+def test_shared_resources_are_built_once():
+    assert resources.get_reverse_geocoder() is resources.get_reverse_geocoder()
+    # Nominatim failures must raise, or reverse_geocode_city would cache them
+    assert resources.get_reverse_geocoder().swallow_exceptions is False
+    assert resources.get_base_map() is resources.get_base_map()
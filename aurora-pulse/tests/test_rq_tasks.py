@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+
+import fakeredis
+import pytest
+from rq import Queue, SimpleWorker
+from src.backend import db
+from src.backend.redis_handler import rq_tasks, snapshots, sweep_scheduler
+from src.backend.redis_handler.outbox import OUTBOX_STREAM, OutboxSender
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def queue(server):
+    connection = fakeredis.FakeStrictRedis(server=server)
+    return Queue("aurora", connection=connection)
+
+
+@pytest.fixture
+def grid(make_grid):
+    # Storm over Reykjavik and Akureyri
+    return make_grid((64, 338), (66, 342), forecast_time="2025-01-01T00:30:00Z")
+
+
+def test_sharded_sweep(setup_db, server, queue, grid, mock_delivery, mocker):
+    fetch = mocker.patch.object(rq_tasks, "fetch_realtime_aurora_data", return_value=grid)
+    # One user with locations in the first and the last shard
+    db.save_subscription("m@example.com", "M", 64.1, -21.9, "Reykjavik", 3)
+    for i in range(10):
+        db.save_subscription(f"{i}@example.com", "A", 64.1, -21.9 + i / 100, "Reykjavik", 3 if i % 2 else 7)
+    db.save_subscription("m@example.com", "M", 65.7, -18.1, "Akureyri", 3)
+
+    queue.enqueue(rq_tasks.check_aurora_alerts, shards=4)
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+
+    # One NOAA fetch, four shards, every Kp 3 subscription queued exactly once and nothing sent by the sweep
+    assert fetch.call_count == 1
+    mock_delivery.assert_not_called()
+    summary = queue.connection.hgetall(rq_tasks.SWEEP_SUMMARY_KEY)
+    assert summary[b"snapshot_id"] == grid.snapshot_id.encode()
+    assert summary[b"shards"] == b"4"
+    assert summary[b"queued"] == b"7"
+    assert summary[b"digests"] == b"6"
+    assert summary[b"delivered"] == b"0"
+
+    # The outbox senders deliver them, one email per user
+    delivered = {}
+    sender = OutboxSender(
+        fakeredis.aioredis.FakeRedis(server=server),
+        send=lambda email, name, locations: delivered.setdefault(email, []).append(sorted(locations)) or True,
+        confirm=db.bulk_update_last_alert_sent,
+    )
+    asyncio.run(sender.run(burst=True))
+    assert sorted(delivered) == [f"{i}@example.com" for i in (1, 3, 5, 7, 9)] + ["m@example.com"]
+    assert delivered["m@example.com"] == [[("Akureyri", 3), ("Reykjavik", 3)]]
+    assert all(sub.last_alert_sent for sub in db.get_all_subscriptions() if sub.threshold == 3)
+
+    # The coordinator also rendered the app's map overlay for the snapshot
+    assert snapshots.load_latest_overlay(queue.connection)[0] == grid.snapshot_id
+
+    state = db.load_sweep_state()
+    assert state.high_water == 12 and state.forecast_time == "2025-01-01T00:30:00Z"
+
+
+def test_failed_shard_still_releases_alerts(setup_db, server, queue, grid, mocker):
+    mocker.patch.object(rq_tasks, "fetch_realtime_aurora_data", return_value=grid)
+    for i in range(4):
+        db.save_subscription(f"{i}@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    sweep = rq_tasks.sweep_subscriptions
+
+    def flaky_sweep(grid, state, after_id, max_id, outbox):
+        if after_id == 0:
+            raise OSError("database went away")
+        return sweep(grid, state, after_id=after_id, max_id=max_id, outbox=outbox)
+
+    mocker.patch.object(rq_tasks, "sweep_subscriptions", side_effect=flaky_sweep)
+    queue.enqueue(rq_tasks.check_aurora_alerts, shards=2)
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+
+    # The healthy shard's alerts go out, but the sweep is not recorded as the next incremental baseline
+    summary = queue.connection.hgetall(rq_tasks.SWEEP_SUMMARY_KEY)
+    assert summary[b"failed_shards"] == b"1"
+    assert summary[b"digests"] == b"2"
+    assert queue.connection.xlen(OUTBOX_STREAM) == 2
+    assert db.load_sweep_state().high_water == 0
+
+
+def test_single_node_parallel_sweep(setup_db, queue, grid, mocker):
+    mocker.patch.object(rq_tasks, "fetch_realtime_aurora_data", return_value=grid)
+    mocker.patch.object(rq_tasks.os, "cpu_count", return_value=rq_tasks.SWEEP_MIN_CPUS)
+    for i in range(4):
+        db.save_subscription(f"{i}@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+
+    queue.enqueue(rq_tasks.check_aurora_alerts, processes=2)
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+
+    # No shard jobs: the coordinator swept, queued one digest per user and recorded the baseline itself
+    summary = queue.connection.hgetall(rq_tasks.SWEEP_SUMMARY_KEY)
+    assert (summary[b"shards"], summary[b"queued"], summary[b"digests"]) == (b"1", b"4", b"4")
+    assert queue.connection.xlen(OUTBOX_STREAM) == 4
+    assert db.load_sweep_state().high_water == 4
+    assert queue.connection.get(rq_tasks.SWEEP_LOCK_KEY) is None
+
+
+def test_parallel_sweep_needs_enough_cores(setup_db, queue, grid, mocker):
+    mocker.patch.object(rq_tasks, "fetch_realtime_aurora_data", return_value=grid)
+    mocker.patch.object(rq_tasks.os, "cpu_count", return_value=rq_tasks.SWEEP_MIN_CPUS - 1)
+    parallel = mocker.patch.object(rq_tasks, "sweep_parallel")
+    db.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+
+    queue.enqueue(rq_tasks.check_aurora_alerts, shards=2, processes=8)
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+
+    parallel.assert_not_called()
+    assert queue.connection.hget(rq_tasks.SWEEP_SUMMARY_KEY, "shards") == b"1"
+
+
+def test_enqueue_sweep_coalesces(setup_db, queue, grid, mocker):
+    mocker.patch.object(rq_tasks, "fetch_realtime_aurora_data", return_value=grid)
+
+    first = rq_tasks.enqueue_sweep(queue)
+    assert first is not None
+    assert rq_tasks.enqueue_sweep(queue) is None  # already queued
+    assert queue.count == 1
+
+    # Once the sweep finished the lock is gone, but the window's job ID still coalesces
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+    assert queue.connection.get(rq_tasks.SWEEP_LOCK_KEY) is None
+    assert rq_tasks.enqueue_sweep(queue) is None
+
+    mocker.patch.object(rq_tasks.time, "time", return_value=time.time() + 2 * rq_tasks.SWEEP_WINDOW)
+    assert rq_tasks.enqueue_sweep(queue).id != first.id
+
+
+def test_failed_coordinator_releases_the_sweep_lock(setup_db, queue, grid, mocker):
+    mocker.patch.object(rq_tasks, "fetch_realtime_aurora_data", return_value=grid)
+    mocker.patch.object(rq_tasks, "get_max_subscription_id", side_effect=RuntimeError("database is locked"))
+
+    job = rq_tasks.enqueue_sweep(queue)
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+
+    assert job.get_status() == "failed"
+    assert queue.connection.get(rq_tasks.SWEEP_LOCK_KEY) is None
+    # The next window's sweep is enqueued without waiting for the lock to expire
+    mocker.patch.object(rq_tasks.time, "time", return_value=time.time() + rq_tasks.SWEEP_WINDOW)
+    assert rq_tasks.enqueue_sweep(queue) is not None
+
+
+def test_scheduler_enqueues_one_sweep_per_window(setup_db, queue, grid, mocker):
+    mocker.patch.object(rq_tasks, "fetch_realtime_aurora_data", return_value=grid)
+    stop = threading.Event()
+    ticks = []
+
+    def wait(tick):
+        ticks.append(tick)
+        if len(ticks) % 4 == 0:
+            stop.set()
+
+    mocker.patch.object(stop, "wait", side_effect=wait)
+
+    # The first tick enqueues the window's sweep, later ones (also after it ran) are coalesced
+    sweep_scheduler.run(queue, tick=5, stop=stop)
+    assert ticks == [5, 5, 5, 5] and queue.count == 1
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+    stop.clear()
+    sweep_scheduler.run(queue, tick=5, stop=stop)
+    assert queue.count == 0
+    assert queue.connection.hget(rq_tasks.SWEEP_SUMMARY_KEY, "snapshot_id") == grid.snapshot_id.encode()
+
+
+def test_subscription_check(setup_db, queue, grid, mock_delivery, mocker):
+    mocker.patch.object(rq_tasks, "fetch_realtime_aurora_data", return_value=grid)
+    db.save_subscription("a@example.com", "A", 10.0, 10.0, "Elsewhere", 0)
+    sub_id = db.save_subscription("b@example.com", "B", 64.1, -21.9, "Reykjavik", 3)
+
+    job = rq_tasks.enqueue_subscription_check(queue, sub_id)
+    assert rq_tasks.enqueue_subscription_check(queue, sub_id).id == job.id
+    assert queue.count == 1
+
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+    mock_delivery.assert_called_once_with([("b@example.com", "B", [("Reykjavik", 3)])])
@@ -0,0 +1,119 @@
+import socket
+import time
+from email.message import EmailMessage
+
+import pytest
+from aiosmtpd.controller import Controller
+from src.backend.smtp_pool import RateLimiter, SmtpPool, WireMessage
+
+
+class RecordingHandler:
+    """Accepts every message except those for refused@example.com, remembering which connection carried it."""
+
+    def __init__(self):
+        self.delivered = []
+        self.contents = []
+        self.connections = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address == "refused@example.com":
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.connections.add(id(session))
+        self.delivered.extend(envelope.rcpt_tos)
+        self.contents.append(envelope.content)
+        return "250 Message accepted for delivery"
+
+
+@pytest.fixture
+def smtp_server():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield handler, "127.0.0.1", port
+    controller.stop()
+
+
+def make_message(to):
+    msg = EmailMessage()
+    msg["From"] = "alerts@example.com"
+    msg["To"] = to
+    msg["Subject"] = "Aurora Alert"
+    msg.set_content("Look north!")
+    return msg
+
+
+def test_send_many_reuses_sessions(smtp_server):
+    handler, host, port = smtp_server
+    pool = SmtpPool(host, port, starttls=False, size=2, rate_limit=None)
+
+    recipients = [f"user{i}@example.com" for i in range(20)]
+    results = pool.send_many([make_message(to) for to in recipients])
+    pool.close()
+
+    assert results == [True] * 20
+    assert sorted(handler.delivered) == sorted(recipients)
+    assert len(handler.connections) <= 2
+
+
+def test_send_many_reports_per_recipient_failures(smtp_server):
+    handler, host, port = smtp_server
+    pool = SmtpPool(host, port, starttls=False, size=2, rate_limit=None)
+
+    results = pool.send_many([make_message(to) for to in ["a@example.com", "refused@example.com", "b@example.com"]])
+    pool.close()
+
+    assert results == [True, False, True]
+    assert sorted(handler.delivered) == ["a@example.com", "b@example.com"]
+
+
+def test_wire_messages_are_sent_as_is(smtp_server):
+    handler, host, port = smtp_server
+    pool = SmtpPool(host, port, starttls=False, size=1, rate_limit=None)
+    data = make_message("a@example.com").as_bytes().replace(b"\n", b"\r\n")
+
+    messages = [WireMessage("alerts@example.com", to, data) for to in ["a@example.com", "refused@example.com"]]
+    results = pool.send_many(messages)
+    pool.close()
+
+    assert results == [True, False]
+    assert handler.delivered == ["a@example.com"]
+    assert handler.contents == [data]
+
+
+def test_sessions_are_recycled(smtp_server):
+    handler, host, port = smtp_server
+    pool = SmtpPool(host, port, starttls=False, size=1, max_messages_per_session=2, rate_limit=None)
+
+    assert all(pool.send(make_message(f"user{i}@example.com")) for i in range(5))
+    pool.close()
+    assert len(handler.connections) == 3
+
+
+def test_rate_limiter_spaces_acquisitions():
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_unexpected_errors_fail_only_their_message(smtp_server):
+    handler, host, port = smtp_server
+    pool = SmtpPool(host, port, starttls=False, size=1, rate_limit=None)
+    data = make_message("a@example.com").as_bytes().replace(b"\n", b"\r\n")
+
+    # smtplib cannot encode the non-ASCII address (UnicodeEncodeError) after MAIL FROM was already sent
+    recipients = ["a@example.com", "jökull@example.com", "b@example.com"]
+    results = pool.send_many([WireMessage("alerts@example.com", to, data) for to in recipients])
+    pool.close()
+
+    assert results == [True, False, True]
+    assert handler.delivered == ["a@example.com", "b@example.com"]
+    assert len(handler.connections) == 2  # the session left mid-transaction was not reused
@@ -0,0 +1,76 @@
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from src.backend.ovation_grid import GRID_SHAPE, OvationGrid
+from src.backend.snapshot_archive import ARCHIVE_INDEX, SnapshotArchive
+
+# 2025-01-01T23:50:00Z, five minutes apart, crossing into the next day's files
+START = 1735775400
+
+
+def make_grid(i):
+    rng = np.random.default_rng(i)
+    intensity = np.zeros(GRID_SHAPE, dtype=np.uint8)
+    intensity[140:165] = rng.integers(0, 20, (25, 360))
+    intensity[100, 200] = i
+    forecast_time = datetime.fromtimestamp(START + 300 * i, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return OvationGrid(intensity, observation_time="2025-01-01T23:45:00Z", forecast_time=forecast_time)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = SnapshotArchive(str(tmp_path))
+    # Out of order, and with a duplicate
+    for i in [0, 2, 1, 3, 4, 2]:
+        archive.append(make_grid(i))
+    return archive
+
+
+def test_distinct_snapshots_are_archived_compressed(archive, tmp_path):
+    assert not archive.append(make_grid(3))
+    assert not archive.append(OvationGrid(np.zeros(GRID_SHAPE, dtype=np.uint8)))
+
+    assert sorted(os.listdir(tmp_path)) == ["20250101.grids", "20250101.index", "20250102.grids", "20250102.index"]
+    assert archive.times().tolist() == [START + 300 * i for i in range(5)]
+    size = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    assert size < 5 * 15_000
+
+
+def test_range_reads(archive):
+    times, grids = archive.read_range(START + 300, datetime(2025, 1, 2, 0, 5))
+
+    assert times.tolist() == [START + 300, START + 600, START + 900]
+    assert grids.shape == (3,) + GRID_SHAPE
+    for i, grid in enumerate(grids, start=1):
+        assert np.array_equal(grid, make_grid(i).intensity)
+    assert archive.read_range(START + 301, START + 599)[1].shape == (0,) + GRID_SHAPE
+
+    grid = archive.load(START + 600)
+    assert np.array_equal(grid.intensity, make_grid(2).intensity)
+    assert (grid.observation_time, grid.forecast_time) == ("2025-01-01T23:45:00Z", "2025-01-02T00:00:00Z")
+    assert archive.load(START + 1) is None
+
+
+def test_cell_series(archive):
+    times, values = archive.series(10, 200, start=START + 300)
+    assert times.tolist() == [START + 300 * i for i in range(1, 5)]
+    assert values.tolist() == [1, 2, 3, 4]
+
+    _, values = archive.series([10, 60], [200, -10])
+    expected = [[i, make_grid(i).intensity[150, 350]] for i in range(5)]
+    assert values.tolist() == expected
+
+
+def test_interrupted_append_is_ignored(archive, tmp_path):
+    # A crash left a partial index record and unindexed bytes behind
+    with open(tmp_path / "20250102.index", "ab") as f:
+        f.write(b"\x01" * (ARCHIVE_INDEX.itemsize // 2))
+    with open(tmp_path / "20250102.grids", "ab") as f:
+        f.write(b"torn")
+
+    assert len(archive.times()) == 5
+    assert archive.append(make_grid(5))
+    _, values = archive.series(10, 200)
+    assert values.tolist() == [0, 1, 2, 3, 4, 5]
@@ -0,0 +1,132 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pytest
+from src.backend.ovation_grid import GRID_SHAPE, cell_id, tile_index
+from src.backend.storage import SQLiteStore, SweepState, to_epoch
+
+TEST_DB = "test_aurora_storage.db"
+# PostgreSQL tests run against a throwaway database, e.g. TEST_DATABASE_URL=postgresql://postgres@localhost/aurora_test
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def store(request):
+    if request.param == "sqlite":
+        store = SQLiteStore(TEST_DB)
+        store.init_schema()
+        yield store
+        store.close()
+        os.remove(TEST_DB)
+        return
+
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    pytest.importorskip("psycopg_pool")
+    from src.backend.storage.postgres_store import PostgresStore
+
+    store = PostgresStore(TEST_DATABASE_URL, max_size=4)
+    store.init_schema()
+    yield store
+    with store.pool.connection() as conn:
+        conn.execute("DROP TABLE subscriptions, sweep_state")
+    store.close()
+
+
+def test_save_update_and_remove(store):
+    sub_id = store.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    assert store.save_subscription("a@example.com", "Anna", 64.1, -21.9, "Reykjavik", 5) == sub_id
+    other_id = store.save_subscription("b@example.com", "B", 51.5, -0.1, "London", 7)
+
+    subs = store.get_subscriptions_for_user("a@example.com")
+    assert [(sub.id, sub.user_name, sub.threshold) for sub in subs] == [(sub_id, "Anna", 5)]
+    assert len(store.get_all_subscriptions()) == 2
+
+    assert store.remove_subscription(sub_id).city == "Reykjavik"
+    assert store.remove_subscription(sub_id) is None
+    assert store.get_max_subscription_id() == other_id
+
+
+def test_duplicates_are_detected_by_grid_cell(store):
+    sub_id = store.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    # A slightly different click on the same place updates the subscription instead of adding one
+    assert store.save_subscription("a@example.com", "A", 64.13, -21.94, "Reykjavík", 5) == sub_id
+    assert store.save_subscription("a@example.com", "A", 65.7, -18.1, "Akureyri", 3) != sub_id
+
+    sub, _ = store.get_subscriptions_for_user("a@example.com")
+    assert (sub.latitude, sub.longitude, sub.city, sub.threshold) == (64.13, -21.94, "Reykjavík", 5)
+    assert store.get_subscription_columns()["cell"].tolist() == cell_id([64.1, 65.7], [-21.9, -18.1]).tolist()
+
+
+def test_concurrent_saves_of_a_location_make_one_subscription(store):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ids = list(
+            executor.map(lambda i: store.save_subscription("a@example.com", "A", 64.1, -21.9, "Reykjavik", i), range(8))
+        )
+
+    assert len(set(ids)) == 1
+    assert len(store.get_all_subscriptions()) == 1
+
+
+def test_bulk_load_and_stream_columns(store):
+    rows = [(f"{i}@example.com", "A", 64.1, -21.9 + i, "Reykjavik", i % 10) for i in range(25)]
+    assert store.bulk_load_subscriptions(rows) == 25
+
+    sent_at = datetime(2025, 1, 1, 22, 30)
+    store.bulk_update_last_alert_sent([1, 2], sent_at)
+
+    chunks = list(store.iter_subscriptions(batch_size=10, after_id=2, max_id=24))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 2]
+    cols = store.get_subscription_columns(max_id=3)
+    assert cols["last_alert"].tolist() == [to_epoch(sent_at)] * 2 + [0]
+    assert store.get_subscriptions_by_ids([2, 5])[0].last_alert_sent == sent_at
+
+    tile = int(tile_index(64.1, -21.9))
+    assert store.get_subscription_columns({3: [tile]})["id"].tolist() == [1, 2]
+    assert len(store.get_subscription_columns({})) == 0
+
+
+def test_pending_marks(store):
+    for i in range(4):
+        store.save_subscription(f"{i}@example.com", "A", 64.1, -21.9, "Reykjavik", 3)
+    assert len(store.get_subscription_columns(pending=True)) == 0
+
+    # Updates mark a subscription, confirmed alerts and sweeps that started after the mark clear it
+    store.save_subscription("0@example.com", "A", 64.1, -21.9, "Reykjavik", 2)
+    store.mark_pending([2, 3, 4], 1000)
+    store.bulk_update_last_alert_sent([2], datetime(2025, 1, 1, 22, 30))
+    store.clear_pending(3, None, 1001)
+    store.clear_pending(0, 3, 900)
+    assert store.get_subscription_columns(pending=True)["id"].tolist() == [1, 3]
+    assert [len(chunk) for chunk in store.iter_subscriptions(batch_size=1, after_id=1, pending=True)] == [1]
+
+
+def test_sweep_state_roundtrip(store):
+    assert store.load_sweep_state() == SweepState()
+
+    grid = np.zeros(GRID_SHAPE, dtype=np.uint8)
+    grid[154, 338] = 9
+    store.save_sweep_state(SweepState(forecast_time="2025-01-01T00:30:00Z", grid=grid, high_water=7))
+    store.save_sweep_state(SweepState(forecast_time="2025-01-01T00:35:00Z", grid=grid, cursor=3, high_water=7))
+
+    state = store.load_sweep_state()
+    assert (state.forecast_time, state.cursor, state.high_water) == ("2025-01-01T00:35:00Z", 3, 7)
+    assert np.array_equal(state.grid, grid)
+
+
+def test_sqlite_close_reaches_every_thread(tmp_path):
+    path = str(tmp_path / "threads.db")
+    store = SQLiteStore(path)
+    store.init_schema()
+    # A thread that used the store and finished without closing its connection
+    worker = threading.Thread(target=store.get_max_subscription_id)
+    worker.start()
+    worker.join()
+
+    store.close()
+    assert os.listdir(tmp_path) == ["threads.db"]  # no -wal/-shm left open
+    assert store.get_max_subscription_id() == 0  # and the store reopens on next use
+    store.close()